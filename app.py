@@ -3,17 +3,36 @@ Astro Consensus Engine - Streamlit Web Interface
 Simple chat-based UI for users to interact with the system
 """
 
+import os
+import re
+import time
 import streamlit as st
 from datetime import datetime
 from astro_engine import AstroEngine
 from env_loader import get_api_key
-from country_utils import detect_country_from_phone, get_coordinates
-from otp_service import OTPService
-from session_manager import SessionManager
+from country_utils import detect_country_from_phone
+from geocoder import resolve_place
+from place_autocomplete import get_autocomplete
+from chat_store import get_chat_store
+from photo_store import PHOTO_SYSTEMS, get_photo_store
+from otp_service import get_otp_service
+from session_manager import get_session_manager
+from user_registration import UserSnapshot
 
 # Initialize services
-otp_service = OTPService()
-session_manager = SessionManager()
+otp_service = get_otp_service()  # process-wide, pending OTPs live in memory
+session_manager = get_session_manager()  # process-wide, survives reruns
+chat_store = get_chat_store()  # persisted transcripts, paged into session state
+
+# Messages kept in st.session_state.chat_history; older ones are read from
+# chat_store a page at a time, so a rerun costs the same however long the
+# conversation gets
+CHAT_PAGE_SIZE = 20
+
+# Reverse proxies in front of the app, each appending one X-Forwarded-For
+# hop; earlier hops are whatever the client sent. X-Real-Ip is only trusted
+# when the proxy is known to set it (TRUST_X_REAL_IP=true).
+TRUSTED_PROXY_HOPS = int(os.getenv('TRUSTED_PROXY_HOPS', '1'))
 
 # Shared country list - used in both login and registration
 ALL_COUNTRIES = [
@@ -189,6 +208,10 @@ def init_engine():
 
 engine = init_engine()
 
+# Users for this rerun: each is read from the store once, and again only
+# after a write made during the rerun
+user_snapshot = UserSnapshot(engine.db)
+
 # Session state for login
 if 'phone' not in st.session_state:
     st.session_state.phone = None
@@ -208,15 +231,31 @@ if 'temp_reg_data' not in st.session_state:
     st.session_state.temp_reg_data = {}
 if 'current_otp' not in st.session_state:
     st.session_state.current_otp = None
+if 'chat_job_id' not in st.session_state:
+    st.session_state.chat_job_id = None  # answer being generated in the background
+if 'chat_job_error' not in st.session_state:
+    st.session_state.chat_job_error = None
+if 'chat_browse_before' not in st.session_state:
+    st.session_state.chat_browse_before = None  # viewing the page before this message index
 
 # Helper functions for OTP and sessions
+def client_ip():
+    """Client IP as recorded by the outermost trusted proxy, or None"""
+    headers = st.context.headers
+    hops = [hop.strip() for hop in (headers.get('X-Forwarded-For') or '').split(',') if hop.strip()]
+    if TRUSTED_PROXY_HOPS and len(hops) >= TRUSTED_PROXY_HOPS:
+        return hops[-TRUSTED_PROXY_HOPS]
+    if os.getenv('TRUST_X_REAL_IP') == 'true':
+        return headers.get('X-Real-Ip')
+    return None
+
 def send_otp(phone):
     """Send OTP to phone number"""
     # Extract country code from phone (everything before the main number)
     # For +919876543210, country_code is +91
     country_code = phone[:3] if phone.startswith('+91') else phone[:2]
     
-    result = otp_service.send_otp(phone, country_code)
+    result = otp_service.send_otp(phone, country_code, ip_address=client_ip())
     success, message, dev_otp = result
     
     if success:
@@ -242,20 +281,26 @@ def verify_otp(phone, otp_code):
 
 def create_session(phone):
     """Create new session for user"""
-    user = engine.db.get_user(phone)
+    user = user_snapshot.get(phone)
     if not user:
         return None
     
-    tier = user.get('subscription', 'FREE')
+    tier = engine.payments.get_active_tier(phone) or user.get('subscription', 'FREE')
     success, message, session_token = session_manager.create_session(
         phone=phone,
-        tier=tier
+        tier=tier,
+        user_agent=st.context.headers.get('User-Agent') or "Unknown",
+        ip_address=client_ip() or "0.0.0.0"
     )
     
     if success:
         st.session_state.session_token = session_token
         st.session_state.phone = phone
         
+        # Pick the conversation up where it was left, on any device
+        st.session_state.chat_history = chat_store.page(phone, limit=CHAT_PAGE_SIZE)
+        st.session_state.chat_browse_before = None
+        
         # Check if user had selected an upgrade plan before login
         if hasattr(st.session_state, 'pending_upgrade') and st.session_state.pending_upgrade:
             # User clicked upgrade button before logging in
@@ -283,8 +328,145 @@ def logout():
         del st.session_state.current_otp
     if 'pending_question' in st.session_state:
         del st.session_state.pending_question
+    if st.session_state.chat_job_id:
+        engine.jobs.discard(st.session_state.chat_job_id)
+    st.session_state.chat_job_id = None
+    st.session_state.chat_job_error = None
+    st.session_state.chat_browse_before = None
+    st.rerun()
+
+# Chat answers run on the engine's job executor; the page polls for them
+CHAT_PROGRESS_STEPS = [
+    ("🔮 Analyzing your cosmic blueprint...", 0),
+    ("✓ Loading birth chart data", 10),
+    ("⏳ Consulting Vedic Astrology...", 20),
+    ("⏳ Cross-checking KP System...", 35),
+    ("⏳ Analyzing Western perspective...", 50),
+    ("⏳ Interpreting Chinese elements...", 65),
+    ("⏳ Decoding Mayan calendar...", 80),
+    ("⏳ Synthesizing 5-system consensus...", 90),
+    ("⏳ Generating personalized insights...", 95),
+]
+
+def add_chat_message(role, content):
+    """Persist a message and keep only the latest page in session state"""
+    index = chat_store.append(st.session_state.phone, role, content)
+    st.session_state.chat_history.append({
+        "index": index,
+        "role": role,
+        "content": content
+    })
+    st.session_state.chat_history = st.session_state.chat_history[-CHAT_PAGE_SIZE:]
+
+def submit_chat_question(prompt):
+    """Add the question to the chat and start answering it in the background"""
+    add_chat_message("user", prompt)
+    st.session_state.follow_up_options = []
+    st.session_state.chat_job_error = None
+    st.session_state.chat_job_id = engine.submit_question(
+        st.session_state.phone,
+        prompt,
+        conversation_history=st.session_state.chat_history,
+        user=user_snapshot.get(st.session_state.phone)
+    )
+
+def extract_follow_ups(response):
+    """Follow-up options in the answer (format: • [Option text])"""
+    follow_ups = re.findall(r'•\s*\[([^\]]+)\]', response)
+    
+    # If AI didn't generate follow-ups, provide generic ones
+    if not follow_ups:
+        follow_ups = [
+            "What timing is best for this?",
+            "What obstacles should I watch for?",
+            "How can I prepare or maximize this?"
+        ]
+    return follow_ups[:3]
+
+@st.fragment(run_every=1.0)
+def chat_job_panel():
+    """
+    Progress for the answer being generated
+    
+    Runs on its own every second, so the rest of the page stays usable
+    and a full rerun just picks the same job up again. When the job
+    finishes the answer goes into the chat history and the app reruns.
+    """
+    job = engine.jobs.get(st.session_state.chat_job_id, owner=st.session_state.phone)
+    
+    if job is None:
+        # Expired, or lost in a server restart
+        st.session_state.chat_job_id = None
+        st.session_state.chat_job_error = {
+            'success': False,
+            'response': 'Your answer was interrupted. Please ask again.'
+        }
+        st.rerun()
+    
+    if job['finished_at'] is None:
+        elapsed = time.time() - job['submitted_at']
+        step_text, progress_value = CHAT_PROGRESS_STEPS[min(int(elapsed // 2), len(CHAT_PROGRESS_STEPS) - 1)]
+        with st.chat_message("assistant"):
+            st.progress(progress_value / 100, text=step_text)
+        return
+    
+    engine.jobs.discard(job['id'])
+    st.session_state.chat_job_id = None
+    
+    if job['status'] == 'failed':
+        result = {'success': False, 'response': f"API Error: {job['error']}"}
+    else:
+        result = job['result']
+    
+    if result['success']:
+        st.session_state.follow_up_options = extract_follow_ups(result['response'])
+        add_chat_message("assistant", result['response'])
+    else:
+        st.session_state.chat_job_error = result
+    
+    # Full rerun to display the answer and follow-up buttons
     st.rerun()
 
+def show_chat_error(result):
+    """User-friendly message for a failed answer"""
+    error_response = result.get('response', '')
+    error_type = result.get('error_type', 'unknown')
+    
+    with st.chat_message("assistant"):
+        if error_response == 'AI_OVERLOADED' or error_type == 'overload':
+            st.warning("### ⚠️ AI Service Temporarily Busy")
+            st.info("""
+            Our AI is experiencing high demand right now. This happens when many users are asking questions simultaneously.
+            
+            **Please try again in 30-60 seconds.**
+            
+            Your question has NOT been counted against your quota.
+            """)
+            
+            if st.button("🔄 Try Again", key="retry_overload", use_container_width=True):
+                st.rerun()
+        
+        elif error_response == 'QUOTA_EXCEEDED' or error_type == 'quota':
+            st.error("### ❌ Daily Quota Reached")
+            st.info("""
+            We've reached our daily AI request limit. 
+            
+            **Options:**
+            1. Wait until tomorrow (resets at midnight UTC)
+            2. Upgrade to BASIC plan for priority access
+            """)
+            
+            if st.button("⭐ View Plans", key="upgrade_quota", use_container_width=True):
+                st.info("Scroll down to see pricing plans!")
+        
+        else:
+            st.error("### ❌ Unexpected Error")
+            st.warning(f"Something went wrong: {error_response}")
+            st.info("Please try again or contact support if the problem persists.")
+            
+            if st.button("🔄 Try Again", key="retry_error", use_container_width=True):
+                st.rerun()
+
 # Header
 st.title("🧭 Astro Consensus Compass")
 st.caption("Your Cosmic Guide • 5 Core Systems (Vedic, KP, Western, Chinese, Mayan) + 11 Optional Systems")
@@ -328,7 +510,7 @@ with st.sidebar:
             with col1:
                 if st.button("Send OTP", use_container_width=True, key="login_send_otp"):
                     if phone_input:
-                        user = engine.db.get_user(phone_input)
+                        user = user_snapshot.get(phone_input)
                         if user:
                             if send_otp(phone_input):
                                 st.rerun()
@@ -390,6 +572,22 @@ with st.sidebar:
             # Show preview
             st.info(f"**Country Code:** {country_code} | **Languages:** {', '.join(available_languages)}")
             
+            # Birth place search (outside the form so suggestions refresh as you type)
+            place_query = st.text_input(
+                "Search Birth Place",
+                placeholder="Start typing: Ongole, విజయవాడ, बेंगलुरु...",
+                key="birth_place_query"
+            )
+            place_choice = None
+            if place_query:
+                suggestions = get_autocomplete().suggest(place_query, limit=6)
+                if suggestions:
+                    labels = [s['label'] for s in suggestions]
+                    chosen = st.selectbox("Matching places", options=labels, key="birth_place_choice")
+                    place_choice = suggestions[labels.index(chosen)]
+                else:
+                    st.caption("No matching places found - enter your birth city below")
+            
             # STEP 2: Rest of form
             with st.form("registration_form"):
                 name = st.text_input("Full Name*")
@@ -424,8 +622,16 @@ with st.sidebar:
                     tob = f"{hour:02d}:{minute:02d}"
                 
                 # Place details
-                place_city = st.text_input("Birth Village/Town/City*", placeholder="Hyderabad")
-                place_state = st.text_input("Birth State/Province (optional)", placeholder="Telangana")
+                place_city = st.text_input(
+                    "Birth Village/Town/City*",
+                    value=place_choice['name'] if place_choice else '',
+                    placeholder="Hyderabad"
+                )
+                place_state = st.text_input(
+                    "Birth State/Province (optional)",
+                    value=(place_choice['admin1'] or '') if place_choice else '',
+                    placeholder="Telangana"
+                )
                 
                 # Language selection
                 preferred_language = st.selectbox(
@@ -493,9 +699,12 @@ with st.sidebar:
                 
                 # Photo upload for palmistry/face reading
                 palm_photo = None
-                if 'Palmistry' in premium_systems:
+                face_photo = None
+                if PHOTO_SYSTEMS['palm'] in premium_systems:
                     st.info("📸 **Palmistry Requirements:**\n- Upload clear photos of both palms\n- Place small stickers on fingertips (to avoid storing fingerprints)\n- Ensure all palm lines are visible")
                     palm_photo = st.file_uploader("Upload Palm Photos (Left & Right)", accept_multiple_files=True, type=['jpg', 'jpeg', 'png'])
+                if PHOTO_SYSTEMS['face'] in premium_systems:
+                    face_photo = st.file_uploader("Upload Face Photo (front, good light)", accept_multiple_files=False, type=['jpg', 'jpeg', 'png'])
                 
                 # DISCLAIMER
                 st.divider()
@@ -513,8 +722,12 @@ with st.sidebar:
                 **User Responsibility:** By registering, you acknowledge this service is for strategic guidance and entertainment purposes only.
                 """)
                 
-                # Combine place
-                if place_state:
+                # Combine place: a picked suggestion carries the real birth country,
+                # otherwise the phone's country is appended (the engine may drop it)
+                appended_country = None if place_choice and place_city == place_choice['name'] else country_name
+                if not appended_country:
+                    place = place_choice['label']
+                elif place_state:
                     place = f"{place_city}, {place_state}, {country_name}"
                 else:
                     place = f"{place_city}, {country_name}"
@@ -523,15 +736,14 @@ with st.sidebar:
                 
                 if submitted:
                     if name and phone_number and place_city:
-                        # Get coordinates
-                        lat, lon = get_coordinates(place_city, country_name)
-                        
+                        # Engine geocodes the place and rejects unknown ones
                         result = engine.register_user(
                             phone=reg_phone,
                             name=name,
                             dob=dob.strftime("%Y-%m-%d"),
                             tob=tob,
-                            place=place
+                            place=place,
+                            residence_country=appended_country
                         )
                         
                         if result['success']:
@@ -543,11 +755,21 @@ with st.sidebar:
                                 'subscription': required_tier
                             })
                             
-                            # TODO: Save palm photos if uploaded
-                            # if palm_photo:
-                            #     save_palm_photos(reg_phone, palm_photo)
+                            # Store uploaded photos (streamed, deduplicated, quota-checked)
+                            photo_problems = []
+                            uploads = [('palm', photo) for photo in (palm_photo or [])]
+                            if face_photo:
+                                uploads.append(('face', face_photo))
+                            for kind, photo in uploads:
+                                saved, message, _ = get_photo_store().save(
+                                    reg_phone, photo, kind, required_tier, filename=photo.name
+                                )
+                                if not saved:
+                                    photo_problems.append(f"{photo.name}: {message}")
                             
                             success_msg = result['message']
+                            if photo_problems:
+                                success_msg += "\n\n📸 Some photos weren't saved:\n- " + "\n- ".join(photo_problems)
                             if required_price:
                                 success_msg += f"\n\n💳 **Subscription required:** {required_price} to activate selected premium systems."
                             
@@ -562,7 +784,7 @@ with st.sidebar:
     
     else:
         # User logged in
-        user = engine.db.get_user(st.session_state.phone)
+        user = user_snapshot.get(st.session_state.phone)
         
         st.success(f"Welcome, {user['name']}! 👋")
         
@@ -606,7 +828,7 @@ with st.sidebar:
                     new_tob = f"{new_hour:02d}:{new_minute:02d}"
                 
                 # Place
-                new_place = st.text_input("Place of Birth", value=user['birth_details']['place'])
+                new_place = st.text_input("Place of Birth", value=user['birth_details'].get('place') or user['birth_details'].get('city') or '')
                 
                 # Language
                 available_langs = ['English', 'Hindi', 'Telugu', 'Tamil', 'Kannada', 'Malayalam', 
@@ -619,24 +841,41 @@ with st.sidebar:
                 
                 with col_save:
                     if st.form_submit_button("💾 Save Changes", use_container_width=True):
-                        # Update user
-                        updates = {
-                            'name': new_name,
-                            'email': new_email,
-                            'birth_details': {
-                                'dob': new_dob.strftime('%Y-%m-%d'),
-                                'tob': new_tob,
-                                'place': new_place,
-                                'lat': user['birth_details']['lat'],  # Keep existing
-                                'lon': user['birth_details']['lon']   # Keep existing
-                            },
-                            'language': new_language
+                        birth_details = {
+                            **user['birth_details'],
+                            'dob': new_dob.strftime('%Y-%m-%d'),
+                            'tob': new_tob,
+                            'place': new_place
                         }
                         
-                        engine.db.update_user(st.session_state.phone, updates)
-                        st.success("✅ Profile updated successfully!")
-                        st.session_state.show_profile_editor = False
-                        st.rerun()
+                        # Re-geocode only when the place actually changed
+                        location = None
+                        if new_place != user['birth_details'].get('place'):
+                            location = resolve_place(new_place)
+                            if location:
+                                birth_details.update({
+                                    'city': location['name'],
+                                    'state': location['admin1'],
+                                    'country': location['country'],
+                                    'timezone': location['timezone'],
+                                    'lat': location['lat'],
+                                    'lon': location['lon']
+                                })
+                        
+                        if new_place != user['birth_details'].get('place') and location is None:
+                            st.error(f"❌ Couldn't find '{new_place}'. Please check the spelling or enter a nearby larger town.")
+                        else:
+                            updates = {
+                                'name': new_name,
+                                'email': new_email,
+                                'birth_details': birth_details,
+                                'language': new_language
+                            }
+                            
+                            engine.db.update_user(st.session_state.phone, updates)
+                            st.success("✅ Profile updated successfully!")
+                            st.session_state.show_profile_editor = False
+                            st.rerun()
                 
                 with col_cancel:
                     if st.form_submit_button("❌ Cancel", use_container_width=True):
@@ -672,7 +911,7 @@ with st.sidebar:
 
 # Main chat interface
 if st.session_state.phone:
-    user = engine.db.get_user(st.session_state.phone)
+    user = user_snapshot.get(st.session_state.phone)
     
     # Check if user has pending upgrade (clicked upgrade before login)
     if hasattr(st.session_state, 'show_upgrade_modal') and st.session_state.show_upgrade_modal:
@@ -714,14 +953,44 @@ if st.session_state.phone:
     chat_container = st.container()
     
     with chat_container:
-        # Note: Chat history is currently session-only
-        # TODO: Implement persistent chat history storage in database
-        if len(st.session_state.chat_history) > 0:
-            st.caption(f"💬 {len(st.session_state.chat_history)//2} questions in this session")
+        history = st.session_state.chat_history
+        if history:
+            st.caption(f"💬 {chat_store.count(st.session_state.phone)//2} questions so far")
+        
+        # Earlier messages, one page at a time from the transcript store
+        if history and history[0]['index'] > 0:
+            browse_before = st.session_state.chat_browse_before
+            if browse_before is None:
+                if st.button("⬆️ Show earlier messages", key="chat_show_earlier"):
+                    st.session_state.chat_browse_before = history[0]['index']
+                    st.rerun()
+            else:
+                earlier = chat_store.page(st.session_state.phone, before=browse_before, limit=CHAT_PAGE_SIZE)
+                with st.expander(f"Earlier messages ({earlier[0]['index'] + 1}-{browse_before})", expanded=True):
+                    for message in earlier:
+                        with st.chat_message(message["role"]):
+                            st.markdown(message["content"])
+                    
+                    col1, col2 = st.columns(2)
+                    with col1:
+                        if earlier[0]['index'] > 0 and st.button("⬆️ Older", key="chat_older", use_container_width=True):
+                            st.session_state.chat_browse_before = earlier[0]['index']
+                            st.rerun()
+                    with col2:
+                        if st.button("Hide", key="chat_hide_earlier", use_container_width=True):
+                            st.session_state.chat_browse_before = None
+                            st.rerun()
         
         for message in st.session_state.chat_history:
             with st.chat_message(message["role"]):
                 st.markdown(message["content"])
+        
+        # Answer in progress, or why the last one failed
+        if st.session_state.chat_job_id:
+            chat_job_panel()
+        elif st.session_state.chat_job_error:
+            show_chat_error(st.session_state.chat_job_error)
+            st.session_state.chat_job_error = None
     
     # Welcome insights and suggested questions
     # Only show if no chat history AND no pending question
@@ -786,7 +1055,8 @@ Be SPECIFIC, include TIMING, keep it brief."""
                 welcome_result = engine.ask_question(
                     st.session_state.phone,
                     welcome_prompt,
-                    conversation_history=[]
+                    conversation_history=[],
+                    user=user_snapshot.get(st.session_state.phone)
                 )
             except Exception as e:
                 welcome_result = {
@@ -893,7 +1163,8 @@ Keep each to ONE sentence. Be specific and practical."""
                         today_result = engine.ask_question(
                             st.session_state.phone,
                             today_prompt,
-                            conversation_history=[]
+                            conversation_history=[],
+                            user=user_snapshot.get(st.session_state.phone)
                         )
                     except Exception as e:
                         today_result = {
@@ -956,8 +1227,8 @@ Keep each to ONE sentence. Be specific and practical."""
         
         st.markdown("---")
     
-    # Process pending question ONCE
-    if hasattr(st.session_state, 'pending_question') and st.session_state.pending_question:
+    # Process pending question ONCE (left queued while an answer is in progress)
+    if st.session_state.get('pending_question') and not st.session_state.chat_job_id:
         prompt = st.session_state.pending_question
         del st.session_state.pending_question  # Delete immediately to prevent re-processing
         
@@ -1000,7 +1271,7 @@ Keep each to ONE sentence. Be specific and practical."""
         # Flag as family question if either keywords OR DOB patterns detected
         is_family_question = is_family_question or has_other_dob
         
-        user = engine.db.get_user(st.session_state.phone)
+        user = user_snapshot.get(st.session_state.phone)
         user_questions_left = user.get('questions_left', 0)
         
         # Only block family questions if user has NO questions left AND not on FAMILY plan
@@ -1037,130 +1308,8 @@ Keep each to ONE sentence. Be specific and practical."""
         
         else:
             # Process the question normally (either not family question, OR user has questions left)
-            # Add to history
-            st.session_state.chat_history.append({
-                "role": "user",
-                "content": prompt
-            })
-            
-            # Display user message
-            with st.chat_message("user"):
-                st.markdown(prompt)
-            
-            # Get AI response
-            with st.chat_message("assistant"):
-                # Show progress IMMEDIATELY
-                progress_placeholder = st.empty()
-                progress_placeholder.progress(0, text="🔮 Analyzing your cosmic blueprint...")
-                
-                import time
-                time.sleep(0.1)  # Tiny delay to ensure UI updates
-                
-                steps = [
-                    ("🔮 Analyzing your cosmic blueprint...", 0),
-                    ("✓ Loading birth chart data", 10),
-                    ("⏳ Consulting Vedic Astrology...", 20),
-                    ("⏳ Cross-checking KP System...", 35),
-                    ("⏳ Analyzing Western perspective...", 50),
-                    ("⏳ Interpreting Chinese elements...", 65),
-                    ("⏳ Decoding Mayan calendar...", 80),
-                    ("⏳ Synthesizing 5-system consensus...", 90),
-                    ("⏳ Generating personalized insights...", 95),
-                ]
-                
-                # Show ALL steps for 2 seconds each so users can read
-                for step_text, progress_value in steps:
-                    progress_placeholder.progress(progress_value / 100, text=step_text)
-                    time.sleep(2.0)  # 2 seconds per step
-                    
-                    # Make API call during "synthesizing" step
-                    if "Synthesizing" in step_text:
-                        result = engine.ask_question(
-                            st.session_state.phone,
-                            prompt,
-                            conversation_history=st.session_state.chat_history
-                        )
-                
-                # Final completion
-                progress_placeholder.progress(1.0, text="✅ Analysis complete!")
-                time.sleep(0.5)
-                
-                # Clear progress
-                progress_placeholder.empty()
-                
-                if result['success']:
-                    response = result['response']
-                    
-                    # Extract follow-up options (format: • [Option text])
-                    import re
-                    follow_up_pattern = r'•\s*\[([^\]]+)\]'
-                    follow_ups = re.findall(follow_up_pattern, response)
-                    
-                    # If AI didn't generate follow-ups, provide generic ones
-                    if not follow_ups:
-                        follow_ups = [
-                            "What timing is best for this?",
-                            "What obstacles should I watch for?",
-                            "How can I prepare or maximize this?"
-                        ]
-                    
-                    # Store follow-ups for button display
-                    st.session_state.follow_up_options = follow_ups[:3]
-                    
-                    # Remove entire follow-up section from main response for cleaner display
-                    clean_response = response
-                    # Remove "What would you like..." line and all bullet points after it
-                    clean_response = re.sub(r'What would you like to explore next\?.*', '', clean_response, flags=re.DOTALL)
-                    clean_response = clean_response.strip()
-                    
-                    # Display cleaned response
-                    st.markdown(clean_response)
-                    
-                    st.session_state.chat_history.append({
-                        "role": "assistant",
-                        "content": response
-                    })
-                    
-                    # Force rerun to display follow-up buttons
-                    st.rerun()
-                else:
-                    # Handle different error types with user-friendly messages
-                    error_response = result.get('response', '')
-                    error_type = result.get('error_type', 'unknown')
-                    
-                    if error_response == 'AI_OVERLOADED' or error_type == 'overload':
-                        st.warning("### ⚠️ AI Service Temporarily Busy")
-                        st.info("""
-                        Our AI is experiencing high demand right now. This happens when many users are asking questions simultaneously.
-                        
-                        **Please try again in 30-60 seconds.**
-                        
-                        Your question has NOT been counted against your quota.
-                        """)
-                        
-                        if st.button("🔄 Try Again", key="retry_overload", use_container_width=True):
-                            st.rerun()
-                    
-                    elif error_response == 'QUOTA_EXCEEDED' or error_type == 'quota':
-                        st.error("### ❌ Daily Quota Reached")
-                        st.info("""
-                        We've reached our daily AI request limit. 
-                        
-                        **Options:**
-                        1. Wait until tomorrow (resets at midnight UTC)
-                        2. Upgrade to BASIC plan for priority access
-                        """)
-                        
-                        if st.button("⭐ View Plans", key="upgrade_quota", use_container_width=True):
-                            st.info("Scroll down to see pricing plans!")
-                    
-                    else:
-                        st.error("### ❌ Unexpected Error")
-                        st.warning(f"Something went wrong: {error_response}")
-                        st.info("Please try again or contact support if the problem persists.")
-                        
-                        if st.button("🔄 Try Again", key="retry_error", use_container_width=True):
-                            st.rerun()
+            submit_chat_question(prompt)
+            st.rerun()
     
     # Display follow-up buttons if AI generated them (AFTER all processing)
     if hasattr(st.session_state, 'follow_up_options'):
@@ -1187,7 +1336,7 @@ Keep each to ONE sentence. Be specific and practical."""
             st.markdown("---")
     
     # Chat input
-    if prompt := st.chat_input("Ask your cosmic question..."):
+    if prompt := st.chat_input("Ask your cosmic question...", disabled=bool(st.session_state.chat_job_id)):
         # Check for family member questions BEFORE processing
         family_keywords = [
             'wife', 'husband', 'spouse', 'partner', 'girlfriend', 'boyfriend', 
@@ -1219,7 +1368,7 @@ Keep each to ONE sentence. Be specific and practical."""
         has_other_dob = any(re.search(pattern, prompt.lower()) for pattern in dob_patterns)
         is_family_question = is_family_question or has_other_dob
         
-        user = engine.db.get_user(st.session_state.phone)
+        user = user_snapshot.get(st.session_state.phone)
         user_questions_left = user.get('questions_left', 0)
         
         # Only block if NO questions left AND not on FAMILY plan
@@ -1254,137 +1403,10 @@ Keep each to ONE sentence. Be specific and practical."""
                 if st.button("📝 Ask About Myself", key="ask_self_chat", use_container_width=True):
                     st.info("Please ask about your own birth chart!")
         else:
-            # Process question normally
-            # Add user message to chat
-            st.session_state.chat_history.append({
-                "role": "user",
-                "content": prompt
-            })
-            
-            with st.chat_message("user"):
-                st.markdown(prompt)
-            
-            # Get AI response
-            with st.chat_message("assistant"):
-                # Visual progress showing 5-system analysis
-                progress_placeholder = st.empty()
-                
-                steps = [
-                    ("🔮 Analyzing your cosmic blueprint...", 0),
-                    ("✓ Loading birth chart data", 10),
-                    ("⏳ Consulting Vedic Astrology...", 20),
-                    ("⏳ Cross-checking KP System...", 35),
-                    ("⏳ Analyzing Western perspective...", 50),
-                    ("⏳ Interpreting Chinese elements...", 65),
-                    ("⏳ Decoding Mayan calendar...", 80),
-                    ("⏳ Synthesizing 5-system consensus...", 90),
-                    ("⏳ Generating personalized insights...", 95),
-                ]
-                
-                import time
-                
-                # Show ALL steps for 2 seconds each so users can read
-                for step_text, progress_value in steps:
-                    progress_placeholder.progress(progress_value / 100, text=step_text)
-                    time.sleep(2.0)  # 2 seconds per step
-                    
-                    # Make API call during "synthesizing" step
-                    if "Synthesizing" in step_text:
-                        result = engine.ask_question(
-                            st.session_state.phone,
-                            prompt,
-                            conversation_history=st.session_state.chat_history
-                        )
-                
-                # Final completion
-                progress_placeholder.progress(1.0, text="✅ Analysis complete!")
-                time.sleep(0.5)
-                
-                # Clear progress and show response
-                progress_placeholder.empty()
-                
-                # Display result
-                
-                if result['success']:
-                    response = result['response']
-                    
-                    # Extract follow-up options (format: • [Option text])
-                    import re
-                    follow_up_pattern = r'•\s*\[([^\]]+)\]'
-                    follow_ups = re.findall(follow_up_pattern, response)
-                    
-                    # If AI didn't generate follow-ups, provide generic ones
-                    if not follow_ups:
-                        follow_ups = [
-                            "What timing is best for this?",
-                            "What obstacles should I watch for?",
-                            "How can I prepare or maximize this?"
-                        ]
-                    
-                    # Store follow-ups for button display
-                    st.session_state.follow_up_options = follow_ups[:3]
-                    
-                    # Remove entire follow-up section from main response
-                    clean_response = response
-                    clean_response = re.sub(r'What would you like to explore next\?.*', '', clean_response, flags=re.DOTALL)
-                    clean_response = clean_response.strip()
-                    
-                    # Display cleaned response
-                    st.markdown(clean_response)
-                    
-                    # Add to chat history
-                    st.session_state.chat_history.append({
-                        "role": "assistant",
-                        "content": response
-                    })
-                    
-                    # Auto-scroll to bottom using JavaScript
-                    st.markdown("""
-                    <script>
-                    window.scrollTo(0, document.body.scrollHeight);
-                    </script>
-                    """, unsafe_allow_html=True)
-                    
-                    # Force rerun to display follow-up buttons
-                    st.rerun()
-                else:
-                    # Handle different error types with user-friendly messages
-                    error_response = result.get('response', '')
-                    error_type = result.get('error_type', 'unknown')
-                    
-                    if error_response == 'AI_OVERLOADED' or error_type == 'overload':
-                        st.warning("### ⚠️ AI Service Temporarily Busy")
-                        st.info("""
-                        Our AI is experiencing high demand right now. This happens when many users are asking questions simultaneously.
-                        
-                        **Please try again in 30-60 seconds.**
-                        
-                        Your question has NOT been counted against your quota.
-                        """)
-                        
-                        if st.button("🔄 Try Again", key="retry_overload_chat", use_container_width=True):
-                            st.rerun()
-                    
-                    elif error_response == 'QUOTA_EXCEEDED' or error_type == 'quota':
-                        st.error("### ❌ Daily Quota Reached")
-                        st.info("""
-                        We've reached our daily AI request limit. 
-                        
-                        **Options:**
-                        1. Wait until tomorrow (resets at midnight UTC)
-                        2. Upgrade to BASIC plan for priority access
-                        """)
-                        
-                        if st.button("⭐ View Plans", key="upgrade_quota_chat", use_container_width=True):
-                            st.info("Scroll down to see pricing plans!")
-                    
-                    else:
-                        st.error("### ❌ Unexpected Error")
-                        st.warning(f"Something went wrong: {error_response}")
-                        st.info("Please try again or contact support if the problem persists.")
-                        
-                        if st.button("🔄 Try Again", key="retry_error_chat", use_container_width=True):
-                            st.rerun()
+            # Process question normally; the answer is generated in the
+            # background and shown by chat_job_panel()
+            submit_chat_question(prompt)
+            st.rerun()
 
 else:
     # Not logged in - show welcome
@@ -1651,3 +1673,6 @@ else:
 # Footer
 st.divider()
 st.caption("Built with ❤️ • Powered by Gemini AI • Your data is private & secure")
+
+# Store reads this rerun (reruns cut short by st.rerun() aren't counted)
+st.session_state.user_store_reads = user_snapshot.reads
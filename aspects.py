@@ -0,0 +1,107 @@
+"""
+Transit Aspects
+Every transit-to-natal angle in one NumPy matrix, reduced to the
+tightest aspects
+"""
+
+from typing import Dict, List, Optional
+
+import numpy as np
+
+# Aspect angles in degrees, and default orbs for transits to natal points
+ASPECTS = {'conjunction': 0, 'sextile': 60, 'square': 90, 'trine': 120, 'opposition': 180}
+DEFAULT_ORBS = {'conjunction': 3.0, 'sextile': 2.0, 'square': 3.0, 'trine': 3.0, 'opposition': 3.0}
+
+DEFAULT_LIMIT = 12
+
+_NAMES = list(ASPECTS)
+_ANGLES = np.array([ASPECTS[name] for name in _NAMES], dtype=float)
+
+
+def aspect_matrix(transit_longitudes, natal_longitudes,
+                  orbs: Optional[Dict[str, float]] = None):
+    """
+    Closest aspect between every transit and natal longitude
+
+    Args:
+        transit_longitudes: (T,) degrees
+        natal_longitudes: (N,) degrees
+        orbs: {aspect: max orb}, merged over DEFAULT_ORBS; 0 disables one
+
+    Returns:
+        (kind, orb) arrays of shape (T, N): index into ASPECTS of the
+        closest aspect and its exactness in degrees; kind is -1 where
+        no aspect is within orb
+    """
+    orbs = {**DEFAULT_ORBS, **(orbs or {})}
+    limits = np.array([orbs[name] for name in _NAMES], dtype=float)
+
+    transit = np.asarray(transit_longitudes, dtype=float)
+    natal = np.asarray(natal_longitudes, dtype=float)
+    separation = np.abs(np.mod(transit[:, None] - natal[None, :] + 180, 360.0) - 180)   # (T, N) in [0, 180]
+    deviation = np.abs(separation[..., None] - _ANGLES)                                   # (T, N, A)
+
+    # Only aspects within their own orb compete for "closest"
+    deviation = np.where(deviation <= limits, deviation, np.inf)
+    kind = np.argmin(deviation, axis=-1)
+    orb = np.take_along_axis(deviation, kind[..., None], axis=-1)[..., 0]
+    return np.where(np.isfinite(orb), kind, -1), orb
+
+
+def top_aspects(transits: Dict[str, Dict], natal: Dict[str, Dict],
+                orbs: Optional[Dict[str, float]] = None,
+                limit: int = DEFAULT_LIMIT) -> List[Dict]:
+    """
+    The tightest transit-to-natal aspects
+
+    Args:
+        transits, natal: {name: {'longitude': sidereal degrees, ...}}
+
+    Returns:
+        [{'transit': str, 'natal': str, 'aspect': str, 'orb': float}]
+        sorted by orb, at most `limit` long
+    """
+    transit_names, natal_names = list(transits), list(natal)
+    kind, orb = aspect_matrix(
+        [transits[name]['longitude'] for name in transit_names],
+        [natal[name]['longitude'] for name in natal_names],
+        orbs
+    )
+
+    rows, cols = np.nonzero(kind >= 0)
+    order = np.argsort(orb[rows, cols], kind='stable')[:limit]
+    return [
+        {
+            'transit': transit_names[rows[i]],
+            'natal': natal_names[cols[i]],
+            'aspect': _NAMES[kind[rows[i], cols[i]]],
+            'orb': round(float(orb[rows[i], cols[i]]), 2)
+        }
+        for i in order
+    ]
+
+
+def format_aspects(aspects: List[Dict]) -> str:
+    """One aspect per line: 'Saturn square natal Sun (orb 0.42°)'"""
+    return '\n'.join(
+        f"{a['transit']} {a['aspect']} natal {a['natal']} (orb {a['orb']}°)" for a in aspects
+    )
+
+
+if __name__ == "__main__":
+    import time
+
+    print("=" * 60)
+    print("TRANSIT ASPECT TEST")
+    print("=" * 60)
+
+    natal = {'Asc': {'longitude': 160.05}, 'Sun': {'longitude': 104.82},
+             'Moon': {'longitude': 157.68}, 'Saturn': {'longitude': 103.55}}
+    transits = {'Sun': {'longitude': 181.59}, 'Jupiter': {'longitude': 118.05},
+                'Saturn': {'longitude': 345.55}, 'Rahu': {'longitude': 341.35}}
+    print(f"\n{format_aspects(top_aspects(transits, natal))}")
+
+    grid = np.random.uniform(0, 360, size=(2, 1000))
+    started = time.perf_counter()
+    aspect_matrix(grid[0], grid[1])
+    print(f"\n1000 x 1000 matrix: {(time.perf_counter() - started) * 1000:.1f} ms")
@@ -7,14 +7,30 @@ import sys
 from datetime import datetime
 from typing import Dict, Optional
 from google import genai
+from google.genai import types
 
 # Import our modules
-from user_registration import UserDatabase, geocode_place
+from geocoder import normalize_name, resolve_place
+from place_autocomplete import get_autocomplete
+from user_registration import UserDatabase
 from quota_checker import QuotaChecker
 from token_tracker import TokenTracker
+from payment_handler import PaymentHandler
 from env_loader import get_api_key
+from job_executor import JobExecutor
+from local_systems import compute_local_systems, local_systems_key
+from photo_store import PHOTO_SYSTEMS, get_photo_store
 sys.path.append('utils')
 from ephemeris import calculate_chart, calculate_transits, format_chart_for_ai
+from vargas import calculate_vargas
+from dasha import dasha_seed, get_timeline
+from houses import birth_to_utc
+from ensemble import birth_ensemble, format_ensemble
+from aspects import top_aspects
+
+# Bump when calculate_chart() or anything derived from it changes, so
+# natal data cached on user records is recomputed
+NATAL_VERSION = 5
 
 
 class AstroEngine:
@@ -31,11 +47,15 @@ class AstroEngine:
         
         # Initialize subsystems
         self.db = UserDatabase('data/users.json')
-        self.quota = QuotaChecker('data/daily_quota.json')
-        self.token_tracker = TokenTracker('data/token_usage.json')
+        self.payments = PaymentHandler('data/subscriptions.json')
+        self.quota = QuotaChecker('data/daily_quota.bin', payments=self.payments)
+        self.token_tracker = TokenTracker('data/token_usage.bin')
+        
+        # LLM calls run here so the Streamlit script never blocks on them
+        self.jobs = JobExecutor(max_workers=8)
     
     def register_user(self, phone: str, name: str, dob: str, tob: str, 
-                     place: str) -> Dict:
+                     place: str, residence_country: str = None) -> Dict:
         """
         Register new user
         
@@ -45,6 +65,8 @@ class AstroEngine:
             dob: YYYY-MM-DD
             tob: HH:MM
             place: City name
+            residence_country: Country the caller appended to `place` from
+                the phone number rather than the user typing it
         
         Returns:
             {'success': bool, 'message': str}
@@ -56,8 +78,25 @@ class AstroEngine:
                 'message': 'User already registered! Please login.'
             }
         
-        # Get coordinates
-        lat, lon = geocode_place(place)
+        # Get coordinates and birth timezone from the offline gazetteer. The
+        # appended residence country is wrong for anyone born abroad
+        # ('Ongole, United States'), so retry without it; a state or country
+        # the user typed stays a hard constraint.
+        location = resolve_place(place, strict=True)
+        parts = [part.strip() for part in place.split(',') if part.strip()]
+        if (location is None and residence_country and len(parts) > 1
+                and normalize_name(parts[-1]) == normalize_name(residence_country)):
+            location = resolve_place(', '.join(parts[:-1]), strict=True)
+        if location is None:
+            suggestions = get_autocomplete().suggest(parts[0], limit=3) if parts else []
+            message = (f"Couldn't find '{place}'. Please check the spelling "
+                       f"or enter a nearby larger town.")
+            if suggestions:
+                message += " Did you mean: " + '; '.join(s['label'] for s in suggestions) + "?"
+            return {
+                'success': False,
+                'message': message
+            }
         
         # Register
         success = self.db.register_user(phone, {
@@ -65,8 +104,12 @@ class AstroEngine:
             'dob': dob,
             'tob': tob,
             'place': place,
-            'lat': lat,
-            'lon': lon
+            'birth_city': location['name'],
+            'birth_state': location['admin1'],
+            'birth_country': location['country'],
+            'birth_timezone': location['timezone'],
+            'lat': location['lat'],
+            'lon': location['lon']
         })
         
         if success:
@@ -81,13 +124,16 @@ class AstroEngine:
                 'message': 'Registration failed. Please try again.'
             }
     
-    def ask_question(self, phone: str, question: str, conversation_history: list = None) -> Dict:
+    def ask_question(self, phone: str, question: str, conversation_history: list = None,
+                     user: Optional[Dict] = None) -> Dict:
         """
         Main function: User asks a question
         
         Args:
             phone: User's phone number
             question: The question to ask
+            user: The user record if the caller already has it (e.g. from a
+                UserSnapshot); read from the store otherwise
         
         Returns:
             {
@@ -97,7 +143,8 @@ class AstroEngine:
             }
         """
         # Check if user exists
-        user = self.db.get_user(phone)
+        if user is None:
+            user = self.db.get_user(phone)
         if not user:
             return {
                 'success': False,
@@ -105,7 +152,7 @@ class AstroEngine:
             }
         
         # Check quota
-        quota_check = self.quota.can_user_ask(user)
+        quota_check = self.quota.can_user_ask(user, phone)
         
         if not quota_check['allowed']:
             return {
@@ -113,9 +160,13 @@ class AstroEngine:
                 'response': quota_check['message']
             }
         
-        # Check token limits (global)
+        # Check token limits (global, then per-user fairness)
         is_paid = user['subscription'] in ['PAID', 'PREMIUM', 'VIP']
-        token_check = self.token_tracker.can_make_request(is_paid_user=is_paid)
+        token_check = self.token_tracker.can_make_request(
+            is_paid_user=is_paid,
+            phone=phone,
+            tier=user.get('subscription', 'FREE')
+        )
         
         if not token_check['allowed']:
             return {
@@ -124,23 +175,32 @@ class AstroEngine:
                 'retry_available': True  # Signal that retry might work
             }
         
-        # Calculate birth chart
-        birth_datetime = datetime.strptime(
-            f"{user['birth_details']['dob']} {user['birth_details']['tob']}", 
-            "%Y-%m-%d %H:%M"
-        )
-        
-        chart = calculate_chart(
-            birth_datetime,
-            user['birth_details']['lat'],
-            user['birth_details']['lon']
-        )
-        
         # Get current transits
         transits = calculate_transits()
         
-        # Format for AI
-        chart_data = format_chart_for_ai(chart, transits)
+        # Format for AI. With exact birth data: the natal chart with its
+        # divisional charts, dashas and KP sub-lords (all cached on the user
+        # record) and today's transit aspects to it. With approximate data:
+        # only what holds across the whole birth window.
+        quality = user['birth_details'].get('quality', 'exact')
+        if quality == 'exact':
+            natal = self.get_natal(phone, user)
+            natal_points = {'Asc': natal['chart']['ascendant'], 'MC': natal['chart']['mc'],
+                            **natal['chart']['planets']}
+            chart_data = format_chart_for_ai(
+                natal['chart'],
+                transits,
+                self.get_local_systems(phone, user),
+                vargas=natal['vargas'],
+                dasha=get_timeline(natal['dasha']).at(datetime.now()),
+                kp=True,
+                aspects=top_aspects(transits, natal_points)
+            )
+        else:
+            chart_data = format_chart_for_ai(None, transits, self.get_local_systems(phone, user))
+            ensemble = self.get_ensemble(phone, user) if quality == 'approximate' else None
+            if ensemble:
+                chart_data = format_ensemble(ensemble) + "\n" + chart_data
         
         # Build prompt with system instructions
         custom_systems_text = ""
@@ -161,7 +221,12 @@ RESPONSE LENGTH RULES FOR FREE USERS:
         # CRITICAL: Pass current date explicitly IN USER'S TIMEZONE
         from country_utils import get_user_current_datetime
         
-        user_now = get_user_current_datetime(phone)
+        if not user.get('timezone'):
+            # Registered before the timezone was stored - resolve once
+            user_now = get_user_current_datetime(phone)
+            self.db.update_user(phone, {'timezone': user_now.tzinfo.zone})
+        else:
+            user_now = get_user_current_datetime(phone, timezone=user['timezone'])
         current_date_str = user_now.strftime("%B %d, %Y")  # e.g., "December 25, 2025"
         current_time_str = user_now.strftime("%I:%M %p")   # e.g., "02:30 PM"
         timezone_name = user_now.tzinfo.tzname(user_now)
@@ -212,7 +277,7 @@ CURRENT QUERY: {question}
         try:
             response = self.client.models.generate_content(
                 model='gemini-2.5-flash',
-                contents=full_prompt
+                contents=self._prompt_contents(phone, user, full_prompt)
             )
             
             ai_response = response.text
@@ -229,10 +294,8 @@ CURRENT QUERY: {question}
             if quota_check['api_tier'] == 'free':
                 self.quota.process_free_query()
             
-            self.db.increment_question_count(phone)
-            
-            # Get updated user for stats
-            user = self.db.get_user(phone)
+            # Updated user for stats
+            user = self.db.increment_question_count(phone) or user
             
             usage_msg = ""
             if user.get('subscription', 'FREE') == 'FREE':
@@ -250,6 +313,114 @@ CURRENT QUERY: {question}
                 'response': f'Error: {str(e)}'
             }
     
+    def _prompt_contents(self, phone: str, user: Dict, full_prompt: str):
+        """The prompt, plus palm/face photos if the user chose those systems"""
+        kinds = [kind for kind, system in PHOTO_SYSTEMS.items()
+                 if system in (user.get('custom_systems') or [])]
+        if not kinds:
+            return full_prompt
+        
+        images = get_photo_store().prompt_images(phone, kinds)
+        if not images:
+            return full_prompt
+        return [full_prompt] + [
+            types.Part.from_bytes(data=bytes(image), mime_type='image/jpeg')
+            for image in images
+        ]
+    
+    def get_natal(self, phone: str, user: Dict) -> Dict:
+        """
+        Natal chart plus the tables derived from it
+        
+        Computed once per set of birth details and cached on the user
+        record; bump NATAL_VERSION when any of the calculations change.
+        
+        Returns:
+            {'key': str, 'chart': calculate_chart() result,
+             'vargas': calculate_vargas() result,
+             'dasha': dasha_seed() result}
+        """
+        birth = user['birth_details']
+        key = (f"{NATAL_VERSION}|{birth['dob']}|{birth['tob']}|{birth['lat']}|{birth['lon']}"
+               f"|{birth.get('timezone')}")
+        cached = user.get('natal')
+        if cached and cached.get('key') == key:
+            return cached
+        
+        # Clock time at the birth place -> UTC
+        birth_datetime = birth_to_utc(birth['dob'], birth['tob'], birth.get('timezone'), birth['lon'])
+        chart = calculate_chart(birth_datetime, birth['lat'], birth['lon'])
+        natal = {
+            'key': key,
+            'chart': chart,
+            'vargas': calculate_vargas(chart),
+            'dasha': dasha_seed(chart['planets']['Moon']['longitude'], birth_datetime)
+        }
+        self.db.update_user(phone, {'natal': natal})
+        return natal
+    
+    def get_ensemble(self, phone: str, user: Dict) -> Optional[Dict]:
+        """
+        Stable vs ambiguous placements across an approximate birth window
+        
+        Computed once per birth window and cached on the user record,
+        like get_natal().
+        
+        Returns:
+            birth_ensemble() result, or None without a year range
+        """
+        birth = user['birth_details']
+        key = (f"{NATAL_VERSION}|{birth.get('year_range')}|{birth.get('month_range')}"
+               f"|{birth.get('time_range')}|{birth.get('city')}|{birth.get('state')}|{birth.get('country')}")
+        cached = user.get('ensemble')
+        if cached and cached.get('key') == key:
+            return cached['summary']
+        
+        # Approximate registrations keep only the place names
+        place = ', '.join(part for part in (birth.get('city'), birth.get('state'), birth.get('country')) if part)
+        location = resolve_place(place) if birth.get('city') else None
+        
+        summary = birth_ensemble(birth, location)
+        self.db.update_user(phone, {'ensemble': {'key': key, 'summary': summary}})
+        return summary
+    
+    def get_local_systems(self, phone: str, user: Dict) -> Dict:
+        """
+        Chinese, Mayan and numerology results for the user
+        
+        Computed once and cached on the user record; recomputed only when
+        the name, birth data, chosen systems or a calculator version change.
+        The calculators run in parallel within per-system time budgets; if
+        any overran, the partial results are used but not cached.
+        """
+        key = local_systems_key(user)
+        cached = user.get('local_systems')
+        if cached and cached.get('key') == key:
+            return cached['results']
+        
+        results, timed_out = compute_local_systems(user)
+        if not timed_out:
+            self.db.update_user(phone, {'local_systems': {'key': key, 'results': results}})
+        return results
+    
+    def submit_question(self, phone: str, question: str, conversation_history: list = None,
+                        user: Optional[Dict] = None) -> str:
+        """
+        Run ask_question in the background
+        
+        Returns:
+            Job ID; poll self.jobs.get(job_id, owner=phone) for the
+            ask_question() result
+        """
+        return self.jobs.submit(
+            self.ask_question,
+            phone,
+            question,
+            conversation_history=list(conversation_history or []),
+            user=user,
+            owner=phone
+        )
+    
     def upgrade_to_paid(self, phone: str) -> Dict:
         """Upgrade user to paid subscription"""
         user = self.db.get_user(phone)
@@ -0,0 +1,190 @@
+"""
+Chat Transcript Storage
+Append-only, compact per-user chat transcripts with paged reads
+"""
+
+import os
+import re
+import struct
+import threading
+import time
+import zlib
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows - fall back to in-process locking only
+    fcntl = None
+
+# body length, created_at (epoch seconds), role, flags
+RECORD = struct.Struct('<IdBB')
+OFFSET = struct.Struct('<Q')
+
+ROLES = ('user', 'assistant')
+FLAG_ZLIB = 0x01
+
+# Bodies shorter than this are stored as-is; compression wouldn't pay
+COMPRESS_MIN_BYTES = 256
+
+DEFAULT_PAGE_SIZE = 20
+
+
+class ChatStore:
+    """
+    Chat transcripts, one pair of files per user
+
+    Layout (one directory):
+        <digits>.log - records: RECORD header + UTF-8 body (zlib when it helps)
+        <digits>.idx - 8-byte start offset of each record in the .log
+        .lock        - serialises appends across processes
+
+    Messages are only ever appended. The index makes message i a single
+    seek, so reading the latest page costs the same however long the
+    conversation is. A record whose offset never reached the index
+    (crash mid-append) is just unreferenced bytes in the log.
+    """
+
+    def __init__(self, directory: str = 'data/chats'):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self._thread_lock = threading.Lock()
+
+    def _paths(self, phone: str):
+        digits = re.sub(r'\D', '', phone or '')
+        if not digits:
+            raise ValueError(f"Invalid phone number: {phone!r}")
+        base = os.path.join(self.directory, digits)
+        return base + '.log', base + '.idx'
+
+    @contextmanager
+    def _lock(self):
+        """Exclusive lock across threads and processes"""
+        with self._thread_lock:
+            fd = os.open(os.path.join(self.directory, '.lock'), os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                if fcntl is not None:
+                    fcntl.flock(fd, fcntl.LOCK_EX)
+                yield
+            finally:
+                os.close(fd)
+
+    def append(self, phone: str, role: str, content: str,
+               created_at: Optional[float] = None) -> int:
+        """
+        Add a message to the user's transcript
+
+        Returns:
+            Index of the new message (0-based)
+        """
+        body = content.encode('utf-8')
+        flags = 0
+        if len(body) >= COMPRESS_MIN_BYTES:
+            packed = zlib.compress(body, 6)
+            if len(packed) < len(body):
+                body, flags = packed, FLAG_ZLIB
+        record = RECORD.pack(len(body), time.time() if created_at is None else created_at,
+                             ROLES.index(role), flags) + body
+
+        log_path, idx_path = self._paths(phone)
+        with self._lock():
+            with open(log_path, 'ab') as log:
+                offset = log.tell()
+                log.write(record)
+            with open(idx_path, 'ab') as idx:
+                # Drop a torn entry left by an interrupted append
+                end = idx.tell()
+                if end % OFFSET.size:
+                    idx.truncate(end - end % OFFSET.size)
+                    idx.seek(0, os.SEEK_END)
+                idx.write(OFFSET.pack(offset))
+                return idx.tell() // OFFSET.size - 1
+
+    def count(self, phone: str) -> int:
+        """Number of messages in the user's transcript"""
+        _, idx_path = self._paths(phone)
+        try:
+            return os.path.getsize(idx_path) // OFFSET.size
+        except OSError:
+            return 0
+
+    def page(self, phone: str, before: Optional[int] = None,
+             limit: int = DEFAULT_PAGE_SIZE) -> List[Dict]:
+        """
+        Up to `limit` messages ending just before index `before`
+
+        With before=None this is the most recent page. Pass the first
+        message's 'index' as `before` to fetch the page preceding it.
+
+        Returns:
+            [{'index': int, 'role': str, 'content': str, 'created_at': float}]
+            oldest first
+        """
+        log_path, idx_path = self._paths(phone)
+        total = self.count(phone)
+        end = total if before is None else max(0, min(before, total))
+        start = max(0, end - limit)
+        if start >= end:
+            return []
+
+        with open(idx_path, 'rb') as idx:
+            idx.seek(start * OFFSET.size)
+            # One more offset (if any) bounds the last record's bytes
+            raw = idx.read((end - start + 1) * OFFSET.size)
+        offsets = [o for (o,) in OFFSET.iter_unpack(raw[:len(raw) - len(raw) % OFFSET.size])]
+
+        with open(log_path, 'rb') as log:
+            log.seek(offsets[0])
+            if len(offsets) > end - start:
+                data = log.read(offsets[end - start] - offsets[0])
+            else:
+                data = log.read()
+
+        messages = []
+        for i, offset in enumerate(offsets[:end - start]):
+            pos = offset - offsets[0]
+            length, created_at, role, flags = RECORD.unpack_from(data, pos)
+            body = data[pos + RECORD.size:pos + RECORD.size + length]
+            if flags & FLAG_ZLIB:
+                body = zlib.decompress(body)
+            messages.append({
+                'index': start + i,
+                'role': ROLES[role],
+                'content': body.decode('utf-8'),
+                'created_at': created_at
+            })
+        return messages
+
+
+# Singleton instance
+_chat_store = None
+
+def get_chat_store() -> ChatStore:
+    """Get chat store singleton"""
+    global _chat_store
+    if _chat_store is None:
+        _chat_store = ChatStore()
+    return _chat_store
+
+
+if __name__ == "__main__":
+    import tempfile
+
+    print("=" * 60)
+    print("CHAT STORE TEST")
+    print("=" * 60)
+
+    store = ChatStore(tempfile.mkdtemp())
+    phone = '+919876543210'
+    for n in range(1, 1001):
+        store.append(phone, 'user', f"Question {n}: when will my career take off?")
+        store.append(phone, 'assistant', f"Answer {n}: " + "Jupiter transits your 10th house. " * 20)
+
+    print(f"\nMessages: {store.count(phone)}")
+    started = time.perf_counter()
+    latest = store.page(phone)
+    print(f"Latest page: {len(latest)} messages in {(time.perf_counter() - started) * 1000:.2f} ms")
+    print(f"  first: #{latest[0]['index']} {latest[0]['content'][:40]}")
+    older = store.page(phone, before=latest[0]['index'])
+    print(f"Previous page: #{older[0]['index']}..#{older[-1]['index']}")
+    print(f"Log size: {os.path.getsize(store._paths(phone)[0]) / 1024:.0f} KB")
@@ -140,21 +140,17 @@ def detect_country_from_phone(phone: str) -> dict:
             'code': str
         }
     """
-    if not phone.startswith('+'):
-        return None
-    
-    # Try longest codes first (e.g., +971 before +91)
-    sorted_codes = sorted(COUNTRY_CODES.keys(), key=len, reverse=True)
+    from phone_numbers import parse_phone
     
-    for code in sorted_codes:
-        if phone.startswith(code):
-            return {
-                'country': COUNTRY_CODES[code]['country'],
-                'languages': COUNTRY_CODES[code]['languages'],
-                'code': code
-            }
+    info = parse_phone(phone)
+    if not info:
+        return None
     
-    return None
+    return {
+        'country': info['country'],
+        'languages': info['languages'],
+        'code': info['code']
+    }
 
 
 def get_timezone_for_country_code(country_code: str) -> str:
@@ -162,78 +158,46 @@ def get_timezone_for_country_code(country_code: str) -> str:
     Get timezone for a country code
     Returns timezone string like 'Asia/Kolkata', 'America/New_York'
     """
-    timezone_map = {
-        '+91': 'Asia/Kolkata',      # India
-        '+1': 'America/New_York',    # US/Canada (Eastern)
-        '+44': 'Europe/London',      # UK
-        '+971': 'Asia/Dubai',        # UAE
-        '+966': 'Asia/Riyadh',       # Saudi Arabia
-        '+234': 'Africa/Lagos',      # Nigeria
-        '+233': 'Africa/Accra',      # Ghana
-        '+254': 'Africa/Nairobi',    # Kenya
-        '+256': 'Africa/Kampala',    # Uganda
-        '+255': 'Africa/Dar_es_Salaam', # Tanzania
-        '+251': 'Africa/Addis_Ababa',   # Ethiopia
-        '+27': 'Africa/Johannesburg',   # South Africa
-        '+20': 'Africa/Cairo',       # Egypt
-        '+65': 'Asia/Singapore',     # Singapore
-        '+60': 'Asia/Kuala_Lumpur',  # Malaysia
-        '+66': 'Asia/Bangkok',       # Thailand
-        '+62': 'Asia/Jakarta',       # Indonesia
-        '+63': 'Asia/Manila',        # Philippines
-        '+84': 'Asia/Ho_Chi_Minh',   # Vietnam
-        '+86': 'Asia/Shanghai',      # China
-        '+81': 'Asia/Tokyo',         # Japan
-        '+82': 'Asia/Seoul',         # South Korea
-        '+92': 'Asia/Karachi',       # Pakistan
-        '+880': 'Asia/Dhaka',        # Bangladesh
-        '+94': 'Asia/Colombo',       # Sri Lanka
-        '+977': 'Asia/Kathmandu',    # Nepal
-        '+61': 'Australia/Sydney',   # Australia
-        '+49': 'Europe/Berlin',      # Germany
-        '+33': 'Europe/Paris',       # France
-        '+39': 'Europe/Rome',        # Italy
-        '+34': 'Europe/Madrid',      # Spain
-        '+7': 'Europe/Moscow',       # Russia
-        '+55': 'America/Sao_Paulo',  # Brazil
-        '+52': 'America/Mexico_City', # Mexico
-    }
+    from phone_numbers import timezone_for_code
     
-    return timezone_map.get(country_code, 'UTC')  # Default to UTC
+    return timezone_for_code(country_code)
 
 
-def get_user_current_datetime(phone: str):
+def get_user_current_datetime(phone: str, timezone: str = None):
     """
     Get current date/time in user's timezone based on phone number
     
     Args:
         phone: Phone number with country code (e.g., +919876543210)
+        timezone: Timezone already stored on the user record; when given,
+            the phone number is not parsed at all
     
     Returns:
         datetime object in user's timezone
     """
-    from datetime import datetime
-    import pytz
+    from phone_numbers import now_in_timezone, parse_phone
     
-    # Detect country code
-    country_info = detect_country_from_phone(phone)
-    if not country_info:
+    if not timezone:
+        info = parse_phone(phone)
         # Default to UTC if can't detect
-        return datetime.now(pytz.UTC)
-    
-    # Get timezone for this country
-    country_code = country_info.get('code', '+91')
-    timezone_str = get_timezone_for_country_code(country_code)
+        timezone = info['timezone'] if info else None
     
-    # Get current time in that timezone
-    tz = pytz.timezone(timezone_str)
-    user_now = datetime.now(tz)
-    
-    return user_now
+    return now_in_timezone(timezone)
 
 
 def get_coordinates(city: str, country: str = None) -> tuple:
-    """Get lat/lon for a city"""
+    """
+    Get lat/lon for a city
+    
+    Returns:
+        (lat, lon), or None if the city is unknown - never a default city,
+        since wrong coordinates silently corrupt the chart
+    """
+    from geocoder import get_gazetteer
+    
+    place = get_gazetteer().lookup(city, country=country)
+    if place:
+        return place['lat'], place['lon']
     
     # Try exact match first
     if city in ALL_CITIES:
@@ -244,9 +208,8 @@ def get_coordinates(city: str, country: str = None) -> tuple:
         if known_city.lower() == city.lower():
             return coords
     
-    # Default to Hyderabad if not found
-    print(f"Warning: '{city}' not found, using Hyderabad coordinates")
-    return INDIAN_CITIES['Hyderabad']
+    print(f"Warning: '{city}' not found in gazetteer")
+    return None
 
 
 if __name__ == "__main__":
@@ -0,0 +1,160 @@
+"""
+Vimshottari Dasha
+Full mahadasha/antardasha/pratyantardasha timeline with bisect lookup
+"""
+
+from array import array
+from bisect import bisect_right
+from datetime import datetime, timedelta
+from functools import lru_cache
+from typing import Dict, Optional
+
+# Lords in Vimshottari order with their mahadasha lengths in years (120 total)
+LORDS = ('Ketu', 'Venus', 'Sun', 'Moon', 'Mars', 'Rahu', 'Jupiter', 'Saturn', 'Mercury')
+YEARS = (7, 20, 6, 10, 7, 18, 16, 19, 17)
+TOTAL_YEARS = 120
+DAYS_PER_YEAR = 365.25
+
+NAKSHATRA_SPAN = 360 / 27
+LEVELS = ('mahadasha', 'antardasha', 'pratyantardasha')
+
+_EPOCH = datetime(1970, 1, 1)
+
+
+def _to_days(when: datetime) -> float:
+    if when.tzinfo is not None:
+        when = when.replace(tzinfo=None) - when.utcoffset()
+    return (when - _EPOCH).total_seconds() / 86400
+
+
+def _to_date(days: float) -> str:
+    return (_EPOCH + timedelta(days=days)).strftime('%Y-%m-%d')
+
+
+def dasha_seed(moon_longitude: float, birth: datetime) -> Dict:
+    """
+    What the whole timeline follows from
+
+    The Moon's nakshatra picks the first lord; the fraction of the
+    nakshatra already traversed is the part of that lord's mahadasha
+    that had elapsed at birth.
+
+    Returns:
+        {'start_days': first mahadasha start (days since 1970-01-01),
+         'first_lord': index into LORDS}
+    """
+    nakshatra, traversed = divmod(moon_longitude % 360, NAKSHATRA_SPAN)
+    first_lord = int(nakshatra) % 9
+    elapsed_days = traversed / NAKSHATRA_SPAN * YEARS[first_lord] * DAYS_PER_YEAR
+    return {
+        'start_days': round(_to_days(birth) - elapsed_days, 4),
+        'first_lord': first_lord
+    }
+
+
+class DashaTimeline:
+    """
+    The 729 pratyantardashas of one 120-year cycle as sorted boundaries
+
+    bounds[i] is the start of pratyantardasha i (bounds[729] the end of
+    the cycle), so i // 81, i // 9 % 9 and i % 9 give the mahadasha,
+    antardasha and pratyantardasha within their parents, and every
+    lookup is one bisection.
+    """
+
+    def __init__(self, start_days: float, first_lord: int):
+        self.first_lord = first_lord
+        self.bounds = array('d')
+
+        t = start_days
+        for md in range(9):
+            md_lord = (first_lord + md) % 9
+            for ad in range(9):
+                ad_lord = (md_lord + ad) % 9
+                for pd in range(9):
+                    pd_lord = (ad_lord + pd) % 9
+                    self.bounds.append(t)
+                    t += (YEARS[md_lord] * YEARS[ad_lord] * YEARS[pd_lord]
+                          / TOTAL_YEARS ** 2 * DAYS_PER_YEAR)
+        self.bounds.append(t)
+
+    def _period(self, level: int, i: int) -> Dict:
+        """Period of the given level containing pratyantardasha i"""
+        width = 81 // 9 ** level  # pratyantardashas per period at this level
+        first = i // width * width
+        md = first // 81
+        lord = (self.first_lord + md) % 9
+        if level >= 1:
+            lord = (lord + first // 9 % 9) % 9
+        if level == 2:
+            lord = (lord + first % 9) % 9
+        return {
+            'lord': LORDS[lord],
+            'start': _to_date(self.bounds[first]),
+            'end': _to_date(self.bounds[first + width])
+        }
+
+    def at(self, when: datetime) -> Optional[Dict]:
+        """
+        Running and next periods at every level
+
+        Returns:
+            {'mahadasha': {'lord', 'start', 'end'}, 'antardasha': ...,
+             'pratyantardasha': ..., 'next': {level: {'lord', 'start', 'end'}}}
+            or None outside the 120-year cycle
+        """
+        i = bisect_right(self.bounds, _to_days(when)) - 1
+        if i < 0 or i >= len(self.bounds) - 1:
+            return None
+
+        periods = {name: self._period(level, i) for level, name in enumerate(LEVELS)}
+        periods['next'] = {}
+        for level, name in enumerate(LEVELS):
+            width = 81 // 9 ** level
+            following = i // width * width + width
+            if following < len(self.bounds) - 1:
+                periods['next'][name] = self._period(level, following)
+        return periods
+
+
+@lru_cache(maxsize=1024)
+def _timeline(start_days: float, first_lord: int) -> DashaTimeline:
+    return DashaTimeline(start_days, first_lord)
+
+
+def get_timeline(seed: Dict) -> DashaTimeline:
+    """Timeline for a dasha_seed(), built once per process"""
+    return _timeline(seed['start_days'], seed['first_lord'])
+
+
+def format_dasha(periods: Dict) -> str:
+    """Compact prompt lines for DashaTimeline.at()"""
+    running = ' / '.join(
+        f"{periods[name]['lord']} {abbr} ({periods[name]['start']} to {periods[name]['end']})"
+        for name, abbr in zip(LEVELS, ('MD', 'AD', 'PD'))
+    )
+    upcoming = ', '.join(
+        f"{periods['next'][name]['lord']} {abbr} from {periods['next'][name]['start']}"
+        for name, abbr in zip(LEVELS, ('MD', 'AD', 'PD')) if name in periods['next']
+    )
+    return f"Running: {running}\nNext: {upcoming}"
+
+
+if __name__ == "__main__":
+    import time
+
+    print("=" * 60)
+    print("VIMSHOTTARI DASHA TEST")
+    print("=" * 60)
+
+    # Moon at 10.94° Virgo (Hasta, ruled by the Moon)
+    seed = dasha_seed(160.94, datetime(1976, 7, 31, 8, 12))
+    timeline = get_timeline(seed)
+    print(f"\nSeed: {seed}, first MD: {LORDS[seed['first_lord']]}")
+    print(f"Cycle: {_to_date(timeline.bounds[0])} to {_to_date(timeline.bounds[-1])}")
+    print(f"\n{format_dasha(timeline.at(datetime(2026, 10, 19)))}")
+
+    started = time.perf_counter()
+    for day in range(10000):
+        timeline.at(datetime(1980, 1, 1) + timedelta(days=day))
+    print(f"\n10000 lookups: {(time.perf_counter() - started) * 1000:.1f} ms")
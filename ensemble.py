@@ -0,0 +1,190 @@
+"""
+Birth-Time Uncertainty Ensemble
+Charts across an approximate birth window, summarised as stable vs
+ambiguous placements
+"""
+
+from collections import Counter
+from datetime import datetime
+from typing import Dict, List, Optional
+
+import numpy as np
+import pytz
+from astropy.time import Time
+
+from ephemeris import NAKSHATRAS, SIGNS, get_ayanamsa, get_planet_position, mean_node
+from houses import house_cusps
+
+# Local clock hours for each time-of-day answer; night runs past midnight
+TIME_RANGES = {
+    'morning': (6, 12),
+    'afternoon': (12, 17),
+    'evening': (17, 21),
+    'night': (21, 30),
+}
+
+# Grid: evenly spread days in the window x evenly spread times in the range
+DAY_SAMPLES = 64
+TIME_SAMPLES = 6
+
+# A placement is stable when this share of the charts agree on it, and
+# too scattered to be worth listing odds for below UNKNOWN_SHARE
+STABLE_SHARE = 0.9
+UNKNOWN_SHARE = 0.25
+
+BODIES = ['Sun', 'Moon', 'Mercury', 'Venus', 'Mars', 'Jupiter', 'Saturn']
+MONTH_ABBR = ['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun',
+              'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec']
+
+
+def _window(birth: Dict):
+    """(years, months, (first hour, last hour)) of the birth window, or None"""
+    years = birth.get('year_range')
+    if not years:
+        return None
+    first_year, last_year = int(years[0]), int(years[-1])
+    first_month, last_month = (int(m) for m in (birth.get('month_range') or (1, 12)))
+    if first_month <= last_month:
+        months = set(range(first_month, last_month + 1))
+    else:  # e.g. November to February
+        months = set(range(first_month, 13)) | set(range(1, last_month + 1))
+    hours = TIME_RANGES.get((birth.get('time_range') or '').strip().lower(), (0, 24))
+    return (first_year, last_year), months, hours
+
+
+def _sample_times(window, timezone: Optional[str], lon: Optional[float]) -> np.ndarray:
+    """UTC datetime64 grid over the window's days and clock hours"""
+    (first_year, last_year), months, (first_hour, last_hour) = window
+    days = np.arange(np.datetime64(f'{first_year}-01-01'), np.datetime64(f'{last_year + 1}-01-01'))
+    month_of = (days.astype('datetime64[M]').astype(int) % 12) + 1
+    days = days[np.isin(month_of, list(months))]
+    days = days[np.unique(np.linspace(0, len(days) - 1, DAY_SAMPLES).round().astype(int))]
+
+    # Midpoints of equal slices of the time range, in minutes
+    step = (last_hour - first_hour) * 60 / TIME_SAMPLES
+    minutes = (first_hour * 60 + step * (np.arange(TIME_SAMPLES) + 0.5)).round().astype(int)
+    local = (days.astype('datetime64[m]')[:, None] + minutes.astype('timedelta64[m]')).ravel()
+
+    # Clock time -> UTC: the place's historical offsets, else local mean
+    # time. Clock times skipped or repeated by a DST change resolve to
+    # standard time, as localize() does in houses.birth_to_utc.
+    if timezone:
+        zone = pytz.timezone(timezone)
+        offsets = [int(zone.utcoffset(t.astype(datetime), is_dst=False).total_seconds() // 60)
+                   for t in local]
+    else:
+        offsets = [round((lon or 0) * 4)] * len(local)
+    return local - np.array(offsets, dtype='timedelta64[m]')
+
+
+def _shares(values, labels) -> List[List]:
+    """[[label, share], ...] most common first, dropping stray values (never the top one)"""
+    counts = Counter(np.asarray(values).tolist())
+    total = sum(counts.values())
+    return [[labels[value], round(count / total, 2)]
+            for i, (value, count) in enumerate(counts.most_common(3)) if i == 0 or count / total >= 0.05]
+
+
+def birth_ensemble(birth: Dict, location: Optional[Dict] = None) -> Optional[Dict]:
+    """
+    Evaluate every chart in the birth window at once and tally placements
+
+    Args:
+        birth: approximate birth_details ('year_range', optional
+            'month_range' and 'time_range')
+        location: resolve_place() result for the birth place; without it
+            there is no ascendant or houses
+
+    Returns:
+        {'samples': int, 'window': str,
+         'placements': {body: {'sign': [[value, share], ...],
+                               'nakshatra': [...], 'house': [...]}}}
+        or None when there is no year range to sample
+    """
+    window = _window(birth)
+    if window is None:
+        return None
+
+    utc = _sample_times(window, location and location.get('timezone'), location and location.get('lon'))
+    time_obj = Time(utc, scale='utc')
+    years = utc.astype('datetime64[Y]').astype(int) + 1970
+    ayanamsa = get_ayanamsa(years)
+
+    # One vectorised ephemeris call per body across the whole ensemble
+    longitudes = {
+        body: np.mod(get_planet_position(body, time_obj) - ayanamsa, 360.0)
+        for body in BODIES
+    }
+    longitudes['Rahu'] = np.mod(mean_node(time_obj) - ayanamsa, 360.0)
+
+    asc_sign = None
+    if location:
+        asc = house_cusps(utc, location['lat'], location['lon'], ayanamsa)['asc']
+        asc_sign = (asc // 30).astype(int)
+
+    placements = {}
+    if asc_sign is not None:
+        placements['Ascendant'] = {'sign': _shares(asc_sign, SIGNS)}
+    for body, lon in longitudes.items():
+        sign = (lon // 30).astype(int)
+        placements[body] = {
+            'sign': _shares(sign, SIGNS),
+            'nakshatra': _shares((lon // (360 / 27)).astype(int), NAKSHATRAS)
+        }
+        if asc_sign is not None:
+            placements[body]['house'] = _shares((sign - asc_sign) % 12 + 1, list(range(13)))
+
+    (first_year, last_year), _, (first_hour, last_hour) = window
+    month_range = birth.get('month_range') or (1, 12)
+    years = str(first_year) if first_year == last_year else f"{first_year}-{last_year}"
+    return {
+        'samples': len(utc),
+        'window': (f"{MONTH_ABBR[int(month_range[0]) - 1]}-{MONTH_ABBR[int(month_range[-1]) - 1]} "
+                   f"{years}, {first_hour % 24:02d}:00-{last_hour % 24:02d}:00"),
+        'placements': placements
+    }
+
+
+def format_ensemble(summary: Dict) -> str:
+    """Prompt section: stable placements as facts, ambiguous ones with their odds"""
+    stable, ambiguous, unknown = [], [], []
+    for body, facts in summary['placements'].items():
+        sure = [f"{'house ' if kind == 'house' else ''}{shares[0][0]}"
+                for kind, shares in facts.items() if shares and shares[0][1] >= STABLE_SHARE]
+        if sure:
+            stable.append(f"{body} {' '.join(sure)}")
+        scattered = []
+        for kind, shares in facts.items():
+            if not shares or shares[0][1] < UNKNOWN_SHARE:
+                scattered.append(kind)
+            elif shares[0][1] < STABLE_SHARE:
+                odds = ' / '.join(f"{value} {share:.0%}" for value, share in shares)
+                ambiguous.append(f"{body} {kind} {odds}")
+        if scattered:
+            unknown.append(f"{body} {'/'.join(scattered)}")
+
+    output = (f"BIRTH CHART (approximate birth data; {summary['samples']} charts sampled "
+              f"over {summary['window']}):\n")
+    output += f"Stable (same in {STABLE_SHARE:.0%}+ of charts): {'; '.join(stable) or 'none'}\n"
+    if ambiguous:
+        output += f"Ambiguous (don't rely on these): {'; '.join(ambiguous)}\n"
+    if unknown:
+        output += f"Unknown (varies across the window): {'; '.join(unknown)}\n"
+    return output
+
+
+if __name__ == "__main__":
+    import time
+
+    print("=" * 60)
+    print("BIRTH ENSEMBLE TEST")
+    print("=" * 60)
+
+    birth = {'quality': 'approximate', 'year_range': [1985, 1985],
+             'month_range': [3, 4], 'time_range': 'morning'}
+    location = {'lat': 13.08, 'lon': 80.27, 'timezone': 'Asia/Kolkata'}
+
+    started = time.perf_counter()
+    summary = birth_ensemble(birth, location)
+    print(f"\n{summary['samples']} charts in {time.perf_counter() - started:.2f} s\n")
+    print(format_ensemble(summary))
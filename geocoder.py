@@ -0,0 +1,446 @@
+"""
+Offline Geocoder
+Place name -> coordinates and coordinates -> timezone from a bundled
+gazetteer, compiled to a memory-mapped binary file
+
+Build a larger gazetteer from a GeoNames dump:
+    python geocoder.py build cities15000.txt [countryInfo.txt] [admin1CodesASCII.txt]
+"""
+
+import math
+import mmap
+import os
+import struct
+import sys
+import threading
+import unicodedata
+from typing import Dict, Iterator, List, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows - fall back to in-process locking only
+    fcntl = None
+
+DEFAULT_SOURCE = 'data/gazetteer_seed.tsv'
+DEFAULT_PATH = 'data/gazetteer.bin'
+
+# magic, version, reserved, records, name entries, string blob size
+HEADER = struct.Struct('<4sHHIII')
+# lat, lon, population, name, admin1, country name, timezone (string
+# offsets), ISO country code
+RECORD = struct.Struct('<ddIIIII2s')
+# normalized key offset, record index
+NAME_ENTRY = struct.Struct('<II')
+# unit-sphere x, y, z, record index - implicit KD-tree order
+KD_NODE = struct.Struct('<dddI')
+
+MAGIC = b'AGAZ'
+VERSION = 1
+
+EARTH_RADIUS_KM = 6371.0
+
+# Names people type for countries that the gazetteer spells differently
+COUNTRY_ALIASES = {
+    'uae': 'AE',
+    'emirates': 'AE',
+    'usa': 'US',
+    'us': 'US',
+    'america': 'US',
+    'united states of america': 'US',
+    'uk': 'GB',
+    'britain': 'GB',
+    'great britain': 'GB',
+    'england': 'GB',
+    'korea': 'KR',
+    'russian federation': 'RU',
+}
+
+
+def normalize_name(name: str) -> str:
+    """
+    Lookup key for a place name
+
+    Case-folded, Latin accents removed ('São Paulo' -> 'sao paulo'),
+    punctuation collapsed to single spaces. Combining marks are kept
+    after non-Latin letters, so Indic vowel signs survive.
+    """
+    out = []
+    prev_latin = False
+    for ch in unicodedata.normalize('NFKD', name.casefold()):
+        if unicodedata.combining(ch):
+            if not prev_latin:
+                out.append(ch)
+            continue
+        prev_latin = ch < 'ɐ'
+        out.append(ch if (ch.isalnum() or unicodedata.category(ch)[0] == 'M') else ' ')
+    return ' '.join(unicodedata.normalize('NFC', ''.join(out)).split())
+
+
+def _unit_vector(lat: float, lon: float) -> tuple:
+    lat_r, lon_r = math.radians(lat), math.radians(lon)
+    cos_lat = math.cos(lat_r)
+    return (cos_lat * math.cos(lon_r), cos_lat * math.sin(lon_r), math.sin(lat_r))
+
+
+def _chord_to_km(chord_sq: float) -> float:
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(chord_sq) / 2))
+
+
+def read_seed_rows(path: str) -> Iterator[Dict]:
+    """Rows from the bundled seed TSV (see the header line for columns)"""
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            if not line.strip() or line.startswith('#'):
+                continue
+            name, alternates, lat, lon, cc, country, admin1, tz, population = \
+                line.rstrip('\n').split('\t')
+            yield {
+                'name': name,
+                'alternates': [a for a in alternates.split(',') if a],
+                'lat': float(lat),
+                'lon': float(lon),
+                'country_code': cc,
+                'country': country,
+                'admin1': admin1,
+                'timezone': tz,
+                'population': int(population or 0),
+            }
+
+
+def read_geonames_rows(cities_path: str, country_info_path: str = None,
+                       admin1_path: str = None) -> Iterator[Dict]:
+    """Rows from a GeoNames citiesNNNN.txt dump (optional name tables)"""
+    countries = {}
+    if country_info_path:
+        with open(country_info_path, encoding='utf-8') as f:
+            for line in f:
+                if not line.startswith('#'):
+                    cols = line.split('\t')
+                    countries[cols[0]] = cols[4]
+
+    admin1 = {}
+    if admin1_path:
+        with open(admin1_path, encoding='utf-8') as f:
+            for line in f:
+                cols = line.split('\t')
+                admin1[cols[0]] = cols[1]
+
+    with open(cities_path, encoding='utf-8') as f:
+        for line in f:
+            cols = line.rstrip('\n').split('\t')
+            if len(cols) < 18:
+                continue
+            cc = cols[8]
+            yield {
+                'name': cols[1],
+                'alternates': [cols[2]] + [a for a in cols[3].split(',') if a],
+                'lat': float(cols[4]),
+                'lon': float(cols[5]),
+                'country_code': cc,
+                'country': countries.get(cc, cc),
+                'admin1': admin1.get(f"{cc}.{cols[10]}", cols[10]),
+                'timezone': cols[17],
+                'population': int(cols[14] or 0),
+            }
+
+
+def build_gazetteer(rows: Iterator[Dict], out_path: str = DEFAULT_PATH) -> int:
+    """
+    Compile gazetteer rows into the binary format
+
+    Layout:
+        [HEADER][RECORD * n][NAME_ENTRY * names][KD_NODE * n][strings]
+
+    Records are sorted by population (largest first). Name entries are
+    sorted by (utf-8 key, record), so the first hit for a key is the
+    most populous place. KD nodes are stored in implicit balanced-tree
+    order: the node of a range [lo, hi) sits at (lo + hi) // 2, split
+    on axis depth % 3.
+
+    Returns:
+        Number of places written
+    """
+    rows = sorted(rows, key=lambda r: -r['population'])
+
+    strings = bytearray()
+    string_offsets: Dict[str, int] = {}
+
+    def intern(s: str) -> int:
+        if s not in string_offsets:
+            string_offsets[s] = len(strings)
+            strings.extend(s.encode('utf-8') + b'\0')
+        return string_offsets[s]
+
+    records = bytearray()
+    names = []
+    points = []
+    for i, row in enumerate(rows):
+        records += RECORD.pack(
+            row['lat'], row['lon'], min(row['population'], 0xFFFFFFFF),
+            intern(row['name']), intern(row['admin1'] or ''),
+            intern(row['country'] or ''), intern(row['timezone'] or 'UTC'),
+            (row['country_code'] or '').encode('ascii')[:2].ljust(2)
+        )
+        keys = {normalize_name(n) for n in [row['name'], *row['alternates']]}
+        names.extend((key.encode('utf-8'), i) for key in keys if key)
+        points.append((*_unit_vector(row['lat'], row['lon']), i))
+
+    names.sort()
+    name_entries = bytearray()
+    for key, i in names:
+        name_entries += NAME_ENTRY.pack(intern(key.decode('utf-8')), i)
+
+    kd = [None] * len(points)
+
+    def place(lo: int, hi: int, depth: int, items: List[tuple]):
+        if lo >= hi:
+            return
+        items.sort(key=lambda p: p[depth % 3])
+        mid = (lo + hi) // 2
+        kd[mid] = items[mid - lo]
+        place(lo, mid, depth + 1, items[:mid - lo])
+        place(mid + 1, hi, depth + 1, items[mid - lo + 1:])
+
+    place(0, len(points), 0, points)
+    kd_nodes = b''.join(KD_NODE.pack(*node) for node in kd)
+
+    directory = os.path.dirname(out_path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp = out_path + '.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, VERSION, 0, len(rows), len(names), len(strings)))
+        f.write(records)
+        f.write(name_entries)
+        f.write(kd_nodes)
+        f.write(strings)
+    os.replace(tmp, out_path)
+    return len(rows)
+
+
+class Gazetteer:
+    """
+    Read-only view of a compiled gazetteer file
+
+    The file is mmap'd, so every worker shares one copy of the data via
+    the page cache and opening it costs no parsing. Name lookups are a
+    binary search over the sorted name index; reverse lookups walk the
+    KD-tree over unit-sphere coordinates (no antimeridian special cases).
+    """
+
+    def __init__(self, path: str = DEFAULT_PATH, source: str = DEFAULT_SOURCE):
+        self.path = path
+        if source and os.path.exists(source) and (
+                not os.path.exists(path) or os.path.getmtime(path) < os.path.getmtime(source)):
+            self._build_locked(source)
+
+        with open(path, 'rb') as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, _, self.size, self.name_count, _ = HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} is not a gazetteer file (version {VERSION})")
+
+        self._records_at = HEADER.size
+        self._names_at = self._records_at + self.size * RECORD.size
+        self._kd_at = self._names_at + self.name_count * NAME_ENTRY.size
+        self._strings_at = self._kd_at + self.size * KD_NODE.size
+
+    def _build_locked(self, source: str):
+        """Compile the source once, even with several workers starting together"""
+        with open(self.path + '.lock', 'w') as lock:
+            if fcntl is not None:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            if os.path.exists(self.path) and os.path.getmtime(self.path) >= os.path.getmtime(source):
+                return
+            with open(source, encoding='utf-8') as f:
+                first = next((line for line in f if not line.startswith('#')), '')
+            rows = (read_geonames_rows(source) if first.count('\t') >= 17
+                    else read_seed_rows(source))
+            build_gazetteer(rows, self.path)
+
+    def _string(self, offset: int) -> str:
+        start = self._strings_at + offset
+        return self._mm[start:self._mm.find(b'\0', start)].decode('utf-8')
+
+    def _key(self, entry: int) -> bytes:
+        key_offset, _ = NAME_ENTRY.unpack_from(self._mm, self._names_at + entry * NAME_ENTRY.size)
+        start = self._strings_at + key_offset
+        return self._mm[start:self._mm.find(b'\0', start)]
+
+    def _name_record(self, entry: int) -> int:
+        return NAME_ENTRY.unpack_from(self._mm, self._names_at + entry * NAME_ENTRY.size)[1]
+
+    def record(self, index: int) -> Dict:
+        """Place at a record index"""
+        lat, lon, population, name, admin1, country, tz, cc = RECORD.unpack_from(
+            self._mm, self._records_at + index * RECORD.size
+        )
+        return {
+            'name': self._string(name),
+            'admin1': self._string(admin1) or None,
+            'country': self._string(country),
+            'country_code': cc.decode('ascii').strip(),
+            'lat': lat,
+            'lon': lon,
+            'timezone': self._string(tz),
+            'population': population,
+        }
+
+    def iter_names(self) -> Iterator[tuple]:
+        """(normalized name, record index) for every name and alternate"""
+        for entry in range(self.name_count):
+            yield self._key(entry).decode('utf-8'), self._name_record(entry)
+
+    def _lower_bound(self, key: bytes) -> int:
+        lo, hi = 0, self.name_count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._key(mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def _records_for_key(self, key: bytes) -> List[int]:
+        """Record indexes whose name or alternate normalizes to ``key``"""
+        i = self._lower_bound(key)
+        found = []
+        while i < self.name_count and self._key(i) == key:
+            found.append(self._name_record(i))
+            i += 1
+        return sorted(found)  # record order = population order
+
+    def _country_matches(self, place: Dict, country: str) -> bool:
+        wanted = normalize_name(country)
+        code = COUNTRY_ALIASES.get(wanted, wanted.upper() if len(wanted) == 2 else None)
+        return (place['country_code'] == code
+                or normalize_name(place['country']) == wanted)
+
+    def lookup(self, name: str, country: str = None, admin1: str = None,
+               strict: bool = False) -> Optional[Dict]:
+        """
+        Most populous place called ``name`` (or one of its alternate names)
+
+        Args:
+            name: 'Ongole', 'Bengaluru', 'విజయవాడ', ...
+            country: Optional filter - name, ISO code or common alias
+            admin1: Optional state/province; preferred when it matches
+            strict: Require admin1 to match instead of just preferring it
+
+        Returns:
+            Place dict (see record()) or None if nothing matches
+        """
+        key = normalize_name(name or '').encode('utf-8')
+        if not key:
+            return None
+        places = [self.record(i) for i in self._records_for_key(key)]
+        if country:
+            places = [p for p in places if self._country_matches(p, country)]
+        if admin1 and places:
+            wanted = normalize_name(admin1)
+            in_state = [p for p in places if normalize_name(p['admin1'] or '') == wanted]
+            places = in_state if strict else in_state or places
+        return places[0] if places else None
+
+    def resolve(self, place: str, strict: bool = False) -> Optional[Dict]:
+        """
+        Resolve free text like 'Ongole, Andhra Pradesh, India'
+
+        The first part is the place name, the last is treated as the
+        country when there is more than one part, and anything between
+        as the state. With strict, a given state must match too.
+        """
+        parts = [p.strip() for p in (place or '').split(',') if p.strip()]
+        if not parts:
+            return None
+        if len(parts) == 1:
+            return self.lookup(parts[0])
+        admin1 = ', '.join(parts[1:-1]) or None
+        found = self.lookup(parts[0], country=parts[-1], admin1=admin1, strict=strict)
+        if found is None and len(parts) == 2:
+            # 'City, State' without a country
+            found = self.lookup(parts[0], admin1=parts[1])
+            if found and normalize_name(found['admin1'] or '') != normalize_name(parts[1]):
+                found = None
+        return found
+
+    def nearest(self, lat: float, lon: float) -> Dict:
+        """
+        Closest place to a coordinate
+
+        Returns:
+            Place dict plus 'distance_km'
+        """
+        target = _unit_vector(lat, lon)
+        best = [float('inf'), -1]
+
+        def search(lo: int, hi: int, depth: int):
+            if lo >= hi:
+                return
+            mid = (lo + hi) // 2
+            x, y, z, index = KD_NODE.unpack_from(self._mm, self._kd_at + mid * KD_NODE.size)
+            d = (x - target[0]) ** 2 + (y - target[1]) ** 2 + (z - target[2]) ** 2
+            if d < best[0]:
+                best[0], best[1] = d, index
+            diff = target[depth % 3] - (x, y, z)[depth % 3]
+            near, far = ((lo, mid), (mid + 1, hi)) if diff < 0 else ((mid + 1, hi), (lo, mid))
+            search(*near, depth + 1)
+            if diff * diff < best[0]:
+                search(*far, depth + 1)
+
+        search(0, self.size, 0)
+        place = self.record(best[1])
+        place['distance_km'] = round(_chord_to_km(best[0]), 1)
+        return place
+
+    def timezone_at(self, lat: float, lon: float) -> str:
+        """IANA timezone of the nearest gazetteer place"""
+        return self.nearest(lat, lon)['timezone']
+
+
+_gazetteer = None
+_gazetteer_lock = threading.Lock()
+
+
+def get_gazetteer() -> Gazetteer:
+    """Process-wide gazetteer (the mmap is shared across workers anyway)"""
+    global _gazetteer
+    if _gazetteer is None:
+        with _gazetteer_lock:
+            if _gazetteer is None:
+                _gazetteer = Gazetteer()
+    return _gazetteer
+
+
+def resolve_place(place: str, strict: bool = False) -> Optional[Dict]:
+    """Shortcut for get_gazetteer().resolve(place, strict)"""
+    return get_gazetteer().resolve(place, strict)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 2 and sys.argv[1] == 'build':
+        count = build_gazetteer(read_geonames_rows(*sys.argv[2:5]), DEFAULT_PATH)
+        print(f"✅ Wrote {count} places to {DEFAULT_PATH}")
+        sys.exit(0)
+
+    import time
+
+    print("=" * 60)
+    print("OFFLINE GEOCODER TEST")
+    print("=" * 60)
+
+    gazetteer = get_gazetteer()
+    for query in ['Ongole, Andhra Pradesh, India', 'Bengaluru', 'విజయవాడ',
+                  'Sao Paulo, Brazil', 'Paris, United States', 'Atlantis']:
+        place = gazetteer.resolve(query)
+        print(f"{query:<32} → {place and (place['name'], place['country'], place['lat'], place['lon'], place['timezone'])}")
+
+    print(f"\nNearest to (15.8, 80.2): {gazetteer.nearest(15.8, 80.2)['name']}")
+    print(f"Timezone at (-33.9, 151.2): {gazetteer.timezone_at(-33.9, 151.2)}")
+
+    start = time.perf_counter()
+    for _ in range(1000):
+        gazetteer.resolve('Ongole, Andhra Pradesh, India')
+        gazetteer.nearest(17.4, 78.5)
+    print(f"\nLookup + reverse: {(time.perf_counter() - start):.3f} ms each (avg of 1000)")
@@ -0,0 +1,170 @@
+"""
+House Engine
+Sidereal time, ascendant, MC and Placidus/whole-sign cusps, vectorised
+over arrays of instants and locations
+"""
+
+from datetime import datetime, timedelta
+from typing import Dict
+
+import numpy as np
+import pytz
+
+J2000 = 2451545.0
+_UNIX_EPOCH_JD = 2440587.5
+
+# Placidus iterations; under 0.2" of the converged cusps up to 66° latitude
+PLACIDUS_ITERATIONS = 30
+
+
+def birth_to_utc(dob: str, tob: str, timezone: str = None, lon: float = None) -> datetime:
+    """
+    Birth date and local clock time as an aware UTC datetime
+
+    Uses the birth place's IANA timezone (historical offsets and DST
+    included). Without one, falls back to local mean time from the
+    longitude, and to UTC only when neither is known.
+    """
+    local = datetime.strptime(f"{dob} {tob}", "%Y-%m-%d %H:%M")
+    if timezone:
+        try:
+            return pytz.timezone(timezone).localize(local).astimezone(pytz.utc)
+        except pytz.UnknownTimeZoneError:
+            pass
+    if lon is not None:
+        local -= timedelta(hours=float(lon) / 15)
+    return pytz.utc.localize(local)
+
+
+def julian_days(times) -> np.ndarray:
+    """
+    Julian days (UT) for datetime64 values or (sequences of) datetimes
+
+    Naive datetimes are taken as UTC.
+    """
+    if isinstance(times, np.datetime64):
+        times = np.asarray(times)
+    if not isinstance(times, np.ndarray) or times.dtype.kind != 'M':
+        stamps = np.asarray(times, dtype=object)
+        utc = [t.astimezone(pytz.utc).replace(tzinfo=None) if t.tzinfo else t
+               for t in stamps.ravel()]
+        times = np.array(utc, dtype='datetime64[us]').reshape(stamps.shape)
+    seconds = (times - np.datetime64('1970-01-01T00:00:00', 'us')) / np.timedelta64(1, 's')
+    return _UNIX_EPOCH_JD + seconds / 86400
+
+
+def sidereal_time(jd, lon) -> np.ndarray:
+    """Local mean sidereal time in degrees (IAU 1982 GMST plus east longitude)"""
+    t = (jd - J2000) / 36525
+    gmst = (280.46061837 + 360.98564736629 * (jd - J2000)
+            + 0.000387933 * t ** 2 - t ** 3 / 38710000)
+    return np.mod(gmst + lon, 360.0)
+
+
+def obliquity(jd) -> np.ndarray:
+    """Mean obliquity of the ecliptic in degrees (Meeus 22.2)"""
+    t = (jd - J2000) / 36525
+    return 23.439291111 - (46.8150 * t + 0.00059 * t ** 2 - 0.001813 * t ** 3) / 3600
+
+
+def _ecliptic_from_ra(ra, eps):
+    """Ecliptic longitude of the ecliptic point with right ascension `ra` (radians)"""
+    return np.arctan2(np.sin(ra), np.cos(ra) * np.cos(eps))
+
+
+def _placidus(ramc, eps, phi, fraction, above):
+    """
+    One Placidus cusp: the ecliptic point whose right ascension is
+    `fraction` of its own diurnal (above) or nocturnal semi-arc from
+    the meridian, solved by fixed-point iteration on its declination
+    """
+    lam = _ecliptic_from_ra(ramc + fraction * np.pi / 2 * (1 if above else -1) + (0 if above else np.pi), eps)
+    for _ in range(PLACIDUS_ITERATIONS):
+        dec = np.arcsin(np.sin(eps) * np.sin(lam))
+        ad = np.arcsin(np.clip(np.tan(phi) * np.tan(dec), -1, 1))   # ascensional difference
+        if above:
+            ra = ramc + fraction * (np.pi / 2 + ad)
+        else:
+            ra = ramc + np.pi - fraction * (np.pi / 2 - ad)
+        lam = _ecliptic_from_ra(ra, eps)
+    return lam
+
+
+def house_cusps(times, lat, lon, ayanamsa=0.0) -> Dict[str, np.ndarray]:
+    """
+    Ascendant, MC and house cusps for arrays of instants and places
+
+    Args:
+        times: datetimes or datetime64 (UTC), any shape
+        lat, lon: degrees (north/east positive), broadcast against times
+        ayanamsa: degrees subtracted from every result (0 = tropical);
+            whole-sign houses follow the ascendant's sign in that zodiac
+
+    Returns:
+        {'lst': degrees, 'asc': degrees, 'mc': degrees,
+         'placidus': (..., 12) cusp longitudes, 'whole_sign': (..., 12)}
+        Placidus is clamped (not meaningful) inside the polar circles.
+    """
+    jd = julian_days(times)
+    lst = sidereal_time(jd, np.asarray(lon, dtype=float))
+    ramc = np.radians(lst)
+    eps = np.radians(obliquity(jd))
+    phi = np.radians(np.asarray(lat, dtype=float))
+
+    asc = np.arctan2(np.cos(ramc), -(np.sin(ramc) * np.cos(eps) + np.tan(phi) * np.sin(eps)))
+    mc = _ecliptic_from_ra(ramc, eps)
+
+    c11 = _placidus(ramc, eps, phi, 1 / 3, above=True)
+    c12 = _placidus(ramc, eps, phi, 2 / 3, above=True)
+    c2 = _placidus(ramc, eps, phi, 2 / 3, above=False)
+    c3 = _placidus(ramc, eps, phi, 1 / 3, above=False)
+    first_half = np.stack(np.broadcast_arrays(asc, c2, c3, mc + np.pi, c11 + np.pi, c12 + np.pi), axis=-1)
+    placidus = np.concatenate([first_half, first_half + np.pi], axis=-1)
+
+    shift = np.asarray(ayanamsa, dtype=float)
+    asc_deg = np.mod(np.degrees(asc) - shift, 360.0)
+    whole_sign = np.mod((asc_deg // 30)[..., None] * 30 + np.arange(12) * 30, 360.0)
+
+    return {
+        'lst': lst,
+        'asc': asc_deg,
+        'mc': np.mod(np.degrees(mc) - shift, 360.0),
+        'placidus': np.mod(np.degrees(placidus) - shift[..., None], 360.0),
+        'whole_sign': whole_sign
+    }
+
+
+def house_of(longitudes, cusps) -> np.ndarray:
+    """
+    House number (1-12) of each longitude given 12 cusps
+
+    Args:
+        longitudes: (..., n) degrees
+        cusps: (..., 12) degrees, house 1 first, broadcast against longitudes
+    """
+    lon = np.asarray(longitudes, dtype=float)[..., None]
+    cusps = np.asarray(cusps, dtype=float)[..., None, :]
+    # Distance from each cusp measured forward; the house is the cusp
+    # the body is past by less than that house's own width
+    past = np.mod(lon - cusps, 360.0)
+    width = np.mod(np.roll(cusps, -1, axis=-1) - cusps, 360.0)
+    return np.argmax(past < width, axis=-1) + 1
+
+
+if __name__ == "__main__":
+    import time
+
+    print("=" * 60)
+    print("HOUSE ENGINE TEST")
+    print("=" * 60)
+
+    birth = birth_to_utc('1976-07-31', '08:12', 'Asia/Kolkata')
+    print(f"\nBirth (UTC): {birth}")
+    houses = house_cusps(birth, 15.5057, 80.0499)
+    print(f"LST {float(houses['lst']):.4f}°  Asc {float(houses['asc']):.4f}°  MC {float(houses['mc']):.4f}°")
+    print("Placidus: " + ' '.join(f"{c:.2f}" for c in houses['placidus']))
+
+    grid = np.datetime64('2000-01-01T00:00') + np.arange(100000) * np.timedelta64(5, 'm')
+    started = time.perf_counter()
+    house_cusps(grid, 51.5, -0.12)
+    print(f"\n100000 instants: {(time.perf_counter() - started) * 1000:.1f} ms")
@@ -0,0 +1,118 @@
+"""
+Background Jobs
+Thread-pool executor for slow calls (LLM answers) that must outlive a Streamlit rerun
+"""
+
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Optional
+
+# Finished jobs are kept this long for their session to collect them
+DEFAULT_RESULT_TTL = 3600
+
+
+class JobExecutor:
+    """
+    Runs submitted calls on a shared thread pool and holds their results
+
+    Each job gets a random ID that the caller keeps (e.g. in
+    st.session_state), so the page can poll for the answer across reruns
+    without the script itself ever blocking on the call. A job is a dict:
+        {
+            'id': str,
+            'owner': str (phone) or None,
+            'status': 'queued' | 'running' | 'done' | 'failed',
+            'result': return value of the call,
+            'error': str (if the call raised),
+            'submitted_at', 'started_at', 'finished_at': epoch seconds
+        }
+    Jobs live in memory only; unfinished jobs are lost on restart.
+    """
+
+    def __init__(self, max_workers: int = 4, result_ttl: int = DEFAULT_RESULT_TTL):
+        self.result_ttl = result_ttl
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='astro-job')
+        self._jobs: Dict[str, Dict] = {}
+        self._lock = threading.Lock()
+
+    def submit(self, fn: Callable, *args, owner: Optional[str] = None, **kwargs) -> str:
+        """Queue fn(*args, **kwargs) and return its job ID"""
+        self._prune()
+        job = {
+            'id': uuid.uuid4().hex,
+            'owner': owner,
+            'status': 'queued',
+            'result': None,
+            'error': None,
+            'submitted_at': time.time(),
+            'started_at': None,
+            'finished_at': None
+        }
+        with self._lock:
+            self._jobs[job['id']] = job
+        self._pool.submit(self._run, job, fn, args, kwargs)
+        return job['id']
+
+    def _run(self, job: Dict, fn: Callable, args: tuple, kwargs: Dict):
+        job['started_at'] = time.time()
+        job['status'] = 'running'
+        try:
+            result = fn(*args, **kwargs)
+        except Exception as e:
+            job['error'] = str(e)
+            job['finished_at'] = time.time()
+            job['status'] = 'failed'
+        else:
+            # Status is set last so a reader that sees 'done' sees the result
+            job['result'] = result
+            job['finished_at'] = time.time()
+            job['status'] = 'done'
+
+    def get(self, job_id: str, owner: Optional[str] = None) -> Optional[Dict]:
+        """
+        Snapshot of a job, or None if unknown, expired or owned by someone else
+        """
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is None or (owner is not None and job['owner'] != owner):
+            return None
+        return dict(job)
+
+    def discard(self, job_id: str):
+        """Forget a job; a running call finishes but its result is dropped"""
+        with self._lock:
+            self._jobs.pop(job_id, None)
+
+    def pending_count(self) -> int:
+        """Jobs queued or running"""
+        with self._lock:
+            return sum(1 for job in self._jobs.values() if job['finished_at'] is None)
+
+    def _prune(self):
+        """Drop finished jobs nobody collected within result_ttl"""
+        cutoff = time.time() - self.result_ttl
+        with self._lock:
+            expired = [job_id for job_id, job in self._jobs.items()
+                       if job['finished_at'] is not None and job['finished_at'] < cutoff]
+            for job_id in expired:
+                del self._jobs[job_id]
+
+
+if __name__ == "__main__":
+    print("=" * 60)
+    print("JOB EXECUTOR TEST")
+    print("=" * 60)
+
+    jobs = JobExecutor(max_workers=2)
+    slow = jobs.submit(lambda: time.sleep(0.5) or 'answer', owner='+919876543210')
+    broken = jobs.submit(lambda: 1 / 0)
+
+    while jobs.pending_count():
+        print(f"  {jobs.get(slow)['status']}...")
+        time.sleep(0.2)
+
+    print(f"\nSlow job:   {jobs.get(slow, owner='+919876543210')}")
+    print(f"Wrong user: {jobs.get(slow, owner='+14155552671')}")
+    print(f"Failed job: {jobs.get(broken)['error']}")
@@ -0,0 +1,150 @@
+"""
+KP (Krishnamurti Paddhati) Sub-Lords
+The 249-row sub-division table and a batched binary-search resolver
+"""
+
+from typing import Dict
+
+import numpy as np
+
+from dasha import LORDS, YEARS, TOTAL_YEARS
+
+ARCSEC_PER_SIGN = 30 * 3600
+ARCSEC_PER_NAKSHATRA = 48000          # 13°20'
+ARCSEC_PER_CIRCLE = 360 * 3600
+
+# Sign rulers as indices into LORDS
+SIGN_LORDS = np.array([LORDS.index(lord) for lord in (
+    'Mars', 'Venus', 'Mercury', 'Moon', 'Sun', 'Mercury',
+    'Venus', 'Mars', 'Jupiter', 'Saturn', 'Saturn', 'Jupiter'
+)])
+
+ABBR = {'Ketu': 'Ke', 'Venus': 'Ve', 'Sun': 'Su', 'Moon': 'Mo', 'Mars': 'Ma',
+        'Rahu': 'Ra', 'Jupiter': 'Ju', 'Saturn': 'Sa', 'Mercury': 'Me'}
+
+
+def _build_table():
+    """
+    The 249 KP subs: 27 stars x 9 Vimshottari subs, with the six subs
+    that straddle a sign boundary split in two
+
+    Sub lengths are YEARS/120 of a nakshatra, whole arc-seconds
+    (Ketu 2800", Venus 8000", ...), so boundaries are exact integers.
+
+    Returns:
+        (starts, star_lords, sub_lords) int arrays of 249 rows
+    """
+    starts, stars, subs = [], [], []
+    position = 0
+    for nakshatra in range(27):
+        star = nakshatra % 9
+        for step in range(9):
+            sub = (star + step) % 9
+            end = position + ARCSEC_PER_NAKSHATRA * YEARS[sub] // TOTAL_YEARS
+            cuts = [position] + [b for b in range(0, ARCSEC_PER_CIRCLE, ARCSEC_PER_SIGN)
+                                 if position < b < end]
+            for cut in cuts:
+                starts.append(cut)
+                stars.append(star)
+                subs.append(sub)
+            position = end
+    return np.array(starts), np.array(stars), np.array(subs)
+
+
+KP_STARTS, KP_STAR_LORDS, KP_SUB_LORDS = _build_table()
+
+
+def _build_sub_subs():
+    """
+    Sub-sub boundaries: each of the 243 unsplit subs divided again in
+    Vimshottari proportion (2187 rows, fractional arc-seconds)
+    """
+    starts, lords = [], []
+    position = 0.0
+    for nakshatra in range(27):
+        star = nakshatra % 9
+        for step in range(9):
+            sub = (star + step) % 9
+            sub_length = ARCSEC_PER_NAKSHATRA * YEARS[sub] / TOTAL_YEARS
+            for inner in range(9):
+                lord = (sub + inner) % 9
+                starts.append(position)
+                lords.append(lord)
+                position += sub_length * YEARS[lord] / TOTAL_YEARS
+    return np.array(starts), np.array(lords)
+
+
+_SUB_SUB_STARTS, _SUB_SUB_LORDS = _build_sub_subs()
+
+
+def kp_lords(longitudes) -> np.ndarray:
+    """
+    KP lords for an array of sidereal longitudes
+
+    Args:
+        longitudes: array-like of degrees, any shape (...)
+
+    Returns:
+        int array of shape (5, ...): sub number (1-249), then sign, star,
+        sub and sub-sub lords as indices into LORDS
+    """
+    arcsec = np.mod(np.asarray(longitudes, dtype=float) * 3600, ARCSEC_PER_CIRCLE)
+    row = np.searchsorted(KP_STARTS, arcsec, side='right') - 1
+    sub_sub = np.searchsorted(_SUB_SUB_STARTS, arcsec, side='right') - 1
+    return np.stack([
+        row + 1,
+        SIGN_LORDS[(arcsec // ARCSEC_PER_SIGN).astype(int)],
+        KP_STAR_LORDS[row],
+        KP_SUB_LORDS[row],
+        _SUB_SUB_LORDS[sub_sub]
+    ])
+
+
+def kp_positions(bodies: Dict[str, Dict]) -> Dict[str, Dict]:
+    """
+    KP lords for every body of a chart or transit dict in one pass
+
+    Args:
+        bodies: {name: {'longitude': sidereal degrees, ...}}
+
+    Returns:
+        {name: {'sub': int, 'sign_lord', 'star_lord', 'sub_lord', 'sub_sub_lord'}}
+    """
+    names = list(bodies)
+    lords = kp_lords([bodies[name]['longitude'] for name in names])
+    return {
+        name: {
+            'sub': int(lords[0, i]),
+            'sign_lord': LORDS[lords[1, i]],
+            'star_lord': LORDS[lords[2, i]],
+            'sub_lord': LORDS[lords[3, i]],
+            'sub_sub_lord': LORDS[lords[4, i]]
+        }
+        for i, name in enumerate(names)
+    }
+
+
+def format_kp(positions: Dict[str, Dict]) -> str:
+    """One line per body: 'Moon: sub 150 Ve/Ma/Ju/Sa' (sign/star/sub/sub-sub)"""
+    return '\n'.join(
+        f"{name}: sub {kp['sub']} " + '/'.join(
+            ABBR[kp[key]] for key in ('sign_lord', 'star_lord', 'sub_lord', 'sub_sub_lord'))
+        for name, kp in positions.items()
+    )
+
+
+if __name__ == "__main__":
+    import time
+
+    print("=" * 60)
+    print("KP SUB-LORD TEST")
+    print("=" * 60)
+
+    print(f"\nTable rows: {len(KP_STARTS)}")
+    for lon in (0.0, 3.5, 29.99, 30.0, 160.94, 359.99):
+        print(f"{lon:7.2f}°  " + format_kp(kp_positions({'x': {'longitude': lon}}))[3:])
+
+    grid = np.random.uniform(0, 360, size=100000)
+    started = time.perf_counter()
+    kp_lords(grid)
+    print(f"\n100000 longitudes: {(time.perf_counter() - started) * 1000:.1f} ms")
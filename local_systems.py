@@ -0,0 +1,379 @@
+"""
+Local System Calculators
+Deterministic Chinese, Mayan and numerology results computed once per user
+"""
+
+import hashlib
+import json
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+from datetime import date, datetime
+from typing import Callable, Dict, List, Optional, Tuple
+
+from place_autocomplete import romanize
+
+# name -> {'name', 'fn', 'version', 'core', 'budget'}; core systems run
+# for every user, the rest only when picked in custom_systems (same
+# option names as the registration form)
+_REGISTRY: Dict[str, Dict] = {}
+
+# Seconds a calculator may take before the ask path stops waiting for it
+DEFAULT_BUDGET = 0.25
+
+# Calculators run side by side; a slow one can't hold up the others
+_POOL = ThreadPoolExecutor(max_workers=4, thread_name_prefix='local-system')
+
+# (system, version, profile fingerprint) -> facts, most recently used last
+MEMO_SIZE = 4096
+_memo: 'OrderedDict[Tuple, Optional[Dict]]' = OrderedDict()
+_memo_lock = threading.Lock()
+
+
+def register_system(name: str, version: int = 1, core: bool = False,
+                    budget: float = DEFAULT_BUDGET):
+    """
+    Decorator that adds a calculator to the registry
+
+    The calculator takes a profile {'name': str, 'dob': date or None,
+    'tob': 'HH:MM' or None} and returns a dict of facts including a
+    one-line 'summary', or None if the profile lacks what it needs.
+    Bump `version` when its output changes so cached results refresh;
+    `budget` can be changed later with set_budget().
+    """
+    def decorator(fn: Callable) -> Callable:
+        _REGISTRY[name] = {'name': name, 'fn': fn, 'version': version,
+                           'core': core, 'budget': budget}
+        return fn
+    return decorator
+
+
+def set_budget(name: str, budget: float):
+    """
+    Change a registered system's time budget (seconds)
+
+    Takes effect from the next compute_local_systems() call, so
+    deployments can tune budgets without touching the calculators.
+    """
+    if name not in _REGISTRY:
+        raise KeyError(f"Unknown local system: {name!r}")
+    if budget <= 0:
+        raise ValueError(f"Budget must be positive, got {budget!r}")
+    _REGISTRY[name]['budget'] = float(budget)
+
+
+def systems_for_user(user: Dict) -> List[str]:
+    """Registered systems that apply to this user, core systems first"""
+    selected = set(user.get('custom_systems') or [])
+    return ([name for name, entry in _REGISTRY.items() if entry['core']] +
+            [name for name, entry in _REGISTRY.items() if not entry['core'] and name in selected])
+
+
+def build_profile(user: Dict) -> Dict:
+    """The calculator inputs from a user record"""
+    birth = user.get('birth_details') or {}
+    try:
+        dob = datetime.strptime(birth.get('dob') or '', '%Y-%m-%d').date()
+    except ValueError:
+        dob = None
+    return {
+        'name': user.get('name') or '',
+        'dob': dob,
+        'tob': birth.get('tob')
+    }
+
+
+def _profile_fingerprint(profile: Dict) -> Tuple:
+    return (profile['name'], profile['dob'].isoformat() if profile['dob'] else None, profile['tob'])
+
+
+def local_systems_key(user: Dict) -> str:
+    """Fingerprint of everything a cached result depends on"""
+    name, dob, tob = _profile_fingerprint(build_profile(user))
+    payload = {
+        'name': name,
+        'dob': dob,
+        'tob': tob,
+        'systems': [[system, _REGISTRY[system]['version']] for system in systems_for_user(user)]
+    }
+    return hashlib.sha1(json.dumps(payload, sort_keys=True).encode('utf-8')).hexdigest()[:16]
+
+
+def _remember(key: Tuple, facts: Optional[Dict]):
+    with _memo_lock:
+        _memo[key] = facts
+        _memo.move_to_end(key)
+        while len(_memo) > MEMO_SIZE:
+            _memo.popitem(last=False)
+
+
+def _run(entry: Dict, profile: Dict, key: Tuple) -> Optional[Dict]:
+    """Run one calculator on the pool and memoise its result"""
+    try:
+        facts = entry['fn'](profile)
+    except Exception as e:
+        # One broken calculator shouldn't fail the question
+        print(f"Warning: {entry['name']} failed: {e}")
+        facts = None
+    _remember(key, facts)
+    return facts
+
+
+def compute_local_systems(user: Dict) -> Tuple[Dict[str, Dict], List[str]]:
+    """
+    Run every applicable calculator concurrently, each within its budget
+
+    Results are memoised per (system, version, inputs), so only systems
+    not seen before for this user's data actually run. A calculator that
+    overruns its budget is left to finish in the background - its result
+    is memoised for the next call - and reported as timed out.
+
+    Returns:
+        ({system name: facts} for the calculators that had enough input,
+         [names of systems that timed out])
+    """
+    profile = build_profile(user)
+    fingerprint = _profile_fingerprint(profile)
+    started = time.monotonic()
+
+    results, timed_out, running = {}, [], []
+    for name in systems_for_user(user):
+        entry = _REGISTRY[name]
+        key = (name, entry['version'], fingerprint)
+        with _memo_lock:
+            hit = key in _memo
+            facts = _memo.get(key)
+        if hit:
+            if facts:
+                results[name] = facts
+        else:
+            running.append((name, entry['budget'], _POOL.submit(_run, entry, profile, key)))
+
+    # Tightest budget first, so each wait is bounded by its own deadline
+    for name, budget, future in sorted(running, key=lambda item: item[1]):
+        try:
+            facts = future.result(timeout=max(0.0, started + budget - time.monotonic()))
+        except TimeoutError:
+            timed_out.append(name)
+            continue
+        if facts:
+            results[name] = facts
+
+    # Keep prompt order stable (core systems first) regardless of finish order
+    order = systems_for_user(user)
+    return dict(sorted(results.items(), key=lambda item: order.index(item[0]))), timed_out
+
+
+# ---------------------------------------------------------------------------
+# Chinese zodiac
+# ---------------------------------------------------------------------------
+
+# Chinese New Year (first day of the first lunar month) for 1900-2100 as
+# MMDD, from new-moon and solar-term times in China Standard Time
+# (Beijing mean time before 1929)
+LUNAR_NEW_YEAR_FIRST = 1900
+LUNAR_NEW_YEAR = (
+    '013102190208012902160204012502130202012202100130021802060126021402030123'
+    '021102010220020801280216020501240213020201230210013002170206012602140204'
+    '012402110131021902080127021502050125021302020122021001290217020601270214'
+    '020301240212013102180208012802150205012502130202012102090130021702060127'
+    '021502030123021101310218020701280216020501250213020202200209012902170206'
+    '012702150204012302100131021902070128021602050124021202010122020901290218'
+    '020701260214020301230210013102190208012802160205012502120201012202100129'
+    '021702060126021302030123021101310219020801280215020401240212020101220210'
+    '013002170206012602140202012302110201021902080128021502040124021202020121'
+    '020901290217020501260214020301230211013102190207012702150205012402120202'
+    '012202090129021702060126021402030124021001300218020701270215020501250212'
+    '020101210209'
+)
+LUNAR_NEW_YEAR_LAST = LUNAR_NEW_YEAR_FIRST + len(LUNAR_NEW_YEAR) // 4 - 1
+
+ANIMALS = ('Rat', 'Ox', 'Tiger', 'Rabbit', 'Dragon', 'Snake',
+           'Horse', 'Goat', 'Monkey', 'Rooster', 'Dog', 'Pig')
+ELEMENTS = ('Wood', 'Fire', 'Earth', 'Metal', 'Water')
+STEMS = ('Jia', 'Yi', 'Bing', 'Ding', 'Wu', 'Ji', 'Geng', 'Xin', 'Ren', 'Gui')
+BRANCHES = ('Zi', 'Chou', 'Yin', 'Mao', 'Chen', 'Si', 'Wu', 'Wei', 'Shen', 'You', 'Xu', 'Hai')
+
+
+def lunar_new_year(year: int) -> date:
+    """Date of Chinese New Year in a Gregorian year (1900-2100)"""
+    if not LUNAR_NEW_YEAR_FIRST <= year <= LUNAR_NEW_YEAR_LAST:
+        raise ValueError(f"No lunar new year data for {year}")
+    i = (year - LUNAR_NEW_YEAR_FIRST) * 4
+    return date(year, int(LUNAR_NEW_YEAR[i:i + 2]), int(LUNAR_NEW_YEAR[i + 2:i + 4]))
+
+
+@register_system('Chinese Zodiac', core=True)
+def chinese_zodiac(profile: Dict) -> Optional[Dict]:
+    dob = profile['dob']
+    if dob is None or not LUNAR_NEW_YEAR_FIRST <= dob.year <= LUNAR_NEW_YEAR_LAST:
+        return None
+
+    # Born before the new year -> still the previous lunar year
+    lunar_year = dob.year if dob >= lunar_new_year(dob.year) else dob.year - 1
+    if lunar_year < LUNAR_NEW_YEAR_FIRST:
+        return None
+    stem = (lunar_year - 4) % 10
+    branch = (lunar_year - 4) % 12
+    animal = ANIMALS[branch]
+    element = ELEMENTS[stem // 2]
+    polarity = 'Yang' if stem % 2 == 0 else 'Yin'
+    starts = lunar_new_year(lunar_year)
+
+    return {
+        'lunar_year': lunar_year,
+        'animal': animal,
+        'element': element,
+        'polarity': polarity,
+        'stem_branch': f"{STEMS[stem]}-{BRANCHES[branch]}",
+        'year_starts': starts.isoformat(),
+        'summary': (f"{polarity} {element} {animal} "
+                    f"({STEMS[stem]}-{BRANCHES[branch]} year from {starts.isoformat()})")
+    }
+
+
+# ---------------------------------------------------------------------------
+# Mayan calendar
+# ---------------------------------------------------------------------------
+
+# GMT correlation: JDN of the Long Count epoch 13.0.0.0.0 (4 Ahau 8 Cumku)
+MAYA_EPOCH_JDN = 584283
+DAY_SIGNS = ('Imix', 'Ik', 'Akbal', 'Kan', 'Chicchan', 'Cimi', 'Manik', 'Lamat', 'Muluc', 'Oc',
+             'Chuen', 'Eb', 'Ben', 'Ix', 'Men', 'Cib', 'Caban', 'Etznab', 'Cauac', 'Ahau')
+HAAB_MONTHS = ('Pop', 'Uo', 'Zip', 'Zotz', 'Tzec', 'Xul', 'Yaxkin', 'Mol', 'Chen', 'Yax',
+               'Zac', 'Ceh', 'Mac', 'Kankin', 'Muan', 'Pax', 'Kayab', 'Cumku', 'Uayeb')
+
+
+@register_system('Mayan Tzolkin', core=True)
+def mayan_tzolkin(profile: Dict) -> Optional[Dict]:
+    dob = profile['dob']
+    if dob is None:
+        return None
+
+    days = dob.toordinal() + 1721425 - MAYA_EPOCH_JDN  # JDN - epoch
+    number = (days + 3) % 13 + 1
+    sign = DAY_SIGNS[(days + 19) % 20]
+    haab = (days + 348) % 365
+    haab_day, haab_month = haab % 20, HAAB_MONTHS[haab // 20]
+
+    long_count = []
+    for unit in (144000, 7200, 360, 20, 1):
+        long_count.append(days // unit)
+        days %= unit
+    long_count = '.'.join(str(n) for n in long_count)
+
+    return {
+        'tzolkin_number': number,
+        'day_sign': sign,
+        'haab': f"{haab_day} {haab_month}",
+        'long_count': long_count,
+        'summary': f"{number} {sign}; Haab {haab_day} {haab_month}; Long Count {long_count}"
+    }
+
+
+# ---------------------------------------------------------------------------
+# Numerology
+# ---------------------------------------------------------------------------
+
+MASTER_NUMBERS = {11, 22, 33}
+VOWELS = set('AEIOU')
+PYTHAGOREAN = {letter: i % 9 + 1 for i, letter in enumerate('ABCDEFGHIJKLMNOPQRSTUVWXYZ')}
+CHALDEAN = {
+    'A': 1, 'I': 1, 'J': 1, 'Q': 1, 'Y': 1,
+    'B': 2, 'K': 2, 'R': 2,
+    'C': 3, 'G': 3, 'L': 3, 'S': 3,
+    'D': 4, 'M': 4, 'T': 4,
+    'E': 5, 'H': 5, 'N': 5, 'X': 5,
+    'U': 6, 'V': 6, 'W': 6,
+    'O': 7, 'Z': 7,
+    'F': 8, 'P': 8
+}
+
+
+def reduce_number(n: int, keep_master: bool = True) -> int:
+    """Digit-sum down to one digit, stopping at 11/22/33 if keep_master"""
+    while n > 9 and not (keep_master and n in MASTER_NUMBERS):
+        n = sum(int(d) for d in str(n))
+    return n
+
+
+def name_letters(name: str) -> str:
+    """Upper-case A-Z letters of a name, romanizing Indic scripts first"""
+    text = unicodedata.normalize('NFKD', romanize(name))
+    return ''.join(ch for ch in text.upper() if 'A' <= ch <= 'Z')
+
+
+def life_path(dob: date) -> int:
+    """Month, day and year reduced separately, then summed and reduced"""
+    return reduce_number(reduce_number(dob.month) + reduce_number(dob.day) + reduce_number(dob.year))
+
+
+@register_system('Numerology (Pythagorean)')
+def pythagorean_numerology(profile: Dict) -> Optional[Dict]:
+    letters = name_letters(profile['name'])
+    if profile['dob'] is None and not letters:
+        return None
+
+    facts, parts = {}, []
+    if profile['dob'] is not None:
+        facts['life_path'] = life_path(profile['dob'])
+        facts['birthday'] = reduce_number(profile['dob'].day)
+        parts += [f"life path {facts['life_path']}", f"birthday {facts['birthday']}"]
+    if letters:
+        facts['expression'] = reduce_number(sum(PYTHAGOREAN[c] for c in letters))
+        facts['soul_urge'] = reduce_number(sum(PYTHAGOREAN[c] for c in letters if c in VOWELS))
+        facts['personality'] = reduce_number(sum(PYTHAGOREAN[c] for c in letters if c not in VOWELS))
+        parts += [f"expression {facts['expression']}", f"soul urge {facts['soul_urge']}",
+                  f"personality {facts['personality']}"]
+    facts['summary'] = '; '.join(parts)
+    return facts
+
+
+@register_system('Numerology (Chaldean)')
+def chaldean_numerology(profile: Dict) -> Optional[Dict]:
+    letters = name_letters(profile['name'])
+    if profile['dob'] is None and not letters:
+        return None
+
+    facts, parts = {}, []
+    if profile['dob'] is not None:
+        facts['birth_number'] = reduce_number(profile['dob'].day, keep_master=False)
+        facts['destiny_number'] = reduce_number(life_path(profile['dob']), keep_master=False)
+        parts += [f"birth number {facts['birth_number']}", f"destiny {facts['destiny_number']}"]
+    if letters:
+        compound = sum(CHALDEAN[c] for c in letters)
+        facts['name_compound'] = compound
+        facts['name_number'] = reduce_number(compound, keep_master=False)
+        parts.append(f"name {compound}/{facts['name_number']}")
+    facts['summary'] = '; '.join(parts)
+    return facts
+
+
+if __name__ == "__main__":
+    print("=" * 60)
+    print("LOCAL SYSTEMS TEST")
+    print("=" * 60)
+
+    user = {
+        'name': 'Venkatesh Reddy',
+        'birth_details': {'dob': '1976-07-31', 'tob': '08:12'},
+        'custom_systems': ['Numerology (Pythagorean)', 'Numerology (Chaldean)', 'Tarot']
+    }
+    print(f"\nSystems: {systems_for_user(user)}")
+    print(f"Key:     {local_systems_key(user)}\n")
+    started = time.perf_counter()
+    results, timed_out = compute_local_systems(user)
+    print(f"First run:  {(time.perf_counter() - started) * 1000:.2f} ms")
+    started = time.perf_counter()
+    compute_local_systems(user)
+    print(f"Memoised:   {(time.perf_counter() - started) * 1000:.2f} ms\n")
+    for name, facts in results.items():
+        print(f"{name}: {facts['summary']}")
+    print()
+
+    for dob in ('2012-12-21', '1990-01-20', '2034-02-18'):
+        user['birth_details']['dob'] = dob
+        results, _ = compute_local_systems(user)
+        print(f"{dob}: {results['Chinese Zodiac']['summary']} | {results['Mayan Tzolkin']['summary']}")
@@ -0,0 +1,309 @@
+"""
+JSON → SQLite Migration Tool
+Streams users.json / sessions.json / subscriptions.json into SQLite in
+batched, resumable transactions
+
+Usage:
+    python migrate_json.py                      # all three files from data/
+    python migrate_json.py users --batch-size 200
+    python migrate_json.py --db data/astro.db --data-dir data
+"""
+
+import argparse
+import codecs
+import json
+import os
+import sqlite3
+from typing import Dict, Iterator, Optional, Tuple
+
+from phone_numbers import parse_phone
+
+SOURCES = {
+    'users': 'users.json',
+    'sessions': 'sessions.json',
+    'subscriptions': 'subscriptions.json',
+}
+
+WHITESPACE = ' \t\n\r'
+
+
+class JSONObjectStream:
+    """
+    Incremental reader for a file holding one top-level JSON object
+
+    Yields (key, value, end_offset) per member without loading the file.
+    Memory is bounded by the largest single member. ``end_offset`` is the
+    byte offset just past the member's value; pass it back as
+    ``start_offset`` to resume after that member.
+    """
+
+    def __init__(self, path: str, start_offset: int = 0, chunk_size: int = 1 << 16):
+        self.path = path
+        self.start_offset = start_offset
+        self.chunk_size = chunk_size
+        self._decoder = json.JSONDecoder()
+
+    def __iter__(self) -> Iterator[Tuple[str, object, int]]:
+        with open(self.path, 'rb') as f:
+            f.seek(self.start_offset)
+            utf8 = codecs.getincrementaldecoder('utf-8')()
+            self._file = f
+            self._utf8 = utf8
+            self._buf = ''
+            self._pos = 0
+            self._base = self.start_offset  # byte offset of self._buf[0]
+            self._eof = False
+
+            state = 'start' if self.start_offset == 0 else 'after_value'
+            while True:
+                ch = self._peek_non_ws()
+
+                if state == 'start':
+                    self._expect(ch, '{')
+                    state = 'key_or_end'
+                elif state == 'after_value':
+                    if ch == '}':
+                        return
+                    self._expect(ch, ',')
+                    state = 'key'
+                elif state in ('key', 'key_or_end'):
+                    if state == 'key_or_end' and ch == '}':
+                        return
+                    key = self._decode()
+                    if not isinstance(key, str):
+                        raise ValueError(f"{self.path}: expected an object key at byte {self._offset()}")
+                    self._expect(self._peek_non_ws(), ':')
+                    self._peek_non_ws()
+                    value = self._decode()
+                    yield key, value, self._offset()
+                    state = 'after_value'
+
+    def _offset(self) -> int:
+        """Byte offset of the current read position"""
+        return self._base + len(self._buf[:self._pos].encode('utf-8'))
+
+    def _fill(self) -> bool:
+        """Drop consumed text and read the next chunk; False at end of file"""
+        if self._eof:
+            return False
+        self._base = self._offset()
+        self._buf = self._buf[self._pos:]
+        self._pos = 0
+        chunk = self._file.read(self.chunk_size)
+        if not chunk:
+            self._eof = True
+            self._buf += self._utf8.decode(b'', final=True)
+            return False
+        self._buf += self._utf8.decode(chunk)
+        return True
+
+    def _peek_non_ws(self) -> str:
+        while True:
+            while self._pos < len(self._buf) and self._buf[self._pos] in WHITESPACE:
+                self._pos += 1
+            if self._pos < len(self._buf):
+                return self._buf[self._pos]
+            if not self._fill():
+                raise ValueError(f"{self.path}: unexpected end of file")
+
+    def _expect(self, ch: str, wanted: str):
+        if ch != wanted:
+            raise ValueError(f"{self.path}: expected '{wanted}' at byte {self._offset()}, got '{ch}'")
+        self._pos += 1
+
+    def _decode(self):
+        """Decode one JSON value at the current position, reading more as needed"""
+        while True:
+            try:
+                value, end = self._decoder.raw_decode(self._buf, self._pos)
+            except json.JSONDecodeError:
+                if self._fill():
+                    continue
+                raise
+            # A number at the very end of the buffer may continue in the next chunk
+            if end == len(self._buf) and not self._eof and self._fill():
+                continue
+            self._pos = end
+            return value
+
+
+def _split_place(place: str) -> Tuple[Optional[str], Optional[str], Optional[str]]:
+    """'Ongole, Andhra Pradesh, India' -> (city, state, country)"""
+    parts = [p.strip() for p in (place or '').split(',') if p.strip()]
+    if not parts:
+        return None, None, None
+    if len(parts) == 1:
+        return parts[0], None, None
+    if len(parts) == 2:
+        return parts[0], None, parts[1]
+    return parts[0], ', '.join(parts[1:-1]), parts[-1]
+
+
+def normalize_user(phone: str, user: Dict) -> Dict:
+    """
+    Bring a legacy user record up to the shape register_user writes today
+
+    Old records keep birth place as one 'place' string and lack most
+    counters. 'place' is kept (the profile editor still shows it); the
+    structured city/state/country fields are added alongside it.
+    """
+    user = dict(user)
+    birth = dict(user.get('birth_details') or {})
+
+    # Phone first: its country and timezone stand in for a place that
+    # names only the city
+    phone_info = parse_phone(phone)
+    if phone_info:
+        if not user.get('country_code'):
+            user['country_code'] = phone_info['code']
+        user.setdefault('country_name', phone_info['country'])
+        user.setdefault('timezone', phone_info['timezone'])
+
+    if birth.get('place') and not birth.get('city'):
+        city, state, country = _split_place(birth['place'])
+        birth['city'] = city
+        birth['state'] = birth.get('state') or state
+        if not birth.get('country') and not country:
+            country = user.get('country_name')
+            birth['timezone'] = birth.get('timezone') or user.get('timezone')
+        birth['country'] = birth.get('country') or country
+
+    birth.setdefault('quality', 'exact' if birth.get('dob') else 'none')
+    for field in ('city', 'state', 'country', 'timezone'):
+        birth.setdefault(field, None)
+    user['birth_details'] = birth
+
+    subscription = user.get('subscription', 'FREE')
+    lifetime = user.get('lifetime_questions', 0)
+    user.setdefault('subscription', subscription)
+    user.setdefault('tier', subscription)
+    user.setdefault('email', '')
+    user.setdefault('language', 'English')
+    user.setdefault('custom_systems', [])
+    user.setdefault('lifetime_questions', lifetime)
+    user.setdefault('questions_asked', lifetime)
+    user.setdefault('questions_left', max(0, 7 - lifetime) if subscription == 'FREE' else 999999)
+    user.setdefault('registered_at', None)
+    user.setdefault('updated_at', user['registered_at'])
+    return user
+
+
+NORMALIZERS = {
+    'users': normalize_user,
+}
+
+
+class SQLiteBackend:
+    """Target store: one table per source, records as JSON keyed by phone"""
+
+    def __init__(self, db_path: str):
+        os.makedirs(os.path.dirname(db_path) or '.', exist_ok=True)
+        self.conn = sqlite3.connect(db_path, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        for table in SOURCES:
+            self.conn.execute(
+                f"CREATE TABLE IF NOT EXISTS {table} (phone TEXT PRIMARY KEY, data TEXT NOT NULL)"
+            )
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS migration_progress ("
+            " source TEXT PRIMARY KEY, size INTEGER, mtime REAL,"
+            " byte_offset INTEGER, records INTEGER, done INTEGER)"
+        )
+
+    def get_progress(self, source: str, size: int, mtime: float) -> Tuple[int, int, bool]:
+        """(byte_offset, records, done) to resume from; restarts if the file changed"""
+        row = self.conn.execute(
+            "SELECT size, mtime, byte_offset, records, done FROM migration_progress WHERE source = ?",
+            (source,)
+        ).fetchone()
+        if not row or row[0] != size or row[1] != mtime:
+            return 0, 0, False
+        return row[2], row[3], bool(row[4])
+
+    def write_batch(self, table: str, batch: list, source: str, size: int, mtime: float,
+                    byte_offset: int, records: int, done: bool = False):
+        """Upsert a batch and advance the checkpoint in the same transaction"""
+        self.conn.execute("BEGIN")
+        try:
+            self.conn.executemany(
+                f"INSERT OR REPLACE INTO {table} (phone, data) VALUES (?, ?)",
+                [(key, json.dumps(value, ensure_ascii=False)) for key, value in batch]
+            )
+            self.conn.execute(
+                "INSERT OR REPLACE INTO migration_progress VALUES (?, ?, ?, ?, ?, ?)",
+                (source, size, mtime, byte_offset, records, int(done))
+            )
+            self.conn.execute("COMMIT")
+        except Exception:
+            self.conn.execute("ROLLBACK")
+            raise
+
+
+def migrate_file(backend: SQLiteBackend, table: str, path: str, batch_size: int = 500) -> Dict:
+    """
+    Stream one JSON file into its table
+
+    Returns:
+        {'table': str, 'records': int, 'resumed_from': int, 'skipped': bool}
+    """
+    if not os.path.exists(path):
+        return {'table': table, 'records': 0, 'resumed_from': 0, 'skipped': True}
+
+    source = os.path.abspath(path)
+    stat = os.stat(path)
+    offset, records, done = backend.get_progress(source, stat.st_size, stat.st_mtime)
+    if done:
+        return {'table': table, 'records': records, 'resumed_from': offset, 'skipped': True}
+
+    resumed_from = offset
+    normalize = NORMALIZERS.get(table)
+    batch = []
+
+    for key, value, end_offset in JSONObjectStream(path, start_offset=offset):
+        if normalize:
+            value = normalize(key, value)
+        batch.append((key, value))
+        records += 1
+        offset = end_offset
+
+        if len(batch) >= batch_size:
+            backend.write_batch(table, batch, source, stat.st_size, stat.st_mtime, offset, records)
+            batch = []
+
+    backend.write_batch(table, batch, source, stat.st_size, stat.st_mtime, offset, records, done=True)
+    return {'table': table, 'records': records, 'resumed_from': resumed_from, 'skipped': False}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Migrate JSON data files to SQLite")
+    parser.add_argument('tables', nargs='*', metavar='table',
+                        help=f"subset of {', '.join(SOURCES)} (default: all)")
+    parser.add_argument('--data-dir', default='data')
+    parser.add_argument('--db', default='data/astro.db')
+    parser.add_argument('--batch-size', type=int, default=500)
+    args = parser.parse_args(argv)
+    unknown = set(args.tables) - set(SOURCES)
+    if unknown:
+        parser.error(f"unknown table(s): {', '.join(sorted(unknown))}")
+
+    backend = SQLiteBackend(args.db)
+
+    print("=" * 60)
+    print("JSON → SQLITE MIGRATION")
+    print("=" * 60)
+
+    for table in args.tables or list(SOURCES):
+        path = os.path.join(args.data_dir, SOURCES[table])
+        result = migrate_file(backend, table, path, args.batch_size)
+
+        if result['skipped'] and not result['records']:
+            print(f"  {table:<14} no source file, skipped")
+        elif result['skipped']:
+            print(f"  {table:<14} already migrated ({result['records']} records)")
+        else:
+            resumed = f" (resumed at byte {result['resumed_from']})" if result['resumed_from'] else ""
+            print(f"✓ {table:<14} {result['records']} records{resumed}")
+
+
+if __name__ == "__main__":
+    main()
@@ -4,9 +4,12 @@ Handles sending and verifying OTP codes via SMS
 """
 
 import os
-import json
-from datetime import datetime, timedelta
-from typing import Dict, Optional, Tuple
+import heapq
+import sqlite3
+import threading
+import time
+from collections import deque
+from typing import Deque, Dict, Optional, Tuple
 import hashlib
 import secrets
 
@@ -14,6 +17,140 @@ import secrets
 # For now, this is a mock implementation that will work locally
 # and can be easily replaced with real Firebase later
 
+
+class MemoryOTPStore:
+    """
+    In-process OTP store
+    
+    Pending OTPs live in a dict with a min-heap of expiry times beside it,
+    so expired codes are dropped on every access without scanning. Send
+    history per phone/IP is a deque of timestamps (sliding window).
+    """
+    
+    def __init__(self):
+        self._otps: Dict[str, Dict] = {}
+        self._expiry_heap = []  # (expires_at, phone)
+        self._sends: Dict[str, Deque[float]] = {}
+        self._sends_pruned_at = 0.0
+        self._lock = threading.Lock()
+    
+    def get(self, phone: str) -> Optional[Dict]:
+        with self._lock:
+            data = self._otps.get(phone)
+            return dict(data) if data else None
+    
+    def put(self, phone: str, data: Dict):
+        with self._lock:
+            self._otps[phone] = dict(data)
+            heapq.heappush(self._expiry_heap, (data['expires_at'], phone))
+    
+    def delete(self, phone: str):
+        with self._lock:
+            self._otps.pop(phone, None)
+    
+    def purge_expired(self, now: float) -> int:
+        """Pop expired entries off the heap; stale heap entries are skipped"""
+        removed = 0
+        with self._lock:
+            while self._expiry_heap and self._expiry_heap[0][0] < now:
+                expires_at, phone = heapq.heappop(self._expiry_heap)
+                data = self._otps.get(phone)
+                # A resend replaces the entry, leaving an older heap item behind
+                if data and data['expires_at'] == expires_at:
+                    del self._otps[phone]
+                    removed += 1
+            
+            # Drop send histories that have aged out entirely (hourly)
+            if now - self._sends_pruned_at >= OTPService.SEND_WINDOW_SECONDS:
+                cutoff = now - OTPService.SEND_WINDOW_SECONDS
+                for key in [k for k, w in self._sends.items() if w[-1] <= cutoff]:
+                    del self._sends[key]
+                self._sends_pruned_at = now
+        return removed
+    
+    def record_send(self, key: str, now: float):
+        with self._lock:
+            self._sends.setdefault(key, deque()).append(now)
+    
+    def count_sends(self, key: str, since: float) -> Tuple[int, Optional[float]]:
+        """Sends for key after ``since`` and the oldest of them"""
+        with self._lock:
+            window = self._sends.get(key)
+            if not window:
+                return 0, None
+            while window and window[0] <= since:
+                window.popleft()
+            if not window:
+                del self._sends[key]
+                return 0, None
+            return len(window), window[0]
+
+
+class SQLiteOTPStore:
+    """
+    OTP store shared by all workers on one host (SQLite file)
+    
+    Each operation touches one indexed row instead of rewriting a JSON
+    file. Same interface as MemoryOTPStore.
+    """
+    
+    def __init__(self, db_path: str):
+        os.makedirs(os.path.dirname(db_path) or '.', exist_ok=True)
+        self.db_path = db_path
+        self._local = threading.local()
+        with self._conn() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS otp_codes ("
+                " phone TEXT PRIMARY KEY, otp_hash TEXT, sent_at REAL,"
+                " expires_at REAL, attempts INTEGER)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS otp_expiry ON otp_codes (expires_at)")
+            conn.execute("CREATE TABLE IF NOT EXISTS otp_sends (key TEXT, sent_at REAL)")
+            conn.execute("CREATE INDEX IF NOT EXISTS otp_sends_key ON otp_sends (key, sent_at)")
+    
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+    
+    def get(self, phone: str) -> Optional[Dict]:
+        row = self._conn().execute(
+            "SELECT otp_hash, sent_at, expires_at, attempts FROM otp_codes WHERE phone = ?",
+            (phone,)
+        ).fetchone()
+        if not row:
+            return None
+        return {'otp_hash': row[0], 'sent_at': row[1], 'expires_at': row[2], 'attempts': row[3]}
+    
+    def put(self, phone: str, data: Dict):
+        self._conn().execute(
+            "INSERT OR REPLACE INTO otp_codes VALUES (?, ?, ?, ?, ?)",
+            (phone, data['otp_hash'], data['sent_at'], data['expires_at'], data['attempts'])
+        )
+    
+    def delete(self, phone: str):
+        self._conn().execute("DELETE FROM otp_codes WHERE phone = ?", (phone,))
+    
+    def purge_expired(self, now: float) -> int:
+        conn = self._conn()
+        removed = conn.execute("DELETE FROM otp_codes WHERE expires_at < ?", (now,)).rowcount
+        conn.execute("DELETE FROM otp_sends WHERE sent_at < ?", (now - OTPService.SEND_WINDOW_SECONDS,))
+        return removed
+    
+    def record_send(self, key: str, now: float):
+        self._conn().execute("INSERT INTO otp_sends VALUES (?, ?)", (key, now))
+    
+    def count_sends(self, key: str, since: float) -> Tuple[int, Optional[float]]:
+        count, oldest = self._conn().execute(
+            "SELECT COUNT(*), MIN(sent_at) FROM otp_sends WHERE key = ? AND sent_at > ?",
+            (key, since)
+        ).fetchone()
+        return count, oldest
+
+
 class OTPService:
     """
     OTP Service using Firebase Phone Authentication
@@ -21,25 +158,32 @@ class OTPService:
     Features:
     - Send 6-digit OTP via SMS
     - Verify OTP codes
-    - Rate limiting (1 OTP per phone per minute)
-    - Expiry (5 minutes)
+    - Rate limiting (1 OTP per phone per minute, plus hourly caps
+      per phone and per IP address)
+    - Expiry (5 minutes, evicted automatically)
     - Max attempts (3)
+    
+    OTPs are kept in memory by default. Pass ``otp_storage_path`` (a
+    SQLite file) when several worker processes need to see the same codes.
     """
     
-    def __init__(self, otp_storage_path='data/otp_codes.json'):
+    OTP_TTL_SECONDS = 5 * 60
+    RESEND_COOLDOWN_SECONDS = 60
+    MAX_ATTEMPTS = 3
+    SEND_WINDOW_SECONDS = 3600
+    MAX_SENDS_PER_PHONE = 5   # per SEND_WINDOW_SECONDS
+    MAX_SENDS_PER_IP = 20     # per SEND_WINDOW_SECONDS
+    
+    def __init__(self, otp_storage_path: Optional[str] = None):
         self.storage_path = otp_storage_path
-        self._ensure_storage_exists()
+        if otp_storage_path:
+            self.store = SQLiteOTPStore(otp_storage_path)
+        else:
+            self.store = MemoryOTPStore()
         
         # Firebase configuration (will be loaded from environment)
         self.firebase_configured = self._check_firebase_config()
     
-    def _ensure_storage_exists(self):
-        """Create OTP storage file if it doesn't exist"""
-        os.makedirs(os.path.dirname(self.storage_path), exist_ok=True)
-        if not os.path.exists(self.storage_path):
-            with open(self.storage_path, 'w') as f:
-                json.dump({}, f)
-    
     def _check_firebase_config(self) -> bool:
         """Check if Firebase is properly configured"""
         # Check for Firebase credentials in environment
@@ -55,82 +199,75 @@ class OTPService:
         return hashlib.sha256(otp.encode()).hexdigest()
     
     def _get_otp_data(self, phone: str) -> Optional[Dict]:
-        """Get stored OTP data for a phone number"""
-        with open(self.storage_path, 'r') as f:
-            otp_data = json.load(f)
-        return otp_data.get(phone)
-    
-    def _save_otp_data(self, phone: str, data: Dict):
-        """Save OTP data"""
-        with open(self.storage_path, 'r') as f:
-            otp_data = json.load(f)
-        
-        otp_data[phone] = data
-        
-        with open(self.storage_path, 'w') as f:
-            json.dump(otp_data, f, indent=2)
+        """Get stored OTP data for a phone number (expired codes are evicted first)"""
+        self.store.purge_expired(time.time())
+        return self.store.get(phone)
     
-    def _clear_otp_data(self, phone: str):
-        """Clear OTP data after successful verification"""
-        with open(self.storage_path, 'r') as f:
-            otp_data = json.load(f)
-        
-        if phone in otp_data:
-            del otp_data[phone]
-            
-            with open(self.storage_path, 'w') as f:
-                json.dump(otp_data, f, indent=2)
+    def _check_send_window(self, key: str, limit: int, now: float) -> Optional[int]:
+        """Seconds until ``key`` may send again, or None if under its hourly cap"""
+        count, oldest = self.store.count_sends(key, now - self.SEND_WINDOW_SECONDS)
+        if count < limit:
+            return None
+        return int(oldest + self.SEND_WINDOW_SECONDS - now) + 1
     
-    def can_send_otp(self, phone: str) -> Tuple[bool, str]:
+    def can_send_otp(self, phone: str, ip_address: Optional[str] = None) -> Tuple[bool, str]:
         """
         Check if OTP can be sent (rate limiting)
         
         Returns:
             (can_send: bool, message: str)
         """
+        now = time.time()
         data = self._get_otp_data(phone)
         
-        if not data:
-            return True, "OK"
-        
-        last_sent = datetime.fromisoformat(data['sent_at'])
-        time_since_last = datetime.now() - last_sent
+        if data:
+            time_since_last = now - data['sent_at']
+            if time_since_last < self.RESEND_COOLDOWN_SECONDS:
+                wait_seconds = self.RESEND_COOLDOWN_SECONDS - int(time_since_last)
+                return False, f"Please wait {wait_seconds} seconds before requesting another OTP"
         
-        if time_since_last < timedelta(minutes=1):
-            wait_seconds = 60 - int(time_since_last.total_seconds())
-            return False, f"Please wait {wait_seconds} seconds before requesting another OTP"
+        wait = self._check_send_window(f"phone:{phone}", self.MAX_SENDS_PER_PHONE, now)
+        if wait is None and ip_address:
+            wait = self._check_send_window(f"ip:{ip_address}", self.MAX_SENDS_PER_IP, now)
+        if wait is not None:
+            return False, f"Too many OTP requests. Please try again in {max(1, wait // 60)} minutes"
         
         return True, "OK"
     
-    def send_otp(self, phone: str, country_code: str) -> Tuple[bool, str, Optional[str]]:
+    def send_otp(self, phone: str, country_code: str,
+                 ip_address: Optional[str] = None) -> Tuple[bool, str, Optional[str]]:
         """
         Send OTP code via SMS
         
         Args:
             phone: Phone number (with country code, e.g., +919876543210)
             country_code: Country code (e.g., +91)
+            ip_address: Client IP, for the per-IP send limit (optional)
         
         Returns:
             (success: bool, message: str, otp: str | None)
             Note: otp is returned only in development mode for testing
         """
         # Check rate limit
-        can_send, message = self.can_send_otp(phone)
+        can_send, message = self.can_send_otp(phone, ip_address)
         if not can_send:
             return False, message, None
         
         # Generate OTP
         otp_code = self._generate_otp()
         otp_hash = self._hash_otp(otp_code)
+        now = time.time()
         
         # Save OTP data
-        self._save_otp_data(phone, {
+        self.store.put(phone, {
             'otp_hash': otp_hash,
-            'sent_at': datetime.now().isoformat(),
-            'expires_at': (datetime.now() + timedelta(minutes=5)).isoformat(),
-            'attempts': 0,
-            'verified': False
+            'sent_at': now,
+            'expires_at': now + self.OTP_TTL_SECONDS,
+            'attempts': 0
         })
+        self.store.record_send(f"phone:{phone}", now)
+        if ip_address:
+            self.store.record_send(f"ip:{ip_address}", now)
         
         if self.firebase_configured:
             # Send via Firebase Phone Authentication
@@ -158,65 +295,44 @@ class OTPService:
         Returns:
             (success: bool, message: str)
         """
-        data = self._get_otp_data(phone)
+        data = self.store.get(phone)
         
         if not data:
             return False, "No OTP request found. Please request a new OTP."
         
-        # Check if already verified
-        if data.get('verified'):
-            return False, "OTP already used. Please request a new OTP."
-        
         # Check expiry
-        expires_at = datetime.fromisoformat(data['expires_at'])
-        if datetime.now() > expires_at:
-            self._clear_otp_data(phone)
+        if time.time() > data['expires_at']:
+            self.store.delete(phone)
             return False, "OTP expired. Please request a new OTP."
         
         # Check attempts
-        if data['attempts'] >= 3:
-            self._clear_otp_data(phone)
+        if data['attempts'] >= self.MAX_ATTEMPTS:
+            self.store.delete(phone)
             return False, "Maximum attempts exceeded. Please request a new OTP."
         
         # Verify OTP
         otp_hash = self._hash_otp(otp_code)
         
-        if otp_hash != data['otp_hash']:
+        if not secrets.compare_digest(otp_hash, data['otp_hash']):
             # Increment attempts
             data['attempts'] += 1
-            self._save_otp_data(phone, data)
             
-            remaining = 3 - data['attempts']
+            remaining = self.MAX_ATTEMPTS - data['attempts']
             if remaining > 0:
+                self.store.put(phone, data)
                 return False, f"Invalid OTP. {remaining} attempts remaining."
             else:
-                self._clear_otp_data(phone)
+                self.store.delete(phone)
                 return False, "Invalid OTP. Maximum attempts exceeded."
         
-        # Success - mark as verified and clear data
-        data['verified'] = True
-        self._save_otp_data(phone, data)
-        
-        # Clear OTP data after successful verification
-        self._clear_otp_data(phone)
+        # Success - OTP is single use
+        self.store.delete(phone)
         
         return True, "Phone number verified successfully!"
     
-    def cleanup_expired_otps(self):
-        """Remove expired OTP entries (run periodically)"""
-        with open(self.storage_path, 'r') as f:
-            otp_data = json.load(f)
-        
-        now = datetime.now()
-        cleaned_data = {}
-        
-        for phone, data in otp_data.items():
-            expires_at = datetime.fromisoformat(data['expires_at'])
-            if now <= expires_at:
-                cleaned_data[phone] = data
-        
-        with open(self.storage_path, 'w') as f:
-            json.dump(cleaned_data, f, indent=2)
+    def cleanup_expired_otps(self) -> int:
+        """Remove expired OTP entries (also done automatically on every check)"""
+        return self.store.purge_expired(time.time())
 
 
 # Singleton instance
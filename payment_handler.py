@@ -6,6 +6,10 @@ Supports both Indian (Razorpay) and International (Stripe) users
 
 import os
 import json
+import hmac
+import hashlib
+import queue
+import threading
 from datetime import datetime
 from typing import Dict, Optional, Tuple
 
@@ -20,6 +24,12 @@ class PaymentHandler:
     - BASIC: ₹99/month (India), $2/month (International)
     - FAMILY: ₹499/month (India), $8/month (International)  
     - VIP: ₹4,000/month (India), $40/month (International)
+    
+    Gateway calls never happen inside a user's request. Webhook events
+    (and checkout confirmations that need a gateway lookup) go on a
+    queue. A background worker applies each one exactly once, keyed by
+    event ID. Subscription status is served from an in-memory cache,
+    and a periodic reconciliation job bulk-refreshes it from the gateway.
     """
     
     # Pricing in paise (for Razorpay) and cents (for Stripe)
@@ -68,18 +78,57 @@ class PaymentHandler:
         }
     }
     
-    def __init__(self, subscriptions_path='data/subscriptions.json'):
+    # Gateway events that (re)activate or end a subscription
+    ACTIVATING_EVENTS = {'payment.captured', 'subscription.activated', 'subscription.charged'}
+    ENDING_EVENTS = {
+        'subscription.cancelled': 'cancelled',
+        'subscription.halted': 'halted',
+        'subscription.completed': 'completed'
+    }
+    # Gateway statuses of a subscription that no longer grants its plan
+    ENDED_STATUSES = set(ENDING_EVENTS.values()) | {'expired'}
+    
+    RECONCILE_INTERVAL_SECONDS = 6 * 3600
+    RECONCILE_PAGE_SIZE = 100
+    
+    # An event that can't be applied yet (payment not captured, phone not
+    # known) is queued again after attempt x RETRY_SECONDS; past the last
+    # attempt, reconciliation picks the subscription up from the gateway
+    RETRY_SECONDS = 30
+    MAX_ATTEMPTS = 10
+    
+    def __init__(
+        self,
+        subscriptions_path='data/subscriptions.json',
+        events_log_path='data/payment_events.log',
+        razorpay_client=None,
+        start_worker: bool = True
+    ):
         self.subscriptions_path = subscriptions_path
+        self.events_log_path = events_log_path
         self._ensure_storage_exists()
         
+        # In-memory caches: subscription per phone, applied event IDs
+        self._lock = threading.RLock()
+        with open(self.subscriptions_path, 'r') as f:
+            self._subscriptions = json.load(f)
+        self._processed_events = self._load_processed_events()
+        self._events = queue.Queue()
+        
         # Check if Razorpay/Stripe is configured
         self.razorpay_configured = self._check_razorpay_config()
         self.stripe_configured = self._check_stripe_config()
         
-        if self.razorpay_configured:
+        if razorpay_client is not None:
+            self.razorpay_client = razorpay_client
+            self.razorpay_configured = True
+        elif self.razorpay_configured:
             self._init_razorpay()
         if self.stripe_configured:
             self._init_stripe()
+        
+        if start_worker:
+            threading.Thread(target=self._worker_loop, daemon=True).start()
     
     def _ensure_storage_exists(self):
         """Create subscriptions storage if doesn't exist"""
@@ -123,21 +172,32 @@ class PaymentHandler:
             print("Stripe not installed. Run: pip install stripe")
             self.stripe_configured = False
     
+    def _load_processed_events(self) -> set:
+        """Event IDs already applied (one per line, append-only)"""
+        if not os.path.exists(self.events_log_path):
+            return set()
+        with open(self.events_log_path, 'r') as f:
+            return {line.strip() for line in f if line.strip()}
+    
+    def _mark_event_processed(self, event_id: str):
+        self._processed_events.add(event_id)
+        with open(self.events_log_path, 'a') as f:
+            f.write(event_id + '\n')
+    
     def _get_subscription_data(self, phone: str) -> Optional[Dict]:
-        """Get subscription data for user"""
-        with open(self.subscriptions_path, 'r') as f:
-            subscriptions = json.load(f)
-        return subscriptions.get(phone)
+        """Get subscription data for user (from the in-memory cache)"""
+        data = self._subscriptions.get(phone)
+        return dict(data) if data else None
+    
+    def _write_subscriptions(self):
+        with open(self.subscriptions_path, 'w') as f:
+            json.dump(self._subscriptions, f, indent=2)
     
     def _save_subscription_data(self, phone: str, data: Dict):
         """Save subscription data for user"""
-        with open(self.subscriptions_path, 'r') as f:
-            subscriptions = json.load(f)
-        
-        subscriptions[phone] = data
-        
-        with open(self.subscriptions_path, 'w') as f:
-            json.dump(subscriptions, f, indent=2)
+        with self._lock:
+            self._subscriptions[phone] = data
+            self._write_subscriptions()
     
     def create_subscription(
         self, 
@@ -190,6 +250,15 @@ class PaymentHandler:
                 # Create subscription via Razorpay
                 subscription = self.razorpay_client.subscription.create(subscription_data)
                 
+                # Remember the plan so later events only need the subscription ID
+                sub_data = self._get_subscription_data(phone) or {}
+                if sub_data.get('status') != 'active':
+                    self._save_subscription_data(phone, {
+                        'subscription_id': subscription['id'],
+                        'plan_id': plan_id,
+                        'status': 'created'
+                    })
+                
                 return True, "Subscription created", {
                     'subscription_id': subscription['id'],
                     'payment_url': f"https://razorpay.com/subscriptions/{subscription['id']}",
@@ -206,47 +275,284 @@ class PaymentHandler:
         except Exception as e:
             return False, f"Payment error: {str(e)}", None
     
+    def _verify_checkout_signature(
+        self,
+        payment_id: str,
+        subscription_id: str,
+        signature: str
+    ) -> bool:
+        """Check the razorpay_signature returned by Checkout (no network call)"""
+        secret = os.getenv('RAZORPAY_KEY_SECRET')
+        if not secret or not signature:
+            return False
+        expected = hmac.new(
+            secret.encode(),
+            f"{payment_id}|{subscription_id}".encode(),
+            hashlib.sha256
+        ).hexdigest()
+        return hmac.compare_digest(expected, signature)
+    
+    def verify_webhook_signature(self, body: bytes, signature: str) -> bool:
+        """Check the X-Razorpay-Signature header of a webhook request"""
+        secret = os.getenv('RAZORPAY_WEBHOOK_SECRET')
+        if not secret or not signature:
+            return False
+        expected = hmac.new(secret.encode(), body, hashlib.sha256).hexdigest()
+        return hmac.compare_digest(expected, signature)
+    
     def verify_payment(
         self,
         phone: str,
         payment_id: str,
-        subscription_id: str
+        subscription_id: str,
+        signature: Optional[str] = None
     ) -> Tuple[bool, str]:
         """
-        Verify payment after user completes it
+        Confirm a payment after user completes checkout
+        
+        A valid Checkout signature activates the subscription right away.
+        Without one, the payment is queued for a gateway lookup by the
+        background worker and the subscription stays 'pending' until then.
         
         Args:
             phone: User's phone number
             payment_id: Payment ID from Razorpay/Stripe
             subscription_id: Subscription ID
+            signature: razorpay_signature from Checkout (optional)
         
         Returns:
             (success: bool, message: str)
         """
-        try:
-            if self.razorpay_configured:
-                # Fetch payment details
-                payment = self.razorpay_client.payment.fetch(payment_id)
-                
-                if payment['status'] == 'captured':
-                    # Payment successful - activate subscription
-                    subscription_data = {
-                        'subscription_id': subscription_id,
-                        'payment_id': payment_id,
-                        'status': 'active',
-                        'activated_at': datetime.now().isoformat(),
-                        'next_billing': payment.get('next_billing_at')
-                    }
-                    
-                    self._save_subscription_data(phone, subscription_data)
-                    return True, "Subscription activated successfully!"
-                else:
-                    return False, f"Payment status: {payment['status']}"
-            
+        if not self.razorpay_configured:
             return False, "Payment gateway not configured"
         
-        except Exception as e:
-            return False, f"Verification error: {str(e)}"
+        if signature:
+            if not self._verify_checkout_signature(payment_id, subscription_id, signature):
+                return False, "Payment signature mismatch"
+            
+            self._apply_event({
+                'id': f"checkout:{payment_id}",
+                'event': 'payment.captured',
+                'payload': {'payment': {'entity': {
+                    'id': payment_id,
+                    'subscription_id': subscription_id,
+                    'notes': {'phone': phone}
+                }}}
+            })
+            return True, "Subscription activated successfully!"
+        
+        sub_data = self._get_subscription_data(phone) or {}
+        if sub_data.get('status') != 'active':
+            sub_data.update({
+                'subscription_id': subscription_id,
+                'payment_id': payment_id,
+                'status': 'pending'
+            })
+            self._save_subscription_data(phone, sub_data)
+        
+        self.enqueue_event({
+            'id': f"verify:{payment_id}",
+            'event': 'payment.verify',
+            'payload': {'payment': {'entity': {
+                'id': payment_id,
+                'subscription_id': subscription_id,
+                'notes': {'phone': phone}
+            }}}
+        })
+        return True, "Payment received - your plan will be active in a moment."
+    
+    def enqueue_event(self, event: Dict) -> bool:
+        """
+        Queue a webhook event for background processing
+        
+        Returns:
+            False if this event ID was already applied (duplicate delivery)
+        """
+        event_id = event.get('id')
+        if not event_id or event_id in self._processed_events:
+            return False
+        self._events.put(event)
+        return True
+    
+    def _worker_loop(self):
+        """Apply queued events; reconcile with the gateway every few hours"""
+        last_reconcile = datetime.now()
+        while True:
+            try:
+                event = self._events.get(timeout=60)
+            except queue.Empty:
+                event = None
+            
+            if event is not None:
+                try:
+                    self.process_event(event)
+                except Exception as e:
+                    print(f"Payment event {event.get('id')} failed: {e}")
+            
+            if (datetime.now() - last_reconcile).total_seconds() >= self.RECONCILE_INTERVAL_SECONDS:
+                try:
+                    self.reconcile_subscriptions()
+                except Exception as e:
+                    print(f"Subscription reconciliation failed: {e}")
+                last_reconcile = datetime.now()
+    
+    def process_pending_events(self) -> int:
+        """Drain the queue synchronously (for jobs and tests without the worker)"""
+        processed = 0
+        while True:
+            try:
+                event = self._events.get_nowait()
+            except queue.Empty:
+                return processed
+            if self.process_event(event):
+                processed += 1
+    
+    def process_event(self, event: Dict) -> bool:
+        """
+        Apply one event if it has not been applied before
+        
+        Returns:
+            True if the event changed state, False if it was a duplicate
+        """
+        if event['event'] == 'payment.verify':
+            # Checkout without a signature: ask the gateway (off the request path)
+            payment_id = event['payload']['payment']['entity']['id']
+            payment = self.razorpay_client.payment.fetch(payment_id)
+            if payment['status'] != 'captured':
+                if payment['status'] != 'failed':
+                    self._retry_later(event)
+                return False
+            entity = {**event['payload']['payment']['entity'], **payment}
+            entity['notes'] = {**(payment.get('notes') or {}),
+                               **event['payload']['payment']['entity']['notes']}
+            event = {**event, 'event': 'payment.captured',
+                     'payload': {'payment': {'entity': entity}}}
+        
+        return self._apply_event(event)
+    
+    def _retry_later(self, event: Dict):
+        """Queue an event again after a growing delay, up to MAX_ATTEMPTS times"""
+        attempt = event.get('attempt', 0) + 1
+        if attempt < self.MAX_ATTEMPTS:
+            timer = threading.Timer(attempt * self.RETRY_SECONDS,
+                                    self.enqueue_event, args=({**event, 'attempt': attempt},))
+            timer.daemon = True
+            timer.start()
+    
+    def _phone_for_subscription(self, subscription_id: Optional[str]) -> Optional[str]:
+        """Phone whose local record holds this gateway subscription"""
+        if not subscription_id:
+            return None
+        with self._lock:
+            return self._phones_by_subscription_id().get(subscription_id)
+    
+    def _phones_by_subscription_id(self) -> Dict[str, str]:
+        """{subscription_id: phone} over the cached records (call with the lock held)"""
+        return {
+            data['subscription_id']: phone
+            for phone, data in self._subscriptions.items()
+            if data.get('subscription_id')
+        }
+    
+    def _apply_event(self, event: Dict) -> bool:
+        """Idempotently apply a payment/subscription event to local state"""
+        event_id = event['id']
+        event_type = event['event']
+        payload = event.get('payload', {})
+        subscription = payload.get('subscription', {}).get('entity', {})
+        payment = payload.get('payment', {}).get('entity', {})
+        phone = ((subscription.get('notes') or {}).get('phone')
+                 or (payment.get('notes') or {}).get('phone'))
+        
+        with self._lock:
+            if event_id in self._processed_events:
+                return False
+            
+            if not phone:
+                # Subscriptions created outside our checkout carry no notes
+                phone = self._phone_for_subscription(
+                    subscription.get('id') or payment.get('subscription_id'))
+            if not phone:
+                # Left unprocessed; the checkout may not have recorded it yet
+                self._retry_later(event)
+                return False
+            
+            sub_data = self._get_subscription_data(phone) or {}
+            
+            if event_type in self.ACTIVATING_EVENTS:
+                sub_data.update({
+                    'subscription_id': (subscription.get('id') or payment.get('subscription_id')
+                                        or sub_data.get('subscription_id')),
+                    'plan_id': subscription.get('plan_id') or sub_data.get('plan_id', ''),
+                    'payment_id': payment.get('id') or sub_data.get('payment_id'),
+                    'status': 'active',
+                    'activated_at': sub_data.get('activated_at') or datetime.now().isoformat(),
+                    'next_billing': subscription.get('current_end') or sub_data.get('next_billing')
+                })
+            elif event_type in self.ENDING_EVENTS:
+                sub_data['status'] = self.ENDING_EVENTS[event_type]
+                sub_data['cancelled_at'] = datetime.now().isoformat()
+            else:
+                self._mark_event_processed(event_id)
+                return False
+            
+            self._save_subscription_data(phone, sub_data)
+            self._mark_event_processed(event_id)
+            return True
+    
+    def reconcile_subscriptions(self) -> Dict:
+        """
+        Bulk-refresh local subscription status from the gateway
+        
+        Pages through all gateway subscriptions and writes the
+        subscriptions file once at the end.
+        
+        Returns:
+            {'checked': int, 'updated': int}
+        """
+        if not self.razorpay_configured:
+            return {'checked': 0, 'updated': 0}
+        
+        with self._lock:
+            phone_by_sub_id = self._phones_by_subscription_id()
+        
+        checked = updated = 0
+        skip = 0
+        changes = {}
+        while True:
+            page = self.razorpay_client.subscription.all({
+                'count': self.RECONCILE_PAGE_SIZE,
+                'skip': skip
+            })
+            items = page.get('items', [])
+            
+            for remote in items:
+                phone = phone_by_sub_id.get(remote['id'])
+                if not phone:
+                    continue
+                checked += 1
+                changes[phone] = remote
+            
+            if len(items) < self.RECONCILE_PAGE_SIZE:
+                break
+            skip += self.RECONCILE_PAGE_SIZE
+        
+        with self._lock:
+            for phone, remote in changes.items():
+                local = self._subscriptions.get(phone, {})
+                fresh = {
+                    **local,
+                    'status': remote['status'],
+                    'plan_id': remote.get('plan_id') or local.get('plan_id', ''),
+                    'next_billing': remote.get('current_end') or local.get('next_billing')
+                }
+                if fresh != local:
+                    self._subscriptions[phone] = fresh
+                    updated += 1
+            if updated:
+                self._write_subscriptions()
+        
+        return {'checked': checked, 'updated': updated}
     
     def cancel_subscription(self, phone: str) -> Tuple[bool, str]:
         """Cancel user's subscription"""
@@ -289,6 +595,26 @@ class PaymentHandler:
             'subscription_id': sub_data.get('subscription_id')
         }
     
+    def get_active_tier(self, phone: str) -> Optional[str]:
+        """
+        Tier granted by the subscription, or None (cache read, never blocks)
+        
+        'FREE' once the subscription has ended, so callers drop a cancelled
+        user's paid tier. None when there is no record, the subscription is
+        still being set up, or the plan is missing or unknown, so callers
+        fall back to the tier on the user record instead of downgrading a
+        paying user to FREE.
+        """
+        sub_data = self._subscriptions.get(phone)
+        if not sub_data:
+            return None
+        if sub_data.get('status') in self.ENDED_STATUSES:
+            return 'FREE'
+        if sub_data.get('status') != 'active':
+            return None
+        tier = self._get_tier_from_plan(sub_data.get('plan_id') or '')
+        return None if tier == 'FREE' else tier
+    
     def _get_tier_from_plan(self, plan_id: str) -> str:
         """Extract tier from plan ID"""
         if 'BASIC' in plan_id:
@@ -0,0 +1,141 @@
+"""
+Phone Number Parsing
+Prefix-trie country lookup and cached timezones for phone numbers
+"""
+
+from datetime import datetime
+from functools import lru_cache
+from typing import Dict, Optional
+
+from country_utils import COUNTRY_CODES
+
+# Residence timezone per calling code (one zone per country; +1 uses Eastern)
+TIMEZONE_BY_CODE = {
+    '+91': 'Asia/Kolkata',      # India
+    '+1': 'America/New_York',    # US/Canada (Eastern)
+    '+44': 'Europe/London',      # UK
+    '+971': 'Asia/Dubai',        # UAE
+    '+966': 'Asia/Riyadh',       # Saudi Arabia
+    '+234': 'Africa/Lagos',      # Nigeria
+    '+233': 'Africa/Accra',      # Ghana
+    '+254': 'Africa/Nairobi',    # Kenya
+    '+256': 'Africa/Kampala',    # Uganda
+    '+255': 'Africa/Dar_es_Salaam', # Tanzania
+    '+251': 'Africa/Addis_Ababa',   # Ethiopia
+    '+27': 'Africa/Johannesburg',   # South Africa
+    '+20': 'Africa/Cairo',       # Egypt
+    '+65': 'Asia/Singapore',     # Singapore
+    '+60': 'Asia/Kuala_Lumpur',  # Malaysia
+    '+66': 'Asia/Bangkok',       # Thailand
+    '+62': 'Asia/Jakarta',       # Indonesia
+    '+63': 'Asia/Manila',        # Philippines
+    '+84': 'Asia/Ho_Chi_Minh',   # Vietnam
+    '+86': 'Asia/Shanghai',      # China
+    '+81': 'Asia/Tokyo',         # Japan
+    '+82': 'Asia/Seoul',         # South Korea
+    '+92': 'Asia/Karachi',       # Pakistan
+    '+880': 'Asia/Dhaka',        # Bangladesh
+    '+94': 'Asia/Colombo',       # Sri Lanka
+    '+977': 'Asia/Kathmandu',    # Nepal
+    '+61': 'Australia/Sydney',   # Australia
+    '+49': 'Europe/Berlin',      # Germany
+    '+33': 'Europe/Paris',       # France
+    '+39': 'Europe/Rome',        # Italy
+    '+34': 'Europe/Madrid',      # Spain
+    '+7': 'Europe/Moscow',       # Russia
+    '+55': 'America/Sao_Paulo',  # Brazil
+    '+52': 'America/Mexico_City', # Mexico
+}
+
+DEFAULT_TIMEZONE = 'UTC'
+
+
+def _build_trie() -> Dict:
+    """
+    Digit trie over all calling codes
+
+    Each node is a dict of digit -> child node; a node that ends a code
+    carries it under the '$' key. Codes are prefix-free in practice
+    (E.164), but the walk still returns the longest match.
+    """
+    root: Dict = {}
+    for code in COUNTRY_CODES:
+        node = root
+        for digit in code[1:]:
+            node = node.setdefault(digit, {})
+        node['$'] = code
+    return root
+
+
+_TRIE = _build_trie()
+
+
+def match_country_code(phone: str) -> Optional[str]:
+    """Longest calling code that prefixes ``phone`` ('+971…' -> '+971')"""
+    if not phone or not phone.startswith('+'):
+        return None
+    node = _TRIE
+    match = None
+    for digit in phone[1:]:
+        node = node.get(digit)
+        if node is None:
+            break
+        match = node.get('$', match)
+    return match
+
+
+@lru_cache(maxsize=None)
+def get_tzinfo(timezone_name: str):
+    """pytz timezone object, built once per name"""
+    import pytz
+    
+    try:
+        return pytz.timezone(timezone_name)
+    except pytz.UnknownTimeZoneError:
+        return pytz.UTC
+
+
+def timezone_for_code(country_code: str) -> str:
+    return TIMEZONE_BY_CODE.get(country_code, DEFAULT_TIMEZONE)
+
+
+def parse_phone(phone: str) -> Optional[Dict]:
+    """
+    Resolve a phone number to its country
+
+    Returns:
+        {
+            'code': '+91',
+            'country': 'India',
+            'languages': [...],
+            'timezone': 'Asia/Kolkata',
+            'national_number': '9876543210'
+        }
+        or None if no calling code matches
+    """
+    code = match_country_code(phone)
+    if code is None:
+        return None
+    return {
+        'code': code,
+        'country': COUNTRY_CODES[code]['country'],
+        'languages': COUNTRY_CODES[code]['languages'],
+        'timezone': timezone_for_code(code),
+        'national_number': phone[len(code):]
+    }
+
+
+def now_in_timezone(timezone_name: Optional[str]) -> datetime:
+    """Current time in a stored timezone name (UTC if missing)"""
+    return datetime.now(get_tzinfo(timezone_name or DEFAULT_TIMEZONE))
+
+
+if __name__ == "__main__":
+    test_numbers = ['+919876543210', '+14155552671', '+447911123456', '+971501234567', '12345']
+
+    for number in test_numbers:
+        info = parse_phone(number)
+        if info:
+            print(f"{number} → {info['country']} ({info['code']}, {info['timezone']})")
+        else:
+            print(f"{number} → unknown")
@@ -0,0 +1,344 @@
+"""
+Photo Storage
+Content-addressed palm/face photo storage with per-user quotas and
+background-built downscaled derivatives
+"""
+
+import hashlib
+import json
+import mmap
+import os
+import queue
+import re
+import tempfile
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from typing import BinaryIO, Dict, List, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows - fall back to in-process locking only
+    fcntl = None
+
+CHUNK_SIZE = 64 * 1024
+MAX_PHOTO_BYTES = 10 * 1024 * 1024
+
+# Storage included per tier (bytes); tiers not listed can't store photos
+TIER_QUOTAS = {
+    'PREMIUM': 50 * 1024 * 1024,
+    'VIP': 50 * 1024 * 1024,
+}
+
+# Derivative name -> longest side in pixels. 'prompt' fits one 768px
+# Gemini image tile, so each attached photo costs a fixed token count.
+DERIVATIVES = {
+    'prompt': 768,
+    'thumb': 256,
+}
+
+# Magic bytes of the formats the upload form accepts
+IMAGE_SIGNATURES = {
+    b'\xff\xd8\xff': 'image/jpeg',
+    b'\x89PNG\r\n\x1a\n': 'image/png',
+}
+
+# Photo kind -> the custom system that uses it
+PHOTO_SYSTEMS = {
+    'palm': 'Palmistry (Photo upload required)',
+    'face': 'Face Reading (Photo upload required)',
+}
+
+
+class PhotoStore:
+    """
+    Photos stored once per distinct content, charged to each user who uploads them
+
+    Layout (one directory):
+        objects/ab/<sha256>               - original upload bytes
+        derived/ab/<sha256>.<name>.jpg    - downscaled JPEGs (see DERIVATIVES)
+        users/<digits>.json               - {'used_bytes': int, 'photos': [...]}
+        refs.json                         - {sha256: number of user references}
+        .lock                             - serialises manifest/ref updates
+
+    Uploads are streamed to a temp file in CHUNK_SIZE pieces while being
+    hashed, and abort as soon as they would exceed the user's remaining
+    quota. Derivatives are built by a background worker (needs Pillow);
+    until one exists, open_derivative() returns None.
+    """
+
+    def __init__(self, directory: str = 'data/photos', background_worker: bool = True):
+        self.directory = directory
+        for sub in ('objects', 'derived', 'users', 'tmp'):
+            os.makedirs(os.path.join(directory, sub), exist_ok=True)
+
+        self._thread_lock = threading.Lock()
+        self._queue: 'queue.Queue[str]' = queue.Queue()
+        if background_worker:
+            threading.Thread(target=self._derive_loop, daemon=True).start()
+
+    # -- paths and locking -------------------------------------------------
+
+    def _object_path(self, digest: str) -> str:
+        return os.path.join(self.directory, 'objects', digest[:2], digest)
+
+    def _derived_path(self, digest: str, name: str) -> str:
+        return os.path.join(self.directory, 'derived', digest[:2], f'{digest}.{name}.jpg')
+
+    def _manifest_path(self, phone: str) -> str:
+        digits = re.sub(r'\D', '', phone or '')
+        if not digits:
+            raise ValueError(f"Invalid phone number: {phone!r}")
+        return os.path.join(self.directory, 'users', f'{digits}.json')
+
+    @contextmanager
+    def _lock(self):
+        """Exclusive lock across threads and processes"""
+        with self._thread_lock:
+            fd = os.open(os.path.join(self.directory, '.lock'), os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                if fcntl is not None:
+                    fcntl.flock(fd, fcntl.LOCK_EX)
+                yield
+            finally:
+                os.close(fd)
+
+    def _read_json(self, path: str, default: Dict) -> Dict:
+        try:
+            with open(path, 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return default
+
+    def _write_json(self, path: str, data: Dict):
+        tmp = path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(data, f, indent=2)
+        os.replace(tmp, path)
+
+    # -- uploads -----------------------------------------------------------
+
+    def manifest(self, phone: str) -> Dict:
+        """{'used_bytes': int, 'photos': [{'hash', 'kind', 'filename', 'size', 'mime', 'uploaded_at'}]}"""
+        return self._read_json(self._manifest_path(phone), {'used_bytes': 0, 'photos': []})
+
+    def remaining_bytes(self, phone: str, tier: str) -> int:
+        return max(0, TIER_QUOTAS.get(tier, 0) - self.manifest(phone)['used_bytes'])
+
+    def save(self, phone: str, fileobj: BinaryIO, kind: str, tier: str,
+             filename: str = '') -> Tuple[bool, str, Optional[Dict]]:
+        """
+        Stream an uploaded photo into the store
+
+        Args:
+            fileobj: Readable binary file (e.g. Streamlit UploadedFile)
+            kind: 'palm' or 'face'
+            tier: User's subscription tier, for the quota
+
+        Returns:
+            (success, message, photo entry or None)
+        """
+        if kind not in PHOTO_SYSTEMS:
+            return False, f"Unknown photo kind: {kind}", None
+        remaining = self.remaining_bytes(phone, tier)
+        if remaining <= 0:
+            if tier not in TIER_QUOTAS:
+                return False, "Photo storage requires the PREMIUM plan", None
+            return False, "Photo storage full - delete a photo to upload more", None
+        limit = min(remaining, MAX_PHOTO_BYTES)
+
+        sha = hashlib.sha256()
+        size = 0
+        mime = None
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.join(self.directory, 'tmp'))
+        try:
+            with os.fdopen(fd, 'wb') as out:
+                while True:
+                    chunk = fileobj.read(CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    if mime is None:
+                        mime = next((m for sig, m in IMAGE_SIGNATURES.items()
+                                     if chunk.startswith(sig)), None)
+                        if mime is None:
+                            return False, "Only JPEG and PNG photos are supported", None
+                    size += len(chunk)
+                    if size > limit:
+                        if limit == MAX_PHOTO_BYTES:
+                            return False, f"Photo is larger than {MAX_PHOTO_BYTES // (1024 * 1024)} MB", None
+                        return False, "Not enough photo storage left for this upload", None
+                    sha.update(chunk)
+                    out.write(chunk)
+            if size == 0:
+                return False, "Empty upload", None
+
+            digest = sha.hexdigest()
+            entry = {
+                'hash': digest,
+                'kind': kind,
+                'filename': filename,
+                'size': size,
+                'mime': mime,
+                'uploaded_at': datetime.now().isoformat()
+            }
+
+            with self._lock():
+                manifest = self.manifest(phone)
+                for existing in manifest['photos']:
+                    if existing['hash'] == digest and existing['kind'] == kind:
+                        return True, "Photo already uploaded", existing
+
+                # Re-check under the lock: another session may have uploaded meanwhile
+                if manifest['used_bytes'] + size > TIER_QUOTAS.get(tier, 0):
+                    return False, "Not enough photo storage left for this upload", None
+
+                path = self._object_path(digest)
+                if not os.path.exists(path):
+                    os.makedirs(os.path.dirname(path), exist_ok=True)
+                    os.replace(tmp_path, path)
+
+                refs_path = os.path.join(self.directory, 'refs.json')
+                refs = self._read_json(refs_path, {})
+                refs[digest] = refs.get(digest, 0) + 1
+                self._write_json(refs_path, refs)
+
+                manifest['photos'].append(entry)
+                manifest['used_bytes'] += size
+                self._write_json(self._manifest_path(phone), manifest)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+        self._queue.put(digest)
+        return True, "Photo saved", entry
+
+    def delete(self, phone: str, digest: str, kind: Optional[str] = None) -> bool:
+        """Remove a user's photo; the bytes go when no user references them"""
+        with self._lock():
+            manifest = self.manifest(phone)
+            keep, removed = [], None
+            for entry in manifest['photos']:
+                if removed is None and entry['hash'] == digest and kind in (None, entry['kind']):
+                    removed = entry
+                else:
+                    keep.append(entry)
+            if removed is None:
+                return False
+            manifest['photos'] = keep
+            manifest['used_bytes'] = max(0, manifest['used_bytes'] - removed['size'])
+            self._write_json(self._manifest_path(phone), manifest)
+
+            refs_path = os.path.join(self.directory, 'refs.json')
+            refs = self._read_json(refs_path, {})
+            refs[digest] = refs.get(digest, 1) - 1
+            if refs[digest] <= 0:
+                del refs[digest]
+                for path in [self._object_path(digest)] + [self._derived_path(digest, name)
+                                                           for name in DERIVATIVES]:
+                    if os.path.exists(path):
+                        os.remove(path)
+            self._write_json(refs_path, refs)
+        return True
+
+    # -- derivatives -------------------------------------------------------
+
+    def _derive_loop(self):
+        """Background worker: build missing derivatives for queued photos"""
+        while True:
+            digest = self._queue.get()
+            try:
+                self.build_derivatives(digest)
+            except Exception as e:
+                print(f"Warning: couldn't build derivatives for {digest[:12]}: {e}")
+
+    def build_derivatives(self, digest: str):
+        """Write every missing derivative of one original"""
+        missing = [name for name in DERIVATIVES if not os.path.exists(self._derived_path(digest, name))]
+        source = self._object_path(digest)
+        if not missing or not os.path.exists(source):
+            return
+
+        from PIL import Image, ImageOps
+
+        with Image.open(source) as original:
+            # Apply the camera's rotation, then drop EXIF (including GPS)
+            image = ImageOps.exif_transpose(original).convert('RGB')
+        for name in missing:
+            copy = image.copy()
+            copy.thumbnail((DERIVATIVES[name], DERIVATIVES[name]))
+            path = self._derived_path(digest, name)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            copy.save(path + '.tmp', 'JPEG', quality=85, optimize=True)
+            os.replace(path + '.tmp', path)
+
+    def open_derivative(self, digest: str, name: str = 'prompt') -> Optional[memoryview]:
+        """
+        Read-only view of a derivative, memory-mapped rather than copied
+
+        Returns None (and queues a build) if it doesn't exist yet.
+        """
+        path = self._derived_path(digest, name)
+        try:
+            with open(path, 'rb') as f:
+                return memoryview(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+        except (OSError, ValueError):
+            self._queue.put(digest)
+            return None
+
+    def send_derivative(self, digest: str, sock, name: str = 'prompt') -> int:
+        """Write a derivative to a socket with sendfile(); returns bytes sent"""
+        with open(self._derived_path(digest, name), 'rb') as f:
+            return sock.sendfile(f)
+
+    def prompt_images(self, phone: str, kinds: List[str], limit: int = 4) -> List[memoryview]:
+        """Ready 'prompt' derivatives of the user's photos of these kinds, newest first"""
+        images = []
+        for entry in reversed(self.manifest(phone)['photos']):
+            if entry['kind'] in kinds:
+                view = self.open_derivative(entry['hash'])
+                if view is not None:
+                    images.append(view)
+                    if len(images) == limit:
+                        break
+        return images
+
+
+# Singleton instance
+_photo_store = None
+
+def get_photo_store() -> PhotoStore:
+    """Get photo store singleton"""
+    global _photo_store
+    if _photo_store is None:
+        _photo_store = PhotoStore()
+    return _photo_store
+
+
+if __name__ == "__main__":
+    import io
+    import shutil
+
+    print("=" * 60)
+    print("PHOTO STORE TEST")
+    print("=" * 60)
+
+    root = tempfile.mkdtemp()
+    store = PhotoStore(root, background_worker=False)
+    photo = b'\xff\xd8\xff\xe0' + os.urandom(300 * 1024)
+
+    print(store.save('+919876543210', io.BytesIO(photo), 'palm', 'PREMIUM', 'left.jpg')[:2])
+    print(store.save('+919876543210', io.BytesIO(photo), 'palm', 'PREMIUM', 'left.jpg')[:2])
+    print(store.save('+14155552671', io.BytesIO(photo), 'palm', 'VIP', 'palm.jpg')[:2])
+    print(store.save('+14155552671', io.BytesIO(b'GIF89a...'), 'palm', 'VIP')[:2])
+    print(store.save('+447911123456', io.BytesIO(photo), 'face', 'FREE')[:2])
+
+    objects = sum(len(files) for _, _, files in os.walk(os.path.join(root, 'objects')))
+    print(f"\nObjects on disk: {objects}")
+    print(f"Used by +91...:  {store.manifest('+919876543210')['used_bytes']} bytes")
+
+    digest = hashlib.sha256(photo).hexdigest()
+    store.delete('+919876543210', digest)
+    print(f"After one delete, object kept: {os.path.exists(store._object_path(digest))}")
+    store.delete('+14155552671', digest)
+    print(f"After both deletes, object kept: {os.path.exists(store._object_path(digest))}")
+    shutil.rmtree(root)
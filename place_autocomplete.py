@@ -0,0 +1,323 @@
+"""
+Place Autocomplete
+Prefix + fuzzy suggestions over gazetteer names, including names typed
+in Indian scripts
+"""
+
+import threading
+import unicodedata
+from bisect import bisect_left
+from heapq import nsmallest
+from typing import Dict, List, Optional
+
+from geocoder import Gazetteer, get_gazetteer, normalize_name
+
+# Brahmic Unicode blocks share one layout (inherited from ISCII), so a
+# single table of offsets romanizes Devanagari (Hindi, Marathi), Bengali,
+# Gurmukhi (Punjabi), Gujarati, Odia, Tamil, Telugu, Kannada and Malayalam.
+# Urdu uses the Arabic script and is matched only by its stored names.
+BRAHMIC_BLOCKS = {
+    0x0900: 'devanagari',
+    0x0980: 'bengali',
+    0x0A00: 'gurmukhi',
+    0x0A80: 'gujarati',
+    0x0B00: 'odia',
+    0x0B80: 'tamil',
+    0x0C00: 'telugu',
+    0x0C80: 'kannada',
+    0x0D00: 'malayalam',
+}
+
+# Scripts whose languages usually drop a word-final inherent 'a'
+SCHWA_DELETING = {'devanagari', 'bengali', 'gurmukhi', 'gujarati'}
+
+INDEPENDENT_VOWELS = {
+    0x05: 'a', 0x06: 'aa', 0x07: 'i', 0x08: 'ii', 0x09: 'u', 0x0A: 'uu',
+    0x0B: 'ri', 0x0C: 'li', 0x0D: 'e', 0x0E: 'e', 0x0F: 'e', 0x10: 'ai',
+    0x11: 'o', 0x12: 'o', 0x13: 'o', 0x14: 'au',
+}
+
+CONSONANTS = {
+    0x15: 'k', 0x16: 'kh', 0x17: 'g', 0x18: 'gh', 0x19: 'n',
+    0x1A: 'ch', 0x1B: 'chh', 0x1C: 'j', 0x1D: 'jh', 0x1E: 'n',
+    0x1F: 't', 0x20: 'th', 0x21: 'd', 0x22: 'dh', 0x23: 'n',
+    0x24: 't', 0x25: 'th', 0x26: 'd', 0x27: 'dh', 0x28: 'n', 0x29: 'n',
+    0x2A: 'p', 0x2B: 'ph', 0x2C: 'b', 0x2D: 'bh', 0x2E: 'm',
+    0x2F: 'y', 0x30: 'r', 0x31: 'r', 0x32: 'l', 0x33: 'l', 0x34: 'zh',
+    0x35: 'v', 0x36: 'sh', 0x37: 'sh', 0x38: 's', 0x39: 'h',
+    0x58: 'q', 0x59: 'kh', 0x5A: 'gh', 0x5B: 'z', 0x5C: 'r', 0x5D: 'rh',
+    0x5E: 'f', 0x5F: 'y',
+}
+
+VOWEL_SIGNS = {
+    0x3E: 'aa', 0x3F: 'i', 0x40: 'ii', 0x41: 'u', 0x42: 'uu', 0x43: 'ri',
+    0x44: 'rri', 0x45: 'e', 0x46: 'e', 0x47: 'e', 0x48: 'ai', 0x49: 'o',
+    0x4A: 'o', 0x4B: 'o', 0x4C: 'au', 0x57: 'au',
+}
+
+VIRAMA = 0x4D
+ANUSVARA = {0x01, 0x02, 0x70}  # candrabindu, anusvara, Gurmukhi tippi
+VISARGA = 0x03
+# Malayalam chillu letters (consonants with no vowel)
+CHILLU = {0x7A: 'n', 0x7B: 'n', 0x7C: 'r', 0x7D: 'l', 0x7E: 'l', 0x7F: 'k'}
+
+# Digraphs and spellings that vary between romanizations
+PHONETIC_RULES = (
+    ('aa', 'a'), ('ee', 'i'), ('ii', 'i'), ('oo', 'u'), ('uu', 'u'),
+    ('kh', 'k'), ('gh', 'g'), ('chh', 'c'), ('ch', 'c'), ('jh', 'j'),
+    ('th', 't'), ('dh', 'd'), ('ph', 'p'), ('bh', 'b'), ('sh', 's'),
+    ('zh', 'l'), ('w', 'v'), ('q', 'k'), ('z', 'j'),
+)
+
+
+def _block(cp: int) -> Optional[str]:
+    return BRAHMIC_BLOCKS.get(cp & ~0x7F)
+
+
+def romanize(text: str) -> str:
+    """
+    Latin transliteration of Indian-script text (other text passes through)
+
+    Consonants carry an inherent 'a' unless followed by a vowel sign or
+    virama; anusvara becomes 'm' before labials and 'n' elsewhere.
+    """
+    out = []
+    pending_a = None  # script of a consonant still waiting for its vowel
+
+    def settle(final: bool = False):
+        nonlocal pending_a
+        if pending_a and not (final and pending_a in SCHWA_DELETING):
+            out.append('a')
+        pending_a = None
+
+    chars = list(text)
+    for i, ch in enumerate(chars):
+        cp = ord(ch)
+        script = _block(cp)
+        if script is None:
+            settle(final=True)
+            out.append(ch)
+            continue
+
+        offset = cp & 0x7F
+        if offset in VOWEL_SIGNS:
+            pending_a = None
+            out.append(VOWEL_SIGNS[offset])
+        elif offset == VIRAMA:
+            pending_a = None
+        elif offset in CONSONANTS:
+            settle()
+            out.append(CONSONANTS[offset])
+            pending_a = script
+        elif offset in INDEPENDENT_VOWELS:
+            settle()
+            out.append(INDEPENDENT_VOWELS[offset])
+        elif offset in ANUSVARA:
+            settle()
+            nxt = ord(chars[i + 1]) & 0x7F if i + 1 < len(chars) and _block(ord(chars[i + 1])) else None
+            out.append('m' if nxt is None or 0x2A <= nxt <= 0x2E else 'n')
+        elif offset == VISARGA:
+            settle()
+            out.append('h')
+        elif script == 'malayalam' and offset in CHILLU:
+            settle()
+            out.append(CHILLU[offset])
+        elif 0x66 <= offset <= 0x6F:
+            settle()
+            out.append(str(offset - 0x66))
+        # nukta, avagraha, addak and other marks add nothing
+
+    settle(final=True)
+    return ''.join(out)
+
+
+def phonetic_key(name: str) -> str:
+    """
+    Spelling-tolerant key shared by Latin and Indian-script names
+
+    'Vishakhapatnam', 'Visakhapatnam' and 'విశాఖపట్నం' all map to
+    'visakapatnam'.
+    """
+    text = romanize(normalize_name(name))
+    text = unicodedata.normalize('NFKD', text)
+    text = ''.join(ch for ch in text if ch.isascii() and ch.isalnum())
+    for old, new in PHONETIC_RULES:
+        text = text.replace(old, new)
+    # Collapse doubled letters ('chennai' / 'chenai')
+    collapsed = []
+    for ch in text:
+        if not collapsed or collapsed[-1] != ch:
+            collapsed.append(ch)
+    return ''.join(collapsed)
+
+
+class PlaceAutocomplete:
+    """
+    Ranked place suggestions for partially typed, possibly misspelled names
+
+    Every gazetteer name and alternate is reduced to a phonetic key and
+    stored in one sorted list. That list is an implicit trie: the keys
+    sharing a prefix form a contiguous range, and a child range is found
+    with one bisect. A query walks this trie carrying a Levenshtein row
+    and prunes any branch whose row minimum exceeds the allowed distance.
+    Once the query is within that distance of a node's prefix, every key
+    below it is a match. Ranking is by edit distance, then population.
+    """
+
+    # Ranges bigger than this get their top places cached
+    TOP_CACHE_MIN = 256
+
+    def __init__(self, gazetteer: Gazetteer = None):
+        self.gazetteer = gazetteer or get_gazetteer()
+
+        entries = set()
+        for name, record in self.gazetteer.iter_names():
+            key = phonetic_key(name)
+            if key:
+                entries.add((key, record, name))
+        entries = sorted(entries)
+
+        self._keys = [key for key, _, _ in entries]
+        self._records = [record for _, record, _ in entries]
+        self._names = [name for _, _, name in entries]
+        self._country = [self.gazetteer.record(i)['country_code']
+                         for i in range(self.gazetteer.size)]
+        self._top_cache: Dict[tuple, List[int]] = {}
+
+    @staticmethod
+    def max_distance(query_key: str) -> int:
+        """Typos allowed for a query of this length"""
+        if len(query_key) <= 2:
+            return 0
+        if len(query_key) <= 5:
+            return 1
+        return 2
+
+    def _top(self, lo: int, hi: int, n: int) -> List[int]:
+        """Entry indexes in [lo, hi) for the n most populous places"""
+        if hi - lo < self.TOP_CACHE_MIN:
+            return nsmallest(n, range(lo, hi), key=self._records.__getitem__)
+        cached = self._top_cache.get((lo, hi))
+        if cached is None or len(cached) < n:
+            cached = nsmallest(max(n, 32), range(lo, hi), key=self._records.__getitem__)
+            self._top_cache[(lo, hi)] = cached
+        return cached[:n]
+
+    def _search(self, query: str, max_dist: int, want: int) -> Dict[int, tuple]:
+        """Best (distance, entry) per record among keys fuzzily prefixed by query"""
+        keys = self._keys
+        found: Dict[int, tuple] = {}
+        n = len(query)
+        too_far = max_dist + 1
+
+        # Typos in the first letter are rare; anchoring on it keeps the
+        # fuzzy walk inside one top-level branch
+        lo = bisect_left(keys, query[0])
+        hi = bisect_left(keys, chr(ord(query[0]) + 1), lo)
+        first_row = [1] + [min(col - 1, too_far) for col in range(1, n + 1)]
+        stack = [(lo, hi, 1, first_row)]
+
+        while stack:
+            lo, hi, depth, row = stack.pop()
+            if row[-1] <= max_dist:
+                for entry in self._top(lo, hi, want):
+                    record = self._records[entry]
+                    if record not in found or row[-1] < found[record][0]:
+                        found[record] = (row[-1], entry)
+                if row[-1] == 0:
+                    continue  # deeper prefixes cannot match any closer
+
+            prefix = keys[lo][:depth]
+            i = lo
+            while i < hi and len(keys[i]) == depth:
+                i += 1
+            while i < hi:
+                ch = keys[i][depth]
+                j = bisect_left(keys, prefix + chr(ord(ch) + 1), i, hi)
+                # Only cells within max_dist of the diagonal can stay in range
+                new_row = [too_far] * (n + 1)
+                new_row[0] = min(depth + 1, too_far)
+                for col in range(max(1, depth + 1 - max_dist), min(n, depth + 1 + max_dist) + 1):
+                    new_row[col] = min(
+                        new_row[col - 1] + 1,
+                        row[col] + 1,
+                        row[col - 1] + (query[col - 1] != ch),
+                        too_far
+                    )
+                if min(new_row) <= max_dist:
+                    stack.append((i, j, depth + 1, new_row))
+                i = j
+
+        return found
+
+    def suggest(self, query: str, limit: int = 8, country_code: str = None) -> List[Dict]:
+        """
+        Suggestions for a partly typed place name
+
+        Args:
+            query: What the user has typed so far (any supported script)
+            limit: Maximum suggestions
+            country_code: Optional ISO code ('IN') to restrict results
+
+        Returns:
+            [{'label': 'Ongole, Andhra Pradesh, India', 'matched': 'ఒంగోలు',
+              'distance': 0, 'name', 'admin1', 'country', 'lat', 'lon',
+              'timezone', ...}]
+        """
+        key = phonetic_key(query or '')
+        if not key:
+            return []
+
+        want = limit * 4 if country_code else limit
+        found = self._search(key, self.max_distance(key), want)
+
+        ranked = sorted(found.items(), key=lambda item: (item[1][0], item[0]))
+        suggestions = []
+        for record, (distance, entry) in ranked:
+            if country_code and self._country[record] != country_code:
+                continue
+            place = self.gazetteer.record(record)
+            label_parts = [place['name'], place['admin1'], place['country']]
+            place['label'] = ', '.join(p for p in label_parts if p)
+            place['matched'] = self._names[entry]
+            place['distance'] = distance
+            suggestions.append(place)
+            if len(suggestions) >= limit:
+                break
+        return suggestions
+
+
+_autocomplete = None
+_autocomplete_lock = threading.Lock()
+
+
+def get_autocomplete() -> PlaceAutocomplete:
+    """Process-wide autocomplete index (built once from the gazetteer)"""
+    global _autocomplete
+    if _autocomplete is None:
+        with _autocomplete_lock:
+            if _autocomplete is None:
+                _autocomplete = PlaceAutocomplete()
+    return _autocomplete
+
+
+if __name__ == "__main__":
+    import time
+
+    print("=" * 60)
+    print("PLACE AUTOCOMPLETE TEST")
+    print("=" * 60)
+
+    autocomplete = get_autocomplete()
+    for query in ['ong', 'Ongle', 'vizag', 'Vishakapatnam', 'బెంగళూ', 'ఒంగోలు',
+                  'कानपुर', 'சென்னை', 'bombay', 'hydrabad', 'san fran']:
+        labels = [f"{s['label']} (d={s['distance']})" for s in autocomplete.suggest(query, limit=3)]
+        print(f"{query:<16} → {labels}")
+
+    queries = ['o', 'on', 'ong', 'ongo', 'ongol', 'hyder', 'vijaywada', 'trivendrum']
+    start = time.perf_counter()
+    for _ in range(200):
+        for query in queries:
+            autocomplete.suggest(query)
+    elapsed = (time.perf_counter() - start) / (200 * len(queries))
+    print(f"\nAverage suggest(): {elapsed * 1000:.3f} ms")
@@ -5,63 +5,55 @@ Validates user requests against free/paid limits
 
 import json
 import os
-from datetime import datetime, timedelta
+from datetime import datetime
 from typing import Dict
 
+from shared_counters import SharedCounterBlock, next_midnight
+
 class QuotaChecker:
     """Manages free tier limits and paid subscriptions"""
 
-    def __init__(self, quota_file='data/daily_quota.json'):
+    def __init__(self, quota_file='data/daily_quota.bin',
+                 legacy_quota_file='data/daily_quota.json',
+                 payments=None):
         self.quota_file = quota_file
+        self.payments = payments  # PaymentHandler - cached subscription status
         self.FREE_LIFETIME_LIMIT = 7  # Updated to 7 questions
         self.FREE_DAILY_TOKEN_LIMIT = 1500  # Gemini free tier limit
-        self._ensure_quota_file()
-
-    def _ensure_quota_file(self):
-        """Create quota tracking file if it doesn't exist"""
-        os.makedirs(os.path.dirname(self.quota_file), exist_ok=True)
-        if not os.path.exists(self.quota_file):
-            self._reset_daily_quota()
-
-    def _reset_daily_quota(self):
-        """Reset daily quota counter"""
-        quota_data = {
-            'date': datetime.now().strftime('%Y-%m-%d'),
-            'free_queries_today': 0,
-            'reset_time': (datetime.now() + timedelta(days=1)).replace(
-                hour=0, minute=0, second=0
-            ).isoformat()
-        }
-        with open(self.quota_file, 'w') as f:
-            json.dump(quota_data, f, indent=2)
+        self.counters = SharedCounterBlock(quota_file, fields=('free_queries_today',))
+        if self.counters.created:
+            self._import_legacy_quota(legacy_quota_file)
+
+    def _import_legacy_quota(self, legacy_quota_file: str):
+        """Carry today's count over from the old JSON quota file"""
+        if not os.path.exists(legacy_quota_file):
+            return
+        try:
+            with open(legacy_quota_file, 'r') as f:
+                legacy = json.load(f)
+        except (OSError, ValueError):
+            return
+
+        if legacy.get('date') == datetime.now().strftime('%Y-%m-%d'):
+            self.counters.seed({'free_queries_today': legacy.get('free_queries_today', 0)})
 
     def _get_quota_data(self) -> Dict:
-        """Get current quota data, reset if new day"""
-        with open(self.quota_file, 'r') as f:
-            data = json.load(f)
-
-        # Check if we need to reset (new day)
-        if data['date'] != datetime.now().strftime('%Y-%m-%d'):
-            self._reset_daily_quota()
-            with open(self.quota_file, 'r') as f:
-                data = json.load(f)
-
+        """Get current quota data (counters reset themselves on a new day)"""
+        data = self.counters.snapshot()
+        data['reset_time'] = next_midnight().isoformat()
         return data
 
     def _increment_daily_quota(self):
         """Increment today's free query count"""
-        data = self._get_quota_data()
-        data['free_queries_today'] += 1
-
-        with open(self.quota_file, 'w') as f:
-            json.dump(data, f, indent=2)
+        self.counters.add(free_queries_today=1)
 
-    def can_user_ask(self, user: Dict) -> Dict:
+    def can_user_ask(self, user: Dict, phone: str = None) -> Dict:
         """
         Check if user can ask a question
 
         Args:
             user: User dict from database
+            phone: User's phone, to look up an active paid subscription
 
         Returns:
             {
@@ -73,7 +65,11 @@ class QuotaChecker:
         """
 
         # Step 1: Check if paid subscriber (BASIC, FAMILY, VIP all have unlimited)
-        if user.get('subscription', 'FREE') in ['BASIC', 'FAMILY', 'VIP', 'PAID', 'PREMIUM']:
+        tier = user.get('subscription', 'FREE')
+        if self.payments and phone:
+            tier = self.payments.get_active_tier(phone) or tier
+
+        if tier in ['BASIC', 'FAMILY', 'VIP', 'PAID', 'PREMIUM']:
             return {
                 'allowed': True,
                 'api_tier': 'paid',
@@ -159,7 +155,7 @@ if __name__ == "__main__":
 
     # Initialize
     db = UserDatabase('data/users.json')
-    quota = QuotaChecker('data/daily_quota.json')
+    quota = QuotaChecker('data/daily_quota.bin')
 
     # Test with free user
     test_phone = "+919876543210"
@@ -0,0 +1,243 @@
+"""
+Rate Limiting Primitives
+Sliding-window limits (RPM / TPM) shared between worker processes,
+plus per-user token buckets for fairness under the global limits
+"""
+
+import struct
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional
+
+from shared_counters import HEADER, MappedBlock
+
+# epoch second, requests in that second, tokens in that second
+BUCKET = struct.Struct('<qqq')
+
+
+class SlidingWindowLimiter(MappedBlock):
+    """
+    Ring-buffer sliding window over integer-second buckets
+
+    The window is split into one bucket per second (60 for a minute
+    window). A request lands in bucket ``now % window``; a bucket whose
+    timestamp has fallen out of the window counts as empty and is
+    overwritten on the next write. Checks read at most ``window``
+    fixed-size buckets, so cost does not grow with traffic, and the
+    ring lives in an mmap'd file so every worker sees the same window.
+    """
+
+    MAGIC = b'ARLM'
+
+    def __init__(self, path: str, window_seconds: int = 60,
+                 max_requests: Optional[int] = None,
+                 max_tokens: Optional[int] = None):
+        self.window = window_seconds
+        self.max_requests = max_requests
+        self.max_tokens = max_tokens
+        super().__init__(path, window_seconds * BUCKET.size, layout=window_seconds)
+
+    def _offset(self, second: int) -> int:
+        return HEADER.size + (second % self.window) * BUCKET.size
+
+    def usage(self, now: Optional[int] = None) -> Dict:
+        """
+        Requests and tokens inside the window ending at ``now``
+
+        Returns:
+            {'requests': int, 'tokens': int, 'oldest': int | None}
+        """
+        now = int(time.time()) if now is None else now
+        requests = tokens = 0
+        oldest = None
+        for i in range(self.window):
+            second, req, tok = BUCKET.unpack_from(self._mm, HEADER.size + i * BUCKET.size)
+            if now - self.window < second <= now and req:
+                requests += req
+                tokens += tok
+                if oldest is None or second < oldest:
+                    oldest = second
+        return {'requests': requests, 'tokens': tokens, 'oldest': oldest}
+
+    def check(self, tokens: int = 0, now: Optional[int] = None) -> Dict:
+        """
+        Check whether one more request (of ``tokens`` tokens) fits the window
+
+        A used-up token budget rejects even without an estimate (tokens=0);
+        an estimate that exactly uses the remainder is allowed.
+
+        Returns:
+            {
+                'allowed': bool,
+                'reason': 'rpm' | 'tpm' (when not allowed),
+                'requests_remaining': int | None,
+                'tokens_remaining': int | None,
+                'retry_after': int (seconds, 0 if allowed)
+            }
+        """
+        now = int(time.time()) if now is None else now
+        used = self.usage(now)
+
+        requests_remaining = (None if self.max_requests is None
+                              else self.max_requests - used['requests'])
+        tokens_remaining = (None if self.max_tokens is None
+                            else self.max_tokens - used['tokens'])
+
+        reason = None
+        if requests_remaining is not None and requests_remaining <= 0:
+            reason = 'rpm'
+        elif tokens_remaining is not None and tokens_remaining < max(tokens, 1):
+            reason = 'tpm'
+
+        retry_after = 0
+        if reason and used['oldest'] is not None:
+            retry_after = max(1, used['oldest'] + self.window - now)
+
+        return {
+            'allowed': reason is None,
+            'reason': reason,
+            'requests_remaining': requests_remaining,
+            'tokens_remaining': tokens_remaining,
+            'retry_after': retry_after
+        }
+
+    def record(self, requests: int = 1, tokens: int = 0, now: Optional[int] = None):
+        """Add a request (and its tokens) to the current second's bucket"""
+        now = int(time.time()) if now is None else now
+        offset = self._offset(now)
+        with self._file_lock():
+            second, req, tok = BUCKET.unpack_from(self._mm, offset)
+            if second != now:
+                # Bucket still holds a second that has left the window
+                req = tok = 0
+            BUCKET.pack_into(self._mm, offset, now, req + requests, tok + tokens)
+
+
+class UserTokenBuckets:
+    """
+    Per-user token buckets, sized by subscription tier
+
+    Each user gets ``burst`` tokens that refill at ``refill_per_minute``.
+    One user draining their bucket cannot use up the shared RPM window,
+    so throughput is spread across everyone asking at the same time.
+
+    State is one (tokens, last_refill) tuple per user in an LRU-ordered
+    dict. A bucket that has refilled to capacity is indistinguishable
+    from a new one, so idle users can be dropped at any time
+    (``evict_idle``), and the least recently used entry goes first once
+    the table reaches ``max_users``.
+    """
+
+    TIER_BUCKETS = {
+        'FREE': {'burst': 2, 'refill_per_minute': 2},
+        'BASIC': {'burst': 5, 'refill_per_minute': 6},
+        'FAMILY': {'burst': 8, 'refill_per_minute': 10},
+        'VIP': {'burst': 15, 'refill_per_minute': 30},
+    }
+
+    # Older tier names still found on user records
+    TIER_ALIASES = {
+        'PAID': 'BASIC',
+        'PREMIUM': 'FAMILY',
+    }
+
+    def __init__(self, tier_buckets: Dict = None, max_users: int = 10000):
+        self.tier_buckets = {**self.TIER_BUCKETS, **(tier_buckets or {})}
+        self.max_users = max_users
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+        self._full_refill_seconds = 60.0 * max(
+            c['burst'] / c['refill_per_minute'] for c in self.tier_buckets.values()
+        )
+
+    def _config(self, tier: str) -> Dict:
+        tier = self.TIER_ALIASES.get(tier, tier)
+        return self.tier_buckets.get(tier, self.tier_buckets['FREE'])
+
+    def _refilled(self, key: str, config: Dict, now: float) -> float:
+        """Current token count for a user after refilling up to ``now``"""
+        if key not in self._buckets:
+            return float(config['burst'])
+        tokens, last = self._buckets[key]
+        rate = config['refill_per_minute'] / 60.0
+        return min(float(config['burst']), tokens + (now - last) * rate)
+
+    def try_acquire(self, key: str, tier: str = 'FREE', cost: float = 1.0,
+                    now: Optional[float] = None) -> Dict:
+        """
+        Take ``cost`` tokens from a user's bucket if available
+
+        Returns:
+            {'allowed': bool, 'tokens': float, 'retry_after': int (seconds)}
+        """
+        now = time.time() if now is None else now
+        config = self._config(tier)
+
+        with self._lock:
+            tokens = self._refilled(key, config, now)
+            allowed = tokens >= cost
+            if allowed:
+                tokens -= cost
+
+            self._buckets[key] = (tokens, now)
+            self._buckets.move_to_end(key)
+            while len(self._buckets) > self.max_users:
+                # Least recently used first - usually already refilled
+                self._buckets.popitem(last=False)
+
+        retry_after = 0
+        if not allowed:
+            rate = config['refill_per_minute'] / 60.0
+            retry_after = max(1, int((cost - tokens) / rate + 0.999))
+
+        return {'allowed': allowed, 'tokens': tokens, 'retry_after': retry_after}
+
+    def evict_idle(self, now: Optional[float] = None) -> int:
+        """
+        Drop buckets that have refilled to capacity (safe at any time)
+
+        Returns:
+            Number of buckets removed
+        """
+        now = time.time() if now is None else now
+        with self._lock:
+            # Oldest-first order means we can stop at the first busy bucket
+            removed = 0
+            for key in list(self._buckets):
+                if now - self._buckets[key][1] < self._full_refill_seconds:
+                    break
+                del self._buckets[key]
+                removed += 1
+        return removed
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+
+if __name__ == "__main__":
+    import os
+    import tempfile
+
+    print("=" * 60)
+    print("SLIDING WINDOW LIMITER TEST")
+    print("=" * 60)
+
+    limiter = SlidingWindowLimiter(
+        os.path.join(tempfile.mkdtemp(), 'window.bin'),
+        max_requests=15, max_tokens=1000000
+    )
+
+    start = 1_700_000_000
+    for i in range(15):
+        limiter.record(tokens=1000, now=start + i)
+
+    print(f"\nAt t+14s: {limiter.check(now=start + 14)}")
+    print(f"At t+60s: {limiter.check(now=start + 60)}")
+    print(f"At t+75s: {limiter.check(now=start + 75)}")
+
+    buckets = UserTokenBuckets()
+    results = [buckets.try_acquire('+919876543210', 'FREE', now=start + i)['allowed']
+               for i in range(4)]
+    print(f"\nFREE user, 4 requests in 4s: {results}")
+    print(f"Other user meanwhile:        {buckets.try_acquire('+14155552671', 'FREE', now=start + 4)}")
@@ -0,0 +1,94 @@
+"""
+Local Razorpay Stand-in
+In-memory replacement for razorpay.Client, for exercising payment flows offline
+"""
+
+import secrets
+import time
+from typing import Dict
+
+
+class _PaymentAPI:
+    def __init__(self, store: Dict):
+        self._store = store
+
+    def fetch(self, payment_id: str) -> Dict:
+        return dict(self._store[payment_id])
+
+
+class _SubscriptionAPI:
+    def __init__(self, store: Dict):
+        self._store = store
+
+    def create(self, data: Dict) -> Dict:
+        sub_id = f"sub_{secrets.token_hex(7)}"
+        self._store[sub_id] = {
+            'id': sub_id,
+            'plan_id': data['plan_id'],
+            'status': 'created',
+            'notes': data.get('notes', {}),
+            'current_end': None,
+            'created_at': int(time.time())
+        }
+        return dict(self._store[sub_id])
+
+    def fetch(self, subscription_id: str) -> Dict:
+        return dict(self._store[subscription_id])
+
+    def all(self, options: Dict = None) -> Dict:
+        options = options or {}
+        count = options.get('count', 10)
+        skip = options.get('skip', 0)
+        items = sorted(self._store.values(), key=lambda s: s['created_at'])
+        page = [dict(s) for s in items[skip:skip + count]]
+        return {'entity': 'collection', 'count': len(page), 'items': page}
+
+    def cancel(self, subscription_id: str) -> Dict:
+        self._store[subscription_id]['status'] = 'cancelled'
+        return dict(self._store[subscription_id])
+
+
+class LocalRazorpayClient:
+    """
+    Mimics the parts of razorpay.Client that PaymentHandler uses
+
+    Pass it as ``PaymentHandler(razorpay_client=LocalRazorpayClient())``
+    and drive state changes with ``capture`` / ``set_status``.
+    """
+
+    def __init__(self):
+        self.payments: Dict[str, Dict] = {}
+        self.subscriptions: Dict[str, Dict] = {}
+        self.payment = _PaymentAPI(self.payments)
+        self.subscription = _SubscriptionAPI(self.subscriptions)
+
+    def capture(self, subscription_id: str, period_days: int = 30) -> Dict:
+        """Simulate a successful charge on a subscription"""
+        sub = self.subscriptions[subscription_id]
+        payment_id = f"pay_{secrets.token_hex(7)}"
+        self.payments[payment_id] = {
+            'id': payment_id,
+            'status': 'captured',
+            'subscription_id': subscription_id,
+            'notes': sub['notes']
+        }
+        sub['status'] = 'active'
+        sub['current_end'] = int(time.time()) + period_days * 86400
+        return dict(self.payments[payment_id])
+
+    def set_status(self, subscription_id: str, status: str):
+        """Change a subscription's status on the 'gateway' side only"""
+        self.subscriptions[subscription_id]['status'] = status
+
+    def webhook_event(self, event_type: str, subscription_id: str,
+                      payment_id: str = None) -> Dict:
+        """Build a webhook body shaped like Razorpay's"""
+        payload = {'subscription': {'entity': dict(self.subscriptions[subscription_id])}}
+        if payment_id:
+            payload['payment'] = {'entity': dict(self.payments[payment_id])}
+        return {
+            'id': f"evt_{secrets.token_hex(7)}",
+            'event': event_type,
+            'payload': payload,
+            'created_at': int(time.time())
+        }
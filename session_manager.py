@@ -3,11 +3,13 @@ Session Manager - Persistent Login System
 Handles user sessions across devices with tier-based limits
 """
 
+import atexit
 import json
 import os
 import secrets
 import hashlib
-from datetime import datetime
+import threading
+from datetime import datetime, timedelta
 from typing import Dict, List, Optional, Tuple
 
 class SessionManager:
@@ -15,10 +17,16 @@ class SessionManager:
     Manages user sessions with device limits based on subscription tier
     
     Features:
-    - Forever login (no expiry unless manually logged out)
+    - Long-lived login (devices idle for SESSION_TTL_DAYS are swept)
     - Device limits: FREE=1, PAID=2, PREMIUM=3, VIP=unlimited
     - Device fingerprinting
     - Remote logout capability
+    
+    Sessions are held in memory and indexed by a SHA-256 hash of the
+    session token, so verify_session is a dict lookup. last_active
+    updates only mark the store dirty; a background thread writes them
+    out every FLUSH_INTERVAL_SECONDS. Creating or removing a session
+    still writes through immediately.
     """
     
     # Device limits by tier
@@ -29,9 +37,25 @@ class SessionManager:
         'VIP': 999  # Effectively unlimited
     }
     
-    def __init__(self, sessions_path='data/sessions.json'):
+    SESSION_TTL_DAYS = 90
+    FLUSH_INTERVAL_SECONDS = 60
+    SWEEP_INTERVAL_SECONDS = 3600
+    
+    def __init__(self, sessions_path='data/sessions.json', background_flush: bool = True):
         self.sessions_path = sessions_path
+        self._lock = threading.RLock()
+        self._all_sessions: Dict[str, List[Dict]] = {}
+        self._token_index: Dict[str, Tuple[str, Dict]] = {}
+        self._dirty = False
+        self._mtime = None
+        
         self._ensure_storage_exists()
+        self._load()
+        
+        self._stop = threading.Event()
+        if background_flush:
+            threading.Thread(target=self._flush_loop, daemon=True).start()
+        atexit.register(self.flush)
     
     def _ensure_storage_exists(self):
         """Create sessions storage file if it doesn't exist"""
@@ -40,6 +64,65 @@ class SessionManager:
             with open(self.sessions_path, 'w') as f:
                 json.dump({}, f)
     
+    def _hash_token(self, session_token: str) -> str:
+        """Index key for a session token"""
+        return hashlib.sha256(session_token.encode()).hexdigest()
+    
+    def _load(self):
+        """Load sessions from disk, keeping any newer in-memory last_active values"""
+        with open(self.sessions_path, 'r') as f:
+            all_sessions = json.load(f)
+        self._mtime = os.path.getmtime(self.sessions_path)
+        
+        pending = {
+            key: session['last_active']
+            for key, (_, session) in self._token_index.items()
+        } if self._dirty else {}
+        
+        self._all_sessions = all_sessions
+        self._token_index = {}
+        for phone, sessions in all_sessions.items():
+            for session in sessions:
+                key = self._hash_token(session['session_token'])
+                if key in pending and pending[key] > session['last_active']:
+                    session['last_active'] = pending[key]
+                self._token_index[key] = (phone, session)
+    
+    def _reload_if_changed(self) -> bool:
+        """Pick up sessions written by another worker process"""
+        try:
+            mtime = os.path.getmtime(self.sessions_path)
+        except OSError:
+            return False
+        if mtime == self._mtime:
+            return False
+        self._load()
+        return True
+    
+    def _write(self):
+        """Write all sessions to disk (caller holds the lock)"""
+        with open(self.sessions_path, 'w') as f:
+            json.dump(self._all_sessions, f, indent=2)
+        self._mtime = os.path.getmtime(self.sessions_path)
+        self._dirty = False
+    
+    def flush(self):
+        """Write pending last_active updates to disk"""
+        with self._lock:
+            if not self._dirty:
+                return
+            self._reload_if_changed()
+            self._write()
+    
+    def _flush_loop(self):
+        """Background writer: flush periodically, sweep idle devices hourly"""
+        last_sweep = datetime.now()
+        while not self._stop.wait(self.FLUSH_INTERVAL_SECONDS):
+            if (datetime.now() - last_sweep).total_seconds() >= self.SWEEP_INTERVAL_SECONDS:
+                self.sweep_inactive_sessions()
+                last_sweep = datetime.now()
+            self.flush()
+    
     def _generate_session_token(self) -> str:
         """Generate a secure random session token"""
         return secrets.token_urlsafe(32)
@@ -51,19 +134,20 @@ class SessionManager:
     
     def _get_sessions(self, phone: str) -> List[Dict]:
         """Get all active sessions for a user"""
-        with open(self.sessions_path, 'r') as f:
-            all_sessions = json.load(f)
-        return all_sessions.get(phone, [])
+        return self._all_sessions.get(phone, [])
     
     def _save_sessions(self, phone: str, sessions: List[Dict]):
-        """Save sessions for a user"""
-        with open(self.sessions_path, 'r') as f:
-            all_sessions = json.load(f)
-        
-        all_sessions[phone] = sessions
-        
-        with open(self.sessions_path, 'w') as f:
-            json.dump(all_sessions, f, indent=2)
+        """Save sessions for a user (re-indexes and writes through)"""
+        with self._lock:
+            self._reload_if_changed()
+            for session in self._all_sessions.get(phone, []):
+                self._token_index.pop(self._hash_token(session['session_token']), None)
+            
+            self._all_sessions[phone] = sessions
+            for session in sessions:
+                self._token_index[self._hash_token(session['session_token'])] = (phone, session)
+            
+            self._write()
     
     def get_device_limit(self, tier: str) -> int:
         """Get device limit for subscription tier"""
@@ -105,9 +189,10 @@ class SessionManager:
                 break
         
         if existing_session:
-            # Update last active time
-            existing_session['last_active'] = datetime.now().isoformat()
-            self._save_sessions(phone, sessions)
+            # Update last active time (flushed in the background)
+            with self._lock:
+                existing_session['last_active'] = datetime.now().isoformat()
+                self._dirty = True
             return True, "Session resumed", existing_session['session_token']
         
         # Check device limit
@@ -126,8 +211,7 @@ class SessionManager:
             'ip_address': ip_address
         }
         
-        sessions.append(new_session)
-        self._save_sessions(phone, sessions)
+        self._save_sessions(phone, sessions + [new_session])
         
         return True, "Session created", session_token
     
@@ -142,16 +226,28 @@ class SessionManager:
         Returns:
             True if session is valid
         """
-        sessions = self._get_sessions(phone)
-        
-        for session in sessions:
-            if session['session_token'] == session_token:
-                # Update last active time
-                session['last_active'] = datetime.now().isoformat()
-                self._save_sessions(phone, sessions)
-                return True
+        if not session_token:
+            return False
         
-        return False
+        key = self._hash_token(session_token)
+        with self._lock:
+            # Another worker may have added or revoked this session; the
+            # check is one stat() unless the file changed
+            self._reload_if_changed()
+            entry = self._token_index.get(key)
+            
+            if entry is None or entry[0] != phone:
+                return False
+            
+            session = entry[1]
+            now = datetime.now()
+            if now - datetime.fromisoformat(session['last_active']) > timedelta(days=self.SESSION_TTL_DAYS):
+                return False
+            
+            # Update last active time in memory only - flushed periodically
+            session['last_active'] = now.isoformat()
+            self._dirty = True
+            return True
     
     def get_active_sessions(self, phone: str) -> List[Dict]:
         """Get list of active sessions with device info"""
@@ -250,6 +346,38 @@ class SessionManager:
             sessions.sort(key=lambda x: x['last_active'], reverse=True)
             sessions = sessions[:max_devices]
             self._save_sessions(phone, sessions)
+    
+    def sweep_inactive_sessions(self) -> int:
+        """
+        Remove sessions idle for longer than SESSION_TTL_DAYS
+        
+        Returns:
+            Number of sessions removed
+        """
+        cutoff = (datetime.now() - timedelta(days=self.SESSION_TTL_DAYS)).isoformat()
+        removed = 0
+        
+        with self._lock:
+            self._reload_if_changed()
+            for phone, sessions in list(self._all_sessions.items()):
+                kept = [s for s in sessions if s['last_active'] >= cutoff]
+                if len(kept) == len(sessions):
+                    continue
+                
+                removed += len(sessions) - len(kept)
+                kept_ids = {id(s) for s in kept}
+                for session in sessions:
+                    if id(session) not in kept_ids:
+                        self._token_index.pop(self._hash_token(session['session_token']), None)
+                if kept:
+                    self._all_sessions[phone] = kept
+                else:
+                    del self._all_sessions[phone]
+            
+            if removed:
+                self._write()
+        
+        return removed
 
 
 # Singleton instance
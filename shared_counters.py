@@ -0,0 +1,223 @@
+"""
+Shared Counter Block
+Fixed-offset integer counters in a memory-mapped file, shared by all workers
+"""
+
+import mmap
+import os
+import struct
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from typing import Dict, Iterable
+
+try:
+    import fcntl
+except ImportError:  # Windows - fall back to in-process locking only
+    fcntl = None
+
+# magic, version, layout id, 32-bit stamp (meaning is up to the subclass)
+HEADER = struct.Struct('<4sHHi')
+SLOT = struct.Struct('<q')
+
+
+def _today_int() -> int:
+    """Today's local date as YYYYMMDD"""
+    now = datetime.now()
+    return now.year * 10000 + now.month * 100 + now.day
+
+
+def next_midnight() -> datetime:
+    """Local midnight at the start of tomorrow (daily reset time)"""
+    return (datetime.now() + timedelta(days=1)).replace(
+        hour=0, minute=0, second=0, microsecond=0
+    )
+
+
+class MappedBlock:
+    """
+    Fixed-size memory-mapped file with a header and a cross-process lock
+
+    Subclasses define MAGIC/VERSION and the layout of the body. A file
+    whose header does not match is re-initialised to zeros.
+    """
+
+    MAGIC = b'ABLK'
+    VERSION = 1
+
+    def __init__(self, path: str, body_size: int, layout: int):
+        self.path = path
+        self._layout = layout
+        self._size = HEADER.size + body_size
+        self._thread_lock = threading.Lock()
+        self.created = False
+        self._open()
+
+    def _initial_stamp(self) -> int:
+        """Header stamp written when the file is created"""
+        return 0
+
+    def _open(self):
+        """Open (and initialise if needed) the backing file and map it"""
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+
+        with self._file_lock():
+            header_ok = False
+            if os.fstat(self._fd).st_size >= self._size:
+                os.lseek(self._fd, 0, os.SEEK_SET)
+                magic, version, layout, _ = HEADER.unpack(os.read(self._fd, HEADER.size))
+                header_ok = (magic == self.MAGIC and version == self.VERSION
+                             and layout == self._layout)
+
+            if not header_ok:
+                # New file or incompatible layout - start from zero
+                os.ftruncate(self._fd, self._size)
+                os.lseek(self._fd, 0, os.SEEK_SET)
+                os.write(self._fd, HEADER.pack(self.MAGIC, self.VERSION, self._layout,
+                                               self._initial_stamp()))
+                os.write(self._fd, b'\x00' * (self._size - HEADER.size))
+                self.created = True
+
+        self._mm = mmap.mmap(self._fd, self._size)
+
+    @contextmanager
+    def _file_lock(self):
+        """Exclusive lock across threads and processes"""
+        with self._thread_lock:
+            if fcntl is not None:
+                fcntl.flock(self._fd, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    def _stamp(self) -> int:
+        return HEADER.unpack_from(self._mm, 0)[3]
+
+    def _set_stamp(self, stamp: int):
+        HEADER.pack_into(self._mm, 0, self.MAGIC, self.VERSION, self._layout, stamp)
+
+    def flush(self):
+        """Force the mapped pages to disk"""
+        self._mm.flush()
+
+    def close(self):
+        """Unmap and close the backing file"""
+        self._mm.close()
+        os.close(self._fd)
+
+
+class SharedCounterBlock(MappedBlock):
+    """
+    Daily counters stored at fixed offsets in an mmap'd file
+
+    Layout:
+        [header: magic | version | field count | date as YYYYMMDD]
+        [int64 slot per field, in the order given]
+
+    Every worker process maps the same file, so reads are plain memory
+    reads with no JSON parsing. Increments take a short exclusive file
+    lock (fcntl) around the in-memory update, so no increment is lost.
+    The mapped file is the durable state. When the date changes, all
+    counters are zeroed on first access.
+    """
+
+    MAGIC = b'ACNT'
+
+    def __init__(self, path: str, fields: Iterable[str]):
+        self.fields = tuple(fields)
+        self._offsets = {
+            name: HEADER.size + i * SLOT.size for i, name in enumerate(self.fields)
+        }
+        super().__init__(path, len(self.fields) * SLOT.size, layout=len(self.fields))
+
+    def _initial_stamp(self) -> int:
+        return _today_int()
+
+    def _stored_date(self) -> int:
+        return self._stamp()
+
+    def _zero_for_today(self):
+        """Reset all counters and stamp today's date (caller holds the lock)"""
+        for offset in self._offsets.values():
+            SLOT.pack_into(self._mm, offset, 0)
+        self._set_stamp(_today_int())
+
+    def _roll_if_new_day(self):
+        """Zero counters on the first access of a new day"""
+        if self._stored_date() == _today_int():
+            return
+        with self._file_lock():
+            # Another worker may have rolled over while we waited
+            if self._stored_date() != _today_int():
+                self._zero_for_today()
+
+    def get(self, name: str) -> int:
+        """Read a single counter (lock-free memory read)"""
+        self._roll_if_new_day()
+        return SLOT.unpack_from(self._mm, self._offsets[name])[0]
+
+    def snapshot(self) -> Dict:
+        """Read all counters plus the current date"""
+        self._roll_if_new_day()
+        data = {
+            name: SLOT.unpack_from(self._mm, offset)[0]
+            for name, offset in self._offsets.items()
+        }
+        stored = self._stored_date()
+        data['date'] = f"{stored // 10000:04d}-{stored // 100 % 100:02d}-{stored % 100:02d}"
+        return data
+
+    def add(self, **deltas: int) -> Dict:
+        """
+        Atomically add to one or more counters
+
+        Returns:
+            Snapshot of the counters after the update
+        """
+        self._roll_if_new_day()
+        with self._file_lock():
+            if self._stored_date() != _today_int():
+                self._zero_for_today()
+            for name, delta in deltas.items():
+                offset = self._offsets[name]
+                value = SLOT.unpack_from(self._mm, offset)[0]
+                SLOT.pack_into(self._mm, offset, value + delta)
+        return self.snapshot()
+
+    def seed(self, values: Dict[str, int]):
+        """Overwrite counters (used when importing legacy JSON state)"""
+        with self._file_lock():
+            for name, value in values.items():
+                if name in self._offsets:
+                    SLOT.pack_into(self._mm, self._offsets[name], int(value))
+
+
+if __name__ == "__main__":
+    import tempfile
+
+    print("=" * 60)
+    print("SHARED COUNTER BLOCK TEST")
+    print("=" * 60)
+
+    path = os.path.join(tempfile.mkdtemp(), 'counters.bin')
+    block = SharedCounterBlock(path, fields=('requests', 'tokens'))
+
+    threads = [
+        threading.Thread(target=lambda: [block.add(requests=1, tokens=10) for _ in range(500)])
+        for _ in range(4)
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    print(f"\nAfter 4 x 500 increments: {block.snapshot()}")
+
+    reopened = SharedCounterBlock(path, fields=('requests', 'tokens'))
+    print(f"Reopened from disk:       {reopened.snapshot()}")
@@ -4,61 +4,93 @@ Token Tracking & Usage Management
 
 import json
 import os
-from datetime import datetime, timedelta
+import time
+from datetime import datetime
 from typing import Dict
 
+from rate_limiter import SlidingWindowLimiter, UserTokenBuckets
+from shared_counters import SharedCounterBlock, next_midnight
+from usage_series import UsageTimeSeries
+
 class TokenTracker:
-    def __init__(self, tracker_file='data/token_usage.json'):
-        self.tracker_file = tracker_file
-        self.DAILY_REQUEST_LIMIT = 1500
-        self.DAILY_TOKEN_LIMIT = 1000000
-        self.MINUTE_REQUEST_LIMIT = 15
-        self._ensure_tracker_exists()
-    
-    def _ensure_tracker_exists(self):
-        os.makedirs(os.path.dirname(self.tracker_file), exist_ok=True)
-        if not os.path.exists(self.tracker_file):
-            self._reset_daily_tracker()
-    
-    def _reset_daily_tracker(self):
-        tracker_data = {
-            'date': datetime.now().strftime('%Y-%m-%d'),
-            'total_requests_today': 0,
-            'total_tokens_today': 0,
-            'free_requests_today': 0,
-            'paid_requests_today': 0,
-            'reset_time': (datetime.now() + timedelta(days=1)).replace(
-                hour=0, minute=0, second=0
-            ).isoformat(),
-            'minute_tracker': []
-        }
-        with open(self.tracker_file, 'w') as f:
-            json.dump(tracker_data, f, indent=2)
-    
+    COUNTER_FIELDS = (
+        'total_requests_today',
+        'total_tokens_today',
+        'free_requests_today',
+        'paid_requests_today',
+    )
+
+    # Gemini free-tier quotas
+    DEFAULT_LIMITS = {
+        'requests_per_minute': 15,
+        'tokens_per_minute': 1000000,
+        'requests_per_day': 1500,
+        'tokens_per_day': 1000000,
+    }
+
+    def __init__(self, counters_file='data/token_usage.bin',
+                 window_file='data/rate_window.bin',
+                 legacy_tracker_file='data/token_usage.json',
+                 limits: Dict = None,
+                 tier_buckets: Dict = None,
+                 usage_dir='data/usage'):
+        limits = {**self.DEFAULT_LIMITS, **(limits or {})}
+        self.DAILY_REQUEST_LIMIT = limits['requests_per_day']
+        self.DAILY_TOKEN_LIMIT = limits['tokens_per_day']
+        self.MINUTE_REQUEST_LIMIT = limits['requests_per_minute']
+        self.MINUTE_TOKEN_LIMIT = limits['tokens_per_minute']
+
+        self.counters = SharedCounterBlock(counters_file, fields=self.COUNTER_FIELDS)
+        self.minute_window = SlidingWindowLimiter(
+            window_file,
+            window_seconds=60,
+            max_requests=self.MINUTE_REQUEST_LIMIT,
+            max_tokens=self.MINUTE_TOKEN_LIMIT
+        )
+        # Per-user fairness, applied under the global limits above
+        self.user_buckets = UserTokenBuckets(tier_buckets)
+        # Per-minute history for capacity planning (daily counters reset)
+        self.usage_series = UsageTimeSeries(usage_dir)
+        if self.counters.created:
+            self._import_legacy_counters(legacy_tracker_file)
+
+    def _import_legacy_counters(self, legacy_tracker_file: str):
+        """Carry today's totals over from the JSON tracker written by older versions"""
+        if not os.path.exists(legacy_tracker_file):
+            return
+        try:
+            with open(legacy_tracker_file, 'r') as f:
+                legacy = json.load(f)
+        except (OSError, ValueError):
+            return
+
+        if legacy.get('date') == datetime.now().strftime('%Y-%m-%d'):
+            self.counters.seed({name: legacy.get(name, 0) for name in self.COUNTER_FIELDS})
+
     def _get_tracker_data(self) -> Dict:
-        with open(self.tracker_file, 'r') as f:
-            data = json.load(f)
-        
-        if data['date'] != datetime.now().strftime('%Y-%m-%d'):
-            self._reset_daily_tracker()
-            with open(self.tracker_file, 'r') as f:
-                data = json.load(f)
-        
+        data = self.counters.snapshot()
+        data['reset_time'] = next_midnight().isoformat()
         return data
-    
-    def _clean_minute_tracker(self, tracker_data: Dict):
-        now = datetime.now()
-        one_minute_ago = now - timedelta(minutes=1)
-        tracker_data['minute_tracker'] = [
-            ts for ts in tracker_data['minute_tracker']
-            if datetime.fromisoformat(ts) > one_minute_ago
-        ]
-    
-    def can_make_request(self, is_paid_user: bool = False) -> Dict:
-        tracker_data = self._get_tracker_data()
-        self._clean_minute_tracker(tracker_data)
-        
+
+    def _check_user_bucket(self, phone: str, tier: str) -> Dict:
+        """Take one request from the user's own bucket (None if allowed)"""
+        if not phone:
+            return None
+        bucket = self.user_buckets.try_acquire(phone, tier)
+        if bucket['allowed']:
+            return None
+        return {
+            'allowed': False,
+            'reason': 'user_rate_limit',
+            'message': f"⏱️ You're asking faster than your {tier} plan allows. Wait {bucket['retry_after']} seconds and try again."
+        }
+
+    def can_make_request(self, is_paid_user: bool = False, phone: str = None,
+                         tier: str = 'FREE') -> Dict:
         if is_paid_user:
+            user_limited = self._check_user_bucket(phone, tier)
+            if user_limited:
+                return user_limited
             return {
                 'allowed': True,
                 'message': 'Unlimited access',
@@ -68,65 +100,66 @@ class TokenTracker:
                     'requests_per_minute_remaining': 'unlimited'
                 }
             }
-        
+
+        tracker_data = self._get_tracker_data()
+
         if tracker_data['total_requests_today'] >= self.DAILY_REQUEST_LIMIT:
             reset_time = datetime.fromisoformat(tracker_data['reset_time'])
             hours_until_reset = int((reset_time - datetime.now()).total_seconds() / 3600)
-            
+
             return {
                 'allowed': False,
                 'reason': 'daily_request_limit',
                 'message': f"🌙 Free tier daily limit reached. Resets in ~{hours_until_reset} hours.\n\nUpgrade to $1/month for unlimited access!"
             }
-        
+
         if tracker_data['total_tokens_today'] >= self.DAILY_TOKEN_LIMIT:
             reset_time = datetime.fromisoformat(tracker_data['reset_time'])
             hours_until_reset = int((reset_time - datetime.now()).total_seconds() / 3600)
-            
+
             return {
                 'allowed': False,
                 'reason': 'daily_token_limit',
                 'message': f"🔥 Server capacity reached. Resets in ~{hours_until_reset} hours.\n\n$1/month = Unlimited predictions!"
             }
-        
-        requests_this_minute = len(tracker_data['minute_tracker'])
-        if requests_this_minute >= self.MINUTE_REQUEST_LIMIT:
+
+        window = self.minute_window.check()
+        if not window['allowed']:
             return {
                 'allowed': False,
                 'reason': 'rate_limit',
-                'message': "⏱️ Slow down! Wait 30 seconds and try again.\n\nUpgrade to $1/month for no rate limits!"
+                'message': f"⏱️ Slow down! Wait {window['retry_after']} seconds and try again.\n\nUpgrade to $1/month for no rate limits!"
             }
-        
+
+        user_limited = self._check_user_bucket(phone, tier)
+        if user_limited:
+            return user_limited
+
         requests_remaining = self.DAILY_REQUEST_LIMIT - tracker_data['total_requests_today']
         tokens_remaining = self.DAILY_TOKEN_LIMIT - tracker_data['total_tokens_today']
-        rpm_remaining = self.MINUTE_REQUEST_LIMIT - requests_this_minute
-        
+
         return {
             'allowed': True,
             'message': 'Request allowed',
             'limits': {
                 'requests_remaining': requests_remaining,
                 'tokens_remaining': tokens_remaining,
-                'requests_per_minute_remaining': rpm_remaining
+                'requests_per_minute_remaining': window['requests_remaining']
             }
         }
-    
+
     def record_usage(self, input_tokens: int, output_tokens: int, is_paid_user: bool = False):
-        tracker_data = self._get_tracker_data()
-        tracker_data['total_requests_today'] += 1
-        tracker_data['total_tokens_today'] += (input_tokens + output_tokens)
-        
-        if is_paid_user:
-            tracker_data['paid_requests_today'] += 1
-        else:
-            tracker_data['free_requests_today'] += 1
-        
-        tracker_data['minute_tracker'].append(datetime.now().isoformat())
-        self._clean_minute_tracker(tracker_data)
-        
-        with open(self.tracker_file, 'w') as f:
-            json.dump(tracker_data, f, indent=2)
-    
+        total_tokens = input_tokens + output_tokens
+        self.counters.add(
+            total_requests_today=1,
+            total_tokens_today=total_tokens,
+            paid_requests_today=1 if is_paid_user else 0,
+            free_requests_today=0 if is_paid_user else 1
+        )
+        self.minute_window.record(tokens=total_tokens)
+        self.usage_series.record(input_tokens, output_tokens, is_paid_user=is_paid_user)
+        self.user_buckets.evict_idle()
+
     def get_usage_stats(self) -> Dict:
         tracker_data = self._get_tracker_data()
         return {
@@ -136,4 +169,20 @@ class TokenTracker:
             'tokens_used': tracker_data['total_tokens_today'],
             'tokens_limit': self.DAILY_TOKEN_LIMIT,
             'reset_time': tracker_data['reset_time']
-        }
\ No newline at end of file
+        }
+
+    def get_usage_history(self, days: int = 7) -> Dict:
+        """
+        Usage over the last ``days`` days, for planning against the quota
+
+        Returns:
+            Totals, peak RPM and per-minute percentiles over the whole
+            window, plus one row per day from the daily rollup
+        """
+        now = time.time()
+        start = now - days * 86400
+        summary = self.usage_series.summary(start, now)
+        summary['daily'] = self.usage_series.series('day', start, now)
+        summary['requests_per_minute_limit'] = self.MINUTE_REQUEST_LIMIT
+        summary['tokens_per_minute_limit'] = self.MINUTE_TOKEN_LIMIT
+        return summary
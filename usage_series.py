@@ -0,0 +1,321 @@
+"""
+Token Usage Time Series
+Append-only binary per-minute usage buckets with hourly/daily rollups
+"""
+
+import atexit
+import os
+import struct
+import threading
+import time
+from array import array
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows - fall back to in-process locking only
+    fcntl = None
+
+# bucket start (epoch seconds), requests, input tokens, output tokens,
+# free requests, paid requests
+ROW = struct.Struct('<qIQQII')
+FIELDS = ('requests', 'input_tokens', 'output_tokens', 'free_requests', 'paid_requests')
+
+RESOLUTIONS = {
+    'minute': 60,
+    'hour': 3600,
+    'day': 86400,
+}
+
+# How long each resolution is kept (seconds); None keeps forever
+DEFAULT_RETENTION = {
+    'minute': 14 * 86400,
+    'hour': 180 * 86400,
+    'day': None,
+}
+
+# Minute rows may be appended up to one flush interval late
+ROLLUP_GRACE_SECONDS = 300
+
+
+def _percentile(sorted_values: List[int], pct: float) -> float:
+    """Linear-interpolated percentile of an already sorted list"""
+    if not sorted_values:
+        return 0
+    k = (len(sorted_values) - 1) * pct / 100.0
+    lo = int(k)
+    hi = min(lo + 1, len(sorted_values) - 1)
+    return sorted_values[lo] + (sorted_values[hi] - sorted_values[lo]) * (k - lo)
+
+
+class UsageTimeSeries:
+    """
+    Per-minute request/token buckets in append-only binary files
+
+    Layout (one directory):
+        minute.bin, hour.bin, day.bin - fixed 36-byte rows (see ROW)
+        .lock                          - serialises appends and compaction
+
+    Each process accumulates the current minute in memory and appends one
+    row when the minute ends (or on flush), so a busy minute costs a
+    single 36-byte write per worker. Rows from different workers for the
+    same minute are summed on read. Complete hours and days are rolled
+    up into hour.bin / day.bin, and rows older than the retention window
+    are dropped by rewriting the file.
+    """
+
+    def __init__(self, directory: str = 'data/usage', retention: Dict = None,
+                 background_flush: bool = True):
+        self.directory = directory
+        self.retention = {**DEFAULT_RETENTION, **(retention or {})}
+        os.makedirs(directory, exist_ok=True)
+
+        self._thread_lock = threading.Lock()
+        self._pending_minute = None
+        self._pending = [0] * len(FIELDS)
+        self._last_maintenance = 0
+
+        if background_flush:
+            threading.Thread(target=self._flush_loop, daemon=True).start()
+            atexit.register(self.flush)
+
+    def _path(self, resolution: str) -> str:
+        return os.path.join(self.directory, f'{resolution}.bin')
+
+    @contextmanager
+    def _process_lock(self):
+        """Exclusive lock on the directory's .lock file across processes"""
+        fd = os.open(os.path.join(self.directory, '.lock'), os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            if fcntl is not None:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+            yield
+        finally:
+            os.close(fd)
+
+    @contextmanager
+    def _file_lock(self):
+        """Exclusive lock across threads and processes"""
+        with self._thread_lock, self._process_lock():
+            yield
+
+    def _append(self, resolution: str, rows: List[tuple]):
+        """Append rows (caller holds the lock)"""
+        if not rows:
+            return
+        with open(self._path(resolution), 'ab') as f:
+            f.write(b''.join(ROW.pack(*row) for row in rows))
+
+    def _read(self, resolution: str, start: Optional[int] = None,
+              end: Optional[int] = None) -> Dict[int, List[int]]:
+        """Rows in [start, end) merged by bucket start, in time order"""
+        path = self._path(resolution)
+        if not os.path.exists(path):
+            return {}
+        with open(path, 'rb') as f:
+            data = f.read()
+        data = data[:len(data) - len(data) % ROW.size]  # ignore a torn last row
+
+        merged: Dict[int, List[int]] = {}
+        for row in ROW.iter_unpack(data):
+            ts = row[0]
+            if (start is not None and ts < start) or (end is not None and ts >= end):
+                continue
+            bucket = merged.setdefault(ts, [0] * len(FIELDS))
+            for i, value in enumerate(row[1:]):
+                bucket[i] += value
+        return dict(sorted(merged.items()))
+
+    def record(self, input_tokens: int, output_tokens: int, is_paid_user: bool = False,
+               now: Optional[float] = None):
+        """Count one request in the current minute"""
+        now = time.time() if now is None else now
+        minute = int(now) // 60 * 60
+        with self._thread_lock:
+            if self._pending_minute is not None and self._pending_minute != minute:
+                self._flush_pending_locked()
+            self._pending_minute = minute
+            for i, value in enumerate((1, input_tokens, output_tokens,
+                                       0 if is_paid_user else 1,
+                                       1 if is_paid_user else 0)):
+                self._pending[i] += value
+
+    def _flush_pending_locked(self):
+        """Append the pending minute (caller holds the thread lock)"""
+        if self._pending_minute is None or not self._pending[0]:
+            return
+        with self._process_lock():
+            self._append('minute', [(self._pending_minute, *self._pending)])
+        self._pending_minute = None
+        self._pending = [0] * len(FIELDS)
+
+    def flush(self, now: Optional[float] = None):
+        """Append the in-progress minute once it has ended"""
+        now = time.time() if now is None else now
+        with self._thread_lock:
+            if self._pending_minute is not None and self._pending_minute < int(now) // 60 * 60:
+                self._flush_pending_locked()
+
+    def _flush_loop(self):
+        """Background writer: close out finished minutes, roll up hourly"""
+        while True:
+            time.sleep(60)
+            try:
+                self.flush()
+                if time.time() - self._last_maintenance >= 3600:
+                    self.rollup()
+                    self.apply_retention()
+                    self._last_maintenance = time.time()
+            except OSError:
+                pass
+
+    def _last_bucket(self, resolution: str) -> Optional[int]:
+        path = self._path(resolution)
+        if not os.path.exists(path):
+            return None
+        size = os.path.getsize(path) // ROW.size * ROW.size
+        if not size:
+            return None
+        with open(path, 'rb') as f:
+            f.seek(size - ROW.size)
+            return ROW.unpack(f.read(ROW.size))[0]
+
+    def rollup(self, now: Optional[float] = None) -> Dict[str, int]:
+        """
+        Aggregate complete hours from minute rows and complete days from hours
+
+        Returns:
+            {'hour': rows added, 'day': rows added}
+        """
+        now = int(time.time() if now is None else now) - ROLLUP_GRACE_SECONDS
+        added = {}
+        with self._file_lock():
+            for fine, coarse in (('minute', 'hour'), ('hour', 'day')):
+                width = RESOLUTIONS[coarse]
+                last = self._last_bucket(coarse)
+                start = None if last is None else last + width
+                end = now // width * width
+
+                totals: Dict[int, List[int]] = {}
+                for ts, values in self._read(fine, start, end).items():
+                    bucket = totals.setdefault(ts // width * width, [0] * len(FIELDS))
+                    for i, value in enumerate(values):
+                        bucket[i] += value
+
+                rows = [(ts, *values) for ts, values in sorted(totals.items())]
+                self._append(coarse, rows)
+                added[coarse] = len(rows)
+        return added
+
+    def apply_retention(self, now: Optional[float] = None) -> Dict[str, int]:
+        """
+        Drop rows older than each resolution's retention window
+
+        Returns:
+            {resolution: rows removed}
+        """
+        now = int(time.time() if now is None else now)
+        removed = {}
+        with self._file_lock():
+            for resolution, keep in self.retention.items():
+                path = self._path(resolution)
+                if keep is None or not os.path.exists(path):
+                    continue
+                cutoff = now - keep
+                with open(path, 'rb') as f:
+                    data = f.read()
+                data = data[:len(data) - len(data) % ROW.size]
+                kept = [row for row in ROW.iter_unpack(data) if row[0] >= cutoff]
+                removed[resolution] = len(data) // ROW.size - len(kept)
+                if removed[resolution]:
+                    tmp = path + '.tmp'
+                    with open(tmp, 'wb') as f:
+                        f.write(b''.join(ROW.pack(*row) for row in kept))
+                    os.replace(tmp, path)
+        return removed
+
+    def series(self, resolution: str = 'minute', start: Optional[float] = None,
+               end: Optional[float] = None) -> List[Dict]:
+        """
+        Buckets in [start, end) at the given resolution
+
+        Returns:
+            [{'start': epoch seconds, 'requests': int, 'input_tokens': int, ...}]
+        """
+        start = None if start is None else int(start)
+        end = None if end is None else int(end)
+        merged = self._read(resolution, start, end)
+
+        # Include this process's unflushed minute
+        with self._thread_lock:
+            ts, pending = self._pending_minute, list(self._pending)
+        if resolution == 'minute' and ts is not None:
+            if (start is None or ts >= start) and (end is None or ts < end):
+                bucket = merged.setdefault(ts, [0] * len(FIELDS))
+                for i, value in enumerate(pending):
+                    bucket[i] += value
+                merged = dict(sorted(merged.items()))
+
+        return [{'start': ts, **dict(zip(FIELDS, values))} for ts, values in merged.items()]
+
+    def summary(self, start: float, end: Optional[float] = None) -> Dict:
+        """
+        Totals, per-minute percentiles and peak RPM over [start, end)
+
+        Idle minutes count as zero, so percentiles describe the whole
+        window rather than only the busy part of it.
+        """
+        end = time.time() if end is None else end
+        start_minute = int(start) // 60 * 60
+        end_minute = (int(end) + 59) // 60 * 60
+        minutes = max(1, (end_minute - start_minute) // 60)
+
+        rpm = array('q', [0] * minutes)
+        tpm = array('q', [0] * minutes)
+        totals = dict.fromkeys(FIELDS, 0)
+        for bucket in self.series('minute', start_minute, end_minute):
+            i = (bucket['start'] - start_minute) // 60
+            rpm[i] = bucket['requests']
+            tpm[i] = bucket['input_tokens'] + bucket['output_tokens']
+            for name in FIELDS:
+                totals[name] += bucket[name]
+
+        peak_index = max(range(minutes), key=rpm.__getitem__)
+        rpm_sorted = sorted(rpm)
+        tpm_sorted = sorted(tpm)
+
+        return {
+            **totals,
+            'minutes': minutes,
+            'peak_rpm': rpm[peak_index],
+            'peak_rpm_at': start_minute + peak_index * 60 if rpm[peak_index] else None,
+            'peak_tpm': tpm_sorted[-1],
+            'rpm_p50': _percentile(rpm_sorted, 50),
+            'rpm_p95': _percentile(rpm_sorted, 95),
+            'rpm_p99': _percentile(rpm_sorted, 99),
+            'tpm_p50': _percentile(tpm_sorted, 50),
+            'tpm_p95': _percentile(tpm_sorted, 95),
+            'tpm_p99': _percentile(tpm_sorted, 99),
+        }
+
+
+if __name__ == "__main__":
+    import random
+    import tempfile
+
+    print("=" * 60)
+    print("USAGE TIME SERIES TEST")
+    print("=" * 60)
+
+    usage = UsageTimeSeries(tempfile.mkdtemp(), background_flush=False)
+    start = 1_700_000_000 // 86400 * 86400
+    for second in range(0, 2 * 86400, 7):
+        if random.random() < 0.3:
+            usage.record(random.randint(500, 2000), random.randint(200, 800),
+                         is_paid_user=random.random() < 0.2, now=start + second)
+    usage.flush(now=start + 2 * 86400)
+
+    print(f"\nRollup: {usage.rollup(now=start + 2 * 86400 + 3600)}")
+    print(f"Daily:  {usage.series('day')}")
+    print(f"\nDay 1 summary: {usage.summary(start, start + 86400)}")
@@ -0,0 +1,158 @@
+"""
+User Secondary Indexes
+Sorted in-memory indexes over user fields for targeted admin queries
+"""
+
+import threading
+from bisect import bisect_left, insort
+from typing import Callable, Dict, List, Optional, Set
+
+# Sorts after any real value sharing the same prefix
+_MAX_CHAR = '\U0010ffff'
+
+
+class SortedIndex:
+    """
+    One secondary index: (value, phone) pairs kept in sorted order
+
+    Equality, range and prefix lookups are two binary searches over the
+    sorted list; counts never touch the matching entries at all. Users
+    whose value is missing are simply not in the index.
+    """
+
+    def __init__(self, extract: Callable[[Dict], Optional[str]]):
+        self.extract = extract
+        self._entries: List[tuple] = []
+        self._values: Dict[str, str] = {}
+
+    def _bounds(self, lo: Optional[str], hi: Optional[str]) -> tuple:
+        start = 0 if lo is None else bisect_left(self._entries, (lo,))
+        end = len(self._entries) if hi is None else bisect_left(self._entries, (hi,))
+        return start, max(start, end)
+
+    def put(self, phone: str, user: Dict):
+        """Insert or move a user's entry to match their current record"""
+        value = self.extract(user)
+        value = None if value is None else str(value)
+        if self._values.get(phone) == value:
+            return
+        self.remove(phone)
+        if value is not None:
+            insort(self._entries, (value, phone))
+            self._values[phone] = value
+
+    def remove(self, phone: str):
+        old = self._values.pop(phone, None)
+        if old is not None:
+            i = bisect_left(self._entries, (old, phone))
+            if i < len(self._entries) and self._entries[i] == (old, phone):
+                del self._entries[i]
+
+    def range(self, lo: Optional[str] = None, hi: Optional[str] = None) -> List[str]:
+        """Phones with lo <= value < hi (either bound may be None)"""
+        start, end = self._bounds(lo, hi)
+        return [phone for _, phone in self._entries[start:end]]
+
+    def equal(self, value: str) -> List[str]:
+        return self.range(value, value + '\0')
+
+    def prefix(self, prefix: str) -> List[str]:
+        return self.range(prefix, prefix + _MAX_CHAR)
+
+    def count(self, lo: Optional[str] = None, hi: Optional[str] = None) -> int:
+        start, end = self._bounds(lo, hi)
+        return end - start
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class UserIndexes:
+    """
+    The set of secondary indexes kept by UserDatabase
+
+    Indexed fields:
+        tier             - user['subscription'], the field the app and
+                           payments write (falls back to 'tier')
+        country_code     - e.g. '+91'
+        registered_at    - ISO timestamp
+        last_question_at - ISO timestamp of the most recent question
+    """
+
+    FIELDS = {
+        'tier': lambda u: u.get('subscription') or u.get('tier'),
+        'country_code': lambda u: u.get('country_code'),
+        'registered_at': lambda u: u.get('registered_at'),
+        'last_question_at': lambda u: u.get('last_question_at'),
+    }
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.indexes = {name: SortedIndex(extract) for name, extract in self.FIELDS.items()}
+
+    def rebuild(self, users: Dict[str, Dict]):
+        with self._lock:
+            self.indexes = {name: SortedIndex(extract) for name, extract in self.FIELDS.items()}
+            for phone, user in users.items():
+                for index in self.indexes.values():
+                    index.put(phone, user)
+
+    def update(self, phone: str, user: Dict):
+        """Re-index one user after a write"""
+        with self._lock:
+            for index in self.indexes.values():
+                index.put(phone, user)
+
+    def remove(self, phone: str):
+        with self._lock:
+            for index in self.indexes.values():
+                index.remove(phone)
+
+    def find(self, **conditions) -> List[str]:
+        """
+        Phones matching every condition, in phone order
+
+        Each keyword is an indexed field. Its value can be:
+            'FREE'                      exact match
+            ('2025-01-01', '2025-02-01') half-open range, either end None
+            {'prefix': '+9'}            prefix match
+        """
+        with self._lock:
+            matches: List[Set[str]] = []
+            for name, condition in conditions.items():
+                if condition is None:
+                    continue
+                index = self.indexes[name]
+                if isinstance(condition, tuple):
+                    matches.append(set(index.range(*condition)))
+                elif isinstance(condition, dict):
+                    matches.append(set(index.prefix(condition['prefix'])))
+                else:
+                    matches.append(set(index.equal(condition)))
+
+        if not matches:
+            return []
+        matches.sort(key=len)
+        result = matches[0]
+        for other in matches[1:]:
+            result = result & other
+        return sorted(result)
+
+    def count(self, **conditions) -> int:
+        """Like find(); a single range/prefix/equality condition is O(log n)"""
+        active = {k: v for k, v in conditions.items() if v is not None}
+        if len(active) == 1:
+            (name, condition), = active.items()
+            index = self.indexes[name]
+            with self._lock:
+                if isinstance(condition, tuple):
+                    return index.count(*condition)
+                if isinstance(condition, dict):
+                    return index.count(condition['prefix'], condition['prefix'] + _MAX_CHAR)
+                return index.count(condition, condition + '\0')
+        return len(self.find(**conditions))
+
+    def stats(self) -> Dict[str, int]:
+        """Number of indexed users per field"""
+        return {name: len(index) for name, index in self.indexes.items()}
+
@@ -6,7 +6,11 @@ Handles phone authentication and birth data storage
 import json
 import os
 from datetime import datetime
-from typing import Dict, Optional, Tuple
+from typing import Dict, List, Optional, Tuple
+
+from geocoder import resolve_place
+from phone_numbers import parse_phone
+from user_index import UserIndexes
 
 class UserDatabase:
     """Simple JSON-based user database (will upgrade to Firebase later)"""
@@ -14,6 +18,16 @@ class UserDatabase:
     def __init__(self, db_path='data/users.json'):
         self.db_path = db_path
         self._ensure_db_exists()
+        
+        # Secondary indexes (tier, country_code, registered_at,
+        # last_question_at), kept in step with every write below
+        self.indexes = UserIndexes()
+        self._indexed_mtime = None
+        
+        # Store reads/writes since startup (see UserSnapshot)
+        self.read_count = 0
+        self.write_count = 0
+        self._load_users()
     
     def _ensure_db_exists(self):
         """Create database file if it doesn't exist"""
@@ -22,11 +36,33 @@ class UserDatabase:
             with open(self.db_path, 'w') as f:
                 json.dump({}, f)
     
-    def user_exists(self, phone: str) -> bool:
-        """Check if user is already registered"""
+    def _load_users(self) -> Dict:
+        """Read all users; rebuild the indexes if another process wrote the file"""
+        mtime = os.path.getmtime(self.db_path)
         with open(self.db_path, 'r') as f:
             users = json.load(f)
-        return phone in users
+        self.read_count += 1
+        if mtime != self._indexed_mtime:
+            self.indexes.rebuild(users)
+            self._indexed_mtime = mtime
+        return users
+    
+    def _save_users(self, users: Dict, phone: str):
+        """Write all users and re-index the one that changed"""
+        with open(self.db_path, 'w') as f:
+            json.dump(users, f, indent=2)
+        self.write_count += 1
+        self.indexes.update(phone, users[phone])
+        self._indexed_mtime = os.path.getmtime(self.db_path)
+    
+    def _refresh_indexes(self):
+        """Pick up writes made by other processes before answering a query"""
+        if os.path.getmtime(self.db_path) != self._indexed_mtime:
+            self._load_users()
+    
+    def user_exists(self, phone: str) -> bool:
+        """Check if user is already registered"""
+        return phone in self._load_users()
     
     def register_user(self, phone: str, user_data: Dict) -> bool:
         """
@@ -64,12 +100,10 @@ class UserDatabase:
         Returns:
             True if successful, False if user already exists
         """
-        if self.user_exists(phone):
+        users = self._load_users()
+        if phone in users:
             return False
         
-        with open(self.db_path, 'r') as f:
-            users = json.load(f)
-        
         birth_data_quality = user_data.get('birth_data_quality', 'exact')
         
         # Build birth details based on quality
@@ -81,6 +115,7 @@ class UserDatabase:
             birth_details.update({
                 'dob': user_data.get('dob'),
                 'tob': user_data.get('tob'),
+                'place': user_data.get('place'),
                 'city': user_data.get('birth_city'),
                 'state': user_data.get('birth_state'),
                 'country': user_data.get('birth_country'),
@@ -99,12 +134,17 @@ class UserDatabase:
             })
         # 'none' quality has minimal birth data
         
+        # Resolve country and residence timezone once, here, so the
+        # per-question path never has to parse the phone number
+        phone_info = parse_phone(phone) or {}
+        
         # Store user with enhanced metadata
         users[phone] = {
             'name': user_data.get('name'),
             'email': user_data.get('email', ''),
-            'country_code': user_data.get('country_code'),
-            'country_name': user_data.get('country_name'),
+            'country_code': user_data.get('country_code') or phone_info.get('code'),
+            'country_name': user_data.get('country_name') or phone_info.get('country'),
+            'timezone': user_data.get('timezone') or phone_info.get('timezone'),
             
             'birth_details': birth_details,
             
@@ -126,37 +166,39 @@ class UserDatabase:
             'pwa_installed': False
         }
         
-        with open(self.db_path, 'w') as f:
-            json.dump(users, f, indent=2)
+        self._save_users(users, phone)
         
         return True
     
     def get_user(self, phone: str) -> Optional[Dict]:
         """Get user data"""
-        with open(self.db_path, 'r') as f:
-            users = json.load(f)
-        return users.get(phone)
+        return self._load_users().get(phone)
     
     def update_user(self, phone: str, updates: Dict):
         """Update user data"""
-        with open(self.db_path, 'r') as f:
-            users = json.load(f)
+        users = self._load_users()
         
         if phone in users:
             users[phone].update(updates)
-            
-            with open(self.db_path, 'w') as f:
-                json.dump(users, f, indent=2)
+            self._save_users(users, phone)
     
-    def increment_question_count(self, phone: str):
-        """Increment lifetime question counter and decrement questions_left"""
-        user = self.get_user(phone)
+    def increment_question_count(self, phone: str) -> Optional[Dict]:
+        """
+        Increment lifetime question counter and decrement questions_left
+        
+        Returns the updated user (one read, one write) so callers don't
+        have to read it back.
+        """
+        users = self._load_users()
+        user = users.get(phone)
         if user:
             user['questions_asked'] = user.get('questions_asked', 0) + 1
             user['lifetime_questions'] = user.get('lifetime_questions', 0) + 1
             user['questions_left'] = max(0, user.get('questions_left', 7) - 1)
             user['updated_at'] = datetime.now().isoformat()
-            self.update_user(phone, user)
+            user['last_question_at'] = user['updated_at']
+            self._save_users(users, phone)
+        return user
     
     def can_ask_question(self, phone: str) -> Tuple[bool, str]:
         """
@@ -192,9 +234,11 @@ class UserDatabase:
             phone: User phone number
             new_tier: PAID, PREMIUM, or VIP
         """
-        user = self.get_user(phone)
+        users = self._load_users()
+        user = users.get(phone)
         if user:
             user['tier'] = new_tier
+            user['subscription'] = new_tier
             
             # Set questions limit based on tier
             if new_tier in ['PAID', 'PREMIUM', 'VIP']:
@@ -203,41 +247,88 @@ class UserDatabase:
                 user['questions_limit'] = 7  # FREE tier
             
             user['updated_at'] = datetime.now().isoformat()
-            self.update_user(phone, user)
+            self._save_users(users, phone)
     
     def get_user_tier(self, phone: str) -> str:
         """Get user's subscription tier"""
         user = self.get_user(phone)
         return user.get('tier', 'FREE') if user else 'FREE'
+    
+    def find_users(self, tier=None, country_code=None, registered_at=None,
+                   last_question_at=None) -> List[str]:
+        """
+        Phones of users matching all given conditions, via the secondary indexes
+        
+        Each condition is an exact value, a (start, end) half-open range
+        (either end may be None), or {'prefix': ...}. Timestamps are ISO
+        strings, so date prefixes work as ranges too.
+        
+        Examples:
+            find_users(tier='VIP')
+            find_users(tier='FREE', country_code='+91',
+                       last_question_at=(week_ago.isoformat(), None))
+            find_users(registered_at={'prefix': '2025-12'})
+        """
+        self._refresh_indexes()
+        return self.indexes.find(
+            tier=tier,
+            country_code=country_code,
+            registered_at=registered_at,
+            last_question_at=last_question_at
+        )
+    
+    def count_users(self, tier=None, country_code=None, registered_at=None,
+                    last_question_at=None) -> int:
+        """Number of users find_users() would return"""
+        self._refresh_indexes()
+        return self.indexes.count(
+            tier=tier,
+            country_code=country_code,
+            registered_at=registered_at,
+            last_question_at=last_question_at
+        )
 
 
-# Simple geocoding helper (for getting lat/lon from place name)
-def geocode_place(place_name: str) -> tuple:
-    """
-    Convert place name to coordinates
-    For now, returns hardcoded common cities
-    Later: integrate with Google Maps API
+class UserSnapshot:
     """
+    Users as read once for a single request (one Streamlit rerun)
     
-    cities = {
-        'hyderabad': (17.3850, 78.4867),
-        'bangalore': (12.9716, 77.5946),
-        'mumbai': (19.0760, 72.8777),
-        'delhi': (28.7041, 77.1025),
-        'chennai': (13.0827, 80.2707),
-        'kolkata': (22.5726, 88.3639),
-        'pune': (18.5204, 73.8567),
-        'ongole': (15.5057, 80.0499),
-    }
+    The first get() for a phone reads the store; later calls return the
+    same dict until the database records a write, after which the next
+    get() reads again. Create one per rerun and pass it around instead of
+    calling db.get_user() at each use site.
+    """
     
-    place_lower = place_name.lower().strip()
+    def __init__(self, db: UserDatabase):
+        self.db = db
+        self.reads = 0
+        self._users: Dict[str, Optional[Dict]] = {}
+        self._write_count = db.write_count
     
-    if place_lower in cities:
-        return cities[place_lower]
+    def get(self, phone: str) -> Optional[Dict]:
+        """User for this request, reading the store at most once per write"""
+        if self.db.write_count != self._write_count:
+            self._users.clear()
+            self._write_count = self.db.write_count
+        if phone not in self._users:
+            self._users[phone] = self.db.get_user(phone)
+            self.reads += 1
+        return self._users[phone]
+
+
+# Geocoding helper (for getting lat/lon from place name)
+def geocode_place(place_name: str) -> Optional[tuple]:
+    """
+    Convert place name to coordinates using the offline gazetteer
     
-    # Default to Hyderabad if not found
-    print(f"Warning: '{place_name}' not in database, using Hyderabad coordinates")
-    return cities['hyderabad']
+    Accepts 'City' or 'City, State, Country'. Returns None when the place
+    is unknown rather than guessing a default city.
+    """
+    place = resolve_place(place_name)
+    if place is None:
+        print(f"Warning: '{place_name}' not found in gazetteer")
+        return None
+    return place['lat'], place['lon']
 
 
 if __name__ == "__main__":
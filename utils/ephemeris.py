@@ -4,16 +4,33 @@ Works on Windows without C++ compiler
 """
 
 from astropy.time import Time
-from astropy.coordinates import get_body, solar_system_ephemeris, EarthLocation
+from astropy.coordinates import get_body, solar_system_ephemeris, EarthLocation, GeocentricTrueEcliptic
 import astropy.units as u
 from datetime import datetime
+import numpy as np
 import pytz
-from typing import Dict
+from typing import Dict, List, Tuple
+
+from aspects import format_aspects
+from dasha import format_dasha
+from houses import birth_to_utc, house_cusps, house_of
+from kp import format_kp, kp_positions
+from vargas import format_vargas
 
 # Ayanamsa for Vedic calculations (Lahiri)
 LAHIRI_AYANAMSA_2000 = 23.85  # degrees at J2000 epoch
 AYANAMSA_RATE = 0.0138889  # degrees per year (approx 50" per year)
 
+BODIES = ['Sun', 'Moon', 'Mercury', 'Venus', 'Mars', 'Jupiter', 'Saturn', 'Rahu']
+
+# Daily motion is the central difference over t ± this many days
+SPEED_STEP_DAYS = 0.5
+
+# Combustion: within this many degrees of the Sun (tighter for
+# retrograde Mercury and Venus)
+COMBUSTION_ORBS = {'Moon': 12, 'Mars': 17, 'Mercury': 14, 'Jupiter': 11, 'Venus': 10, 'Saturn': 15}
+COMBUSTION_ORBS_RETROGRADE = {'Mercury': 12, 'Venus': 8}
+
 SIGNS = ['Aries', 'Taurus', 'Gemini', 'Cancer', 'Leo', 'Virgo',
          'Libra', 'Scorpio', 'Sagittarius', 'Capricorn', 'Aquarius', 'Pisces']
 
@@ -58,80 +75,128 @@ def get_planet_position(planet_name, time_obj):
     
     if planet_name in planet_map:
         body = get_body(planet_map[planet_name], time_obj, ephemeris='builtin')
-        # Get ecliptic longitude
-        lon = body.geocentrictrueecliptic.lon.degree
+        # Ecliptic longitude from the true equinox of date, which is what
+        # the ayanamsa is measured from
+        lon = body.transform_to(GeocentricTrueEcliptic(equinox=time_obj)).lon.degree
         return lon
     
     return None
 
 
+def mean_node(time_obj):
+    """Tropical longitude of the Moon's mean ascending node (Rahu), Meeus 47.7"""
+    t = (time_obj.jd - 2451545.0) / 36525
+    return np.mod(125.0445479 - 1934.1362891 * t + 0.0020754 * t ** 2
+                  + t ** 3 / 467441 - t ** 4 / 60616000, 360.0)
+
+
+def get_positions(dt: datetime) -> Dict[str, Tuple[float, float]]:
+    """
+    Tropical longitude and daily motion (degrees/day) of every body at dt
+    
+    Each body is evaluated at dt - SPEED_STEP_DAYS, dt and
+    dt + SPEED_STEP_DAYS in one vectorised call; the motion is the
+    central difference.
+    """
+    time_obj = Time(dt) + np.array([-SPEED_STEP_DAYS, 0, SPEED_STEP_DAYS]) * u.day
+    positions = {}
+    for name in BODIES:
+        lons = mean_node(time_obj) if name == 'Rahu' else get_planet_position(name, time_obj)
+        if lons is not None:
+            speed = (np.mod(lons[2] - lons[0] + 180, 360.0) - 180) / (2 * SPEED_STEP_DAYS)
+            positions[name] = (float(lons[1]), float(speed))
+    return positions
+
+
+def add_motion_flags(bodies: Dict[str, Dict]):
+    """Set 'retrograde' and 'combust' on bodies that carry 'longitude' and 'speed'"""
+    sun = bodies.get('Sun')
+    for name, body in bodies.items():
+        body['retrograde'] = body['speed'] < 0
+        orbs = COMBUSTION_ORBS_RETROGRADE if body['retrograde'] and name in COMBUSTION_ORBS_RETROGRADE else COMBUSTION_ORBS
+        if sun is not None and name in orbs:
+            distance = abs((body['longitude'] - sun['longitude'] + 180) % 360 - 180)
+            body['combust'] = distance <= orbs[name]
+        else:
+            body['combust'] = False
+
+
+def _motion_note(data: Dict) -> str:
+    """', +0.98°/day, retrograde, combust' for a body with motion fields"""
+    if 'speed' not in data:
+        return ''
+    notes = [f"{data['speed']:+.2f}°/day"]
+    notes += [flag for flag in ('retrograde', 'combust') if data.get(flag)]
+    return ', ' + ', '.join(notes)
+
+
 def calculate_ascendant(dt, lat, lon):
-    """Calculate Ascendant (simplified)"""
-    time_obj = Time(dt)
-    sun_tropical = get_planet_position('Sun', time_obj)
-    hour_angle = (dt.hour + dt.minute/60) * 15
-    asc_tropical = (sun_tropical + hour_angle) % 360
-    asc_sidereal = tropical_to_sidereal(asc_tropical, dt.year)
-    return asc_sidereal
+    """Calculate sidereal Ascendant from local sidereal time and latitude"""
+    return float(house_cusps(dt, lat, lon, get_ayanamsa(dt.year))['asc'])
 
 
 def calculate_chart(birth_date: datetime, lat: float, lon: float) -> Dict:
-    """Calculate complete birth chart"""
+    """
+    Calculate complete birth chart
+    
+    birth_date should be timezone-aware (see houses.birth_to_utc); a
+    naive datetime is taken as UTC.
+    """
     if birth_date.tzinfo is None:
         birth_date = pytz.utc.localize(birth_date)
     
-    time_obj = Time(birth_date)
     planets = {}
-    planet_names = ['Sun', 'Moon', 'Mercury', 'Venus', 'Mars', 'Jupiter', 'Saturn']
     
-    for planet_name in planet_names:
-        tropical_long = get_planet_position(planet_name, time_obj)
-        
-        if tropical_long is not None:
-            sidereal_long = tropical_to_sidereal(tropical_long, birth_date.year)
-            sign_num = int(sidereal_long / 30)
-            degree_in_sign = sidereal_long % 30
-            nak_num = int(sidereal_long / 13.333333)
-            nak_pada = int((sidereal_long % 13.333333) / 3.333333) + 1
-            
-            planets[planet_name] = {
-                'longitude': round(sidereal_long, 2),
-                'sign': SIGNS[sign_num],
-                'sign_num': sign_num + 1,
-                'degree': round(degree_in_sign, 2),
-                'nakshatra': NAKSHATRAS[nak_num],
-                'pada': nak_pada
-            }
-    
-    # Calculate Rahu
-    if 'Moon' in planets:
-        moon_long = planets['Moon']['longitude']
-        rahu_long = (moon_long + 180) % 360
-        sign_num = int(rahu_long / 30)
-        degree_in_sign = rahu_long % 30
-        nak_num = int(rahu_long / 13.333333)
-        nak_pada = int((rahu_long % 13.333333) / 3.333333) + 1
+    # Planets and Rahu (mean node), with their daily motion
+    for planet_name, (tropical_long, speed) in get_positions(birth_date).items():
+        sidereal_long = tropical_to_sidereal(tropical_long, birth_date.year)
+        sign_num = int(sidereal_long / 30)
+        degree_in_sign = sidereal_long % 30
+        nak_num = int(sidereal_long / 13.333333)
+        nak_pada = int((sidereal_long % 13.333333) / 3.333333) + 1
         
-        planets['Rahu'] = {
-            'longitude': round(rahu_long, 2),
+        planets[planet_name] = {
+            'longitude': round(sidereal_long, 4),
             'sign': SIGNS[sign_num],
             'sign_num': sign_num + 1,
             'degree': round(degree_in_sign, 2),
             'nakshatra': NAKSHATRAS[nak_num],
-            'pada': nak_pada
+            'pada': nak_pada,
+            'speed': round(speed, 4)
         }
+    add_motion_flags(planets)
     
-    # Calculate Ascendant
-    asc_sidereal = calculate_ascendant(birth_date, lat, lon)
+    # Ascendant, MC and house cusps
+    houses = house_cusps(birth_date, lat, lon, get_ayanamsa(birth_date.year))
+    asc_sidereal = float(houses['asc'])
     asc_sign_num = int(asc_sidereal / 30)
+    ascendant = {
+        'longitude': round(asc_sidereal, 2),
+        'sign': SIGNS[asc_sign_num],
+        'degree': round(asc_sidereal % 30, 2)
+    }
+    mc = float(houses['mc'])
+    
+    # Whole-sign house and Placidus bhava of every planet
+    longitudes = [planets[name]['longitude'] for name in planets]
+    for name, house, bhava in zip(planets, house_of(longitudes, houses['whole_sign']),
+                                  house_of(longitudes, houses['placidus'])):
+        planets[name]['house'] = int(house)
+        planets[name]['bhava'] = int(bhava)
+    
+    # KP lords for every body in one lookup
+    for name, kp in kp_positions({'Asc': ascendant, **planets}).items():
+        (ascendant if name == 'Asc' else planets[name])['kp'] = kp
     
     return {
         'planets': planets,
-        'ascendant': {
-            'longitude': round(asc_sidereal, 2),
-            'sign': SIGNS[asc_sign_num],
-            'degree': round(asc_sidereal % 30, 2)
+        'ascendant': ascendant,
+        'mc': {
+            'longitude': round(mc, 2),
+            'sign': SIGNS[int(mc / 30)],
+            'degree': round(mc % 30, 2)
         },
+        'placidus_cusps': [round(float(c), 2) for c in houses['placidus']],
         'ayanamsa': round(get_ayanamsa(birth_date.year), 4)
     }
 
@@ -143,56 +208,95 @@ def calculate_transits(dt: datetime = None) -> Dict:
     elif dt.tzinfo is None:
         dt = pytz.utc.localize(dt)
     
-    time_obj = Time(dt)
     transits = {}
-    planet_names = ['Sun', 'Moon', 'Mercury', 'Venus', 'Mars', 'Jupiter', 'Saturn']
     
-    for planet_name in planet_names:
-        tropical_long = get_planet_position(planet_name, time_obj)
-        
-        if tropical_long is not None:
-            sidereal_long = tropical_to_sidereal(tropical_long, dt.year)
-            sign_num = int(sidereal_long / 30)
-            
-            transits[planet_name] = {
-                'sign': SIGNS[sign_num],
-                'degree': round(sidereal_long % 30, 2)
-            }
-    
-    # Add Rahu
-    if 'Moon' in transits:
-        moon_long_tropical = get_planet_position('Moon', time_obj)
-        rahu_long = tropical_to_sidereal((moon_long_tropical + 180) % 360, dt.year)
-        sign_num = int(rahu_long / 30)
+    for planet_name, (tropical_long, speed) in get_positions(dt).items():
+        sidereal_long = tropical_to_sidereal(tropical_long, dt.year)
+        sign_num = int(sidereal_long / 30)
         
-        transits['Rahu'] = {
+        transits[planet_name] = {
+            'longitude': round(sidereal_long, 4),
             'sign': SIGNS[sign_num],
-            'degree': round(rahu_long % 30, 2)
+            'degree': round(sidereal_long % 30, 2),
+            'speed': round(speed, 4)
         }
+    add_motion_flags(transits)
+    
+    for name, kp in kp_positions(transits).items():
+        transits[name]['kp'] = kp
     
     return transits
 
 
-def format_chart_for_ai(chart: Dict, transits: Dict) -> str:
-    """Format chart data for AI prompt"""
-    output = "BIRTH CHART DATA:\n"
-    output += f"Ascendant: {chart['ascendant']['sign']} {chart['ascendant']['degree']}°\n\n"
+def format_chart_for_ai(chart: Dict, transits: Dict, local_systems: Dict = None,
+                        vargas: Dict = None, dasha: Dict = None, kp: bool = False,
+                        aspects: List[Dict] = None) -> str:
+    """
+    Format chart data for AI prompt
     
-    output += "PLANETARY POSITIONS:\n"
-    for planet, data in chart['planets'].items():
-        output += f"{planet}: {data['sign']} {data['degree']}° ({data['nakshatra']} Pada {data['pada']})\n"
+    chart: calculate_chart() result, or None when there's no exact
+    birth chart (only transits and the optional sections are shown)
+    local_systems: {system name: facts with a 'summary'} from the local
+    calculators, included so the model doesn't redo the arithmetic
+    vargas: calculate_vargas() result; the divisional chart section is
+    only added when this is given
+    dasha: DashaTimeline.at() result for today, likewise optional
+    kp: add the KP sign/star/sub/sub-sub lords of natal and transit bodies
+    aspects: aspects.top_aspects() result, tightest first
+    """
+    output = ""
+    if chart:
+        output += "BIRTH CHART DATA:\n"
+        output += f"Ascendant: {chart['ascendant']['sign']} {chart['ascendant']['degree']}°\n"
+        if 'mc' in chart:
+            output += f"MC: {chart['mc']['sign']} {chart['mc']['degree']}°\n"
+            output += "Placidus cusps: " + ', '.join(
+                f"{i} {SIGNS[int(c / 30)][:3]} {c % 30:.2f}°" for i, c in enumerate(chart['placidus_cusps'], 1)
+            ) + "\n"
+        
+        output += "\nPLANETARY POSITIONS (house = whole-sign, bhava = Placidus):\n"
+        for planet, data in chart['planets'].items():
+            houses = f", house {data['house']}, bhava {data['bhava']}" if 'house' in data else ''
+            output += (f"{planet}: {data['sign']} {data['degree']}° "
+                       f"({data['nakshatra']} Pada {data['pada']}{houses}{_motion_note(data)})\n")
+        output += "\n"
     
-    output += "\nCURRENT TRANSITS:\n"
+    output += "CURRENT TRANSITS:\n"
     for planet, data in transits.items():
-        output += f"{planet}: {data['sign']} {data['degree']}°\n"
+        note = _motion_note(data)
+        output += f"{planet}: {data['sign']} {data['degree']}°" + (f" ({note[2:]})" if note else "") + "\n"
+    
+    if aspects:
+        output += "\nTRANSIT ASPECTS TO NATAL (tightest first):\n"
+        output += format_aspects(aspects) + "\n"
+    
+    if vargas:
+        output += "\nDIVISIONAL CHARTS (sidereal signs):\n"
+        output += format_vargas(vargas) + "\n"
+    
+    if dasha:
+        output += "\nVIMSHOTTARI DASHA (computed from the natal Moon):\n"
+        output += format_dasha(dasha) + "\n"
+    
+    if kp:
+        output += "\nKP LORDS (sign/star/sub/sub-sub):\n"
+        if chart:
+            natal = {'Asc': chart['ascendant'], **chart['planets']}
+            output += format_kp({name: body['kp'] for name, body in natal.items() if 'kp' in body}) + "\n"
+        output += "Transits:\n"
+        output += format_kp({name: body['kp'] for name, body in transits.items() if 'kp' in body}) + "\n"
+    
+    if local_systems:
+        output += "\nCALCULATED SYSTEMS (exact - use as given, don't recompute):\n"
+        for name, facts in local_systems.items():
+            output += f"{name}: {facts['summary']}\n"
     
     return output
 
 
 if __name__ == "__main__":
     print("Testing Astropy-based ephemeris...")
-    birth = datetime(1976, 7, 31, 8, 12)
-    birth_utc = pytz.utc.localize(birth)
+    birth_utc = birth_to_utc('1976-07-31', '08:12', 'Asia/Kolkata')
     
     chart = calculate_chart(birth_utc, 15.5057, 80.0499)
     transits = calculate_transits()
@@ -0,0 +1,145 @@
+"""
+Divisional Charts (Vargas)
+All standard Parashari vargas for every body in one NumPy pass
+"""
+
+from typing import Dict, Iterable, Optional
+
+import numpy as np
+
+SIGN_ABBR = ['Ar', 'Ta', 'Ge', 'Cn', 'Le', 'Vi', 'Li', 'Sc', 'Sg', 'Cp', 'Aq', 'Pi']
+
+# Vargas shown in the prompt by default: the ones the master prompt's
+# exact-data analysis actually leans on
+PROMPT_VARGAS = ('D9', 'D10', 'D7', 'D12', 'D4', 'D24')
+
+_ODD = np.arange(12) % 2 == 0          # Aries, Gemini, ... (0-based even index)
+_MOVABLE = np.arange(12) % 3 == 0      # Aries, Cancer, Libra, Capricorn
+_FIXED = np.arange(12) % 3 == 1        # Taurus, Leo, Scorpio, Aquarius
+_SIGN = np.arange(12)
+
+
+def _start(odd=None, even=None, movable=None, fixed=None, dual=None):
+    """
+    Sign each varga's first part falls in, per natal sign
+
+    Chosen by sign parity or modality; each choice is a sign index or an
+    array over the 12 natal signs. With no arguments, the natal sign.
+    """
+    if odd is not None:
+        return np.where(_ODD, odd, even) % 12
+    if movable is not None:
+        return np.where(_MOVABLE, movable, np.where(_FIXED, fixed, dual)) % 12
+    return _SIGN
+
+
+# name -> (parts per sign, start sign per natal sign, step per part per natal sign)
+_EQUAL_VARGAS = {
+    'D1': (1, _start(), 1),
+    'D2': (2, _start(odd=4, even=3), np.where(_ODD, -1, 1)),         # Hora: Leo/Cancer
+    'D3': (3, _start(), 4),                                         # Drekkana: 1st, 5th, 9th
+    'D4': (4, _start(), 3),                                         # Chaturthamsa: kendras
+    'D7': (7, _start(odd=_SIGN, even=_SIGN + 6), 1),                # Saptamsa
+    'D9': (9, _start(movable=_SIGN, fixed=_SIGN + 8, dual=_SIGN + 4), 1),  # Navamsa
+    'D10': (10, _start(odd=_SIGN, even=_SIGN + 8), 1),              # Dasamsa
+    'D12': (12, _start(), 1),                                       # Dwadasamsa
+    'D16': (16, _start(movable=0, fixed=4, dual=8), 1),             # Shodasamsa
+    'D20': (20, _start(movable=0, fixed=8, dual=4), 1),             # Vimsamsa
+    'D24': (24, _start(odd=4, even=3), 1),                          # Chaturvimsamsa
+    'D27': (27, (3 * _SIGN) % 12, 1),                               # Bhamsa: Ar/Cn/Li/Cp by element
+    'D40': (40, _start(odd=0, even=6), 1),                          # Khavedamsa
+    'D45': (45, _start(movable=0, fixed=4, dual=8), 1),             # Akshavedamsa
+    'D60': (60, _start(), 1),                                       # Shashtiamsa
+}
+
+# Trimsamsa (D30) has unequal parts: (upper bounds in degrees, signs)
+_D30_ODD = (np.array([5, 10, 18, 25, 30]), np.array([0, 10, 8, 2, 6]))   # Ar Aq Sg Ge Li
+_D30_EVEN = (np.array([5, 12, 20, 25, 30]), np.array([1, 5, 11, 9, 7]))  # Ta Vi Pi Cp Sc
+
+VARGA_ORDER = ['D1', 'D2', 'D3', 'D4', 'D7', 'D9', 'D10', 'D12', 'D16',
+               'D20', 'D24', 'D27', 'D30', 'D40', 'D45', 'D60']
+
+# Stacked tables, shape (vargas, 12), so every equal-part varga for
+# every body is a single broadcast expression
+_EQ_NAMES = list(_EQUAL_VARGAS)
+_PARTS = np.array([_EQUAL_VARGAS[v][0] for v in _EQ_NAMES])
+_STARTS = np.stack([np.broadcast_to(_EQUAL_VARGAS[v][1], 12) for v in _EQ_NAMES])
+_STEPS = np.stack([np.broadcast_to(_EQUAL_VARGAS[v][2], 12) for v in _EQ_NAMES])
+
+
+def varga_signs(longitudes) -> np.ndarray:
+    """
+    Varga sign indices (0 = Aries) for an array of sidereal longitudes
+
+    Args:
+        longitudes: array-like of degrees, any shape (...)
+
+    Returns:
+        int array of shape (len(VARGA_ORDER), ...) in VARGA_ORDER
+    """
+    lon = np.mod(np.asarray(longitudes, dtype=float), 360.0)
+    sign = (lon // 30).astype(int)
+    deg = lon - sign * 30
+
+    # Equal-part vargas: (vargas, ...) in one go
+    extra = (slice(None),) + (None,) * lon.ndim
+    part = np.minimum((deg[None] * _PARTS[extra] // 30).astype(int), _PARTS[extra] - 1)
+    equal = (_STARTS[:, sign] + _STEPS[:, sign] * part) % 12
+
+    # Trimsamsa by sign parity
+    odd = sign % 2 == 0
+    d30 = np.where(
+        odd,
+        _D30_ODD[1][np.minimum(np.searchsorted(_D30_ODD[0], deg, side='right'), 4)],
+        _D30_EVEN[1][np.minimum(np.searchsorted(_D30_EVEN[0], deg, side='right'), 4)]
+    )
+
+    rows = {name: equal[i] for i, name in enumerate(_EQ_NAMES)}
+    rows['D30'] = d30
+    return np.stack([rows[name] for name in VARGA_ORDER])
+
+
+def calculate_vargas(chart: Dict) -> Dict[str, Dict[str, int]]:
+    """
+    Every varga for the ascendant and each planet of a calculate_chart() result
+
+    Returns:
+        {'D9': {'Asc': 4, 'Sun': 0, ...}, ...} - 0-based sign indices,
+        compact enough to cache on the user record
+    """
+    bodies = ['Asc'] + list(chart['planets'])
+    longitudes = [chart['ascendant']['longitude']] + [p['longitude'] for p in chart['planets'].values()]
+    signs = varga_signs(longitudes)
+    return {
+        varga: dict(zip(bodies, (int(s) for s in signs[i])))
+        for i, varga in enumerate(VARGA_ORDER)
+    }
+
+
+def format_vargas(vargas: Dict[str, Dict[str, int]],
+                  which: Optional[Iterable[str]] = PROMPT_VARGAS) -> str:
+    """One line per varga: 'D9: Asc Le, Sun Ar, Moon Cp, ...'"""
+    lines = []
+    for varga in (which or VARGA_ORDER):
+        if varga in vargas:
+            placements = ', '.join(f"{body} {SIGN_ABBR[sign]}" for body, sign in vargas[varga].items())
+            lines.append(f"{varga}: {placements}")
+    return '\n'.join(lines)
+
+
+if __name__ == "__main__":
+    import time
+
+    print("=" * 60)
+    print("VARGA ENGINE TEST")
+    print("=" * 60)
+
+    # 0° Aries, 3°20' Aries, 15° Taurus, 29.99° Pisces
+    for lon in (0.0, 3.34, 45.0, 359.99):
+        signs = varga_signs([lon])[:, 0]
+        print(f"{lon:7.2f}°  " + ' '.join(f"{v}={SIGN_ABBR[s]}" for v, s in zip(VARGA_ORDER, signs)))
+
+    grid = np.random.uniform(0, 360, size=(1000, 9))
+    started = time.perf_counter()
+    varga_signs(grid)
+    print(f"\n9000 bodies x {len(VARGA_ORDER)} vargas: {(time.perf_counter() - started) * 1000:.2f} ms")